@@ -0,0 +1,30 @@
+"""Configuração do gunicorn (lida automaticamente quando iniciado a partir da raiz do projeto).
+
+Com ``preload_app`` a aplicação é importada uma vez no processo mestre, que
+verifica o schema, popula os dados padrão e aquece os caches antes de criar
+os workers; os workers herdam tudo por copy-on-write. ``GUNICORN_PRELOAD=0``
+volta ao modo em que cada worker importa a aplicação sozinho.
+
+Os workers usam threads (``gthread``): uma conexão SSE aberta em
+``/admin/events`` ocupa apenas uma thread, não o worker inteiro.
+"""
+import os
+import sys
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+
+def when_ready(server):
+    # Executado no mestre depois de carregar a aplicação e antes do primeiro fork
+    if server.cfg.preload_app:
+        sys.modules['src.main'].warm_up()
+
+
+def post_fork(server, worker):
+    # Conexões do pool não podem ser compartilhadas entre processos
+    main = sys.modules.get('src.main')
+    if main is not None:
+        with main.app.app_context():
+            main.db.engine.dispose(close=False)
@@ -4,6 +4,7 @@ import { Input } from '@/components/ui/input'
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card'
 import { Alert, AlertDescription } from '@/components/ui/alert'
 import { Send, Bot, User, MessageSquare } from 'lucide-react'
+import { postIdempotent } from '@/lib/idempotency'
 
 export default function ChatBot({ currentUser }) {
   const [messages, setMessages] = useState([])
@@ -29,7 +30,7 @@ export default function ChatBot({ currentUser }) {
     try {
       console.log('Carregando histórico para usuário:', currentUser.username, 'ID:', currentUser.id)
       
-      const response = await fetch(`/api/chat/history?per_page=10&user_id=${currentUser.id}`, {
+      const response = await fetch(`/api/chat/history?per_page=10&fields=full&user_id=${currentUser.id}`, {
         credentials: 'include'
       })
       
@@ -76,14 +77,12 @@ export default function ChatBot({ currentUser }) {
     setMessages(prev => [...prev, userMessage])
     setInputMessage('')
 
+    const question = inputMessage
     try {
-      const response = await fetch('/api/chat', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        credentials: 'include',
-        body: JSON.stringify({ question: inputMessage }),
+      // Mesma pergunta reenviada após erro de conexão usa a mesma chave (não é cobrada duas vezes)
+      const response = await postIdempotent('/api/chat', `chat:${question}`, {
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ question }),
       })
 
       const data = await response.json()
@@ -108,6 +107,7 @@ export default function ChatBot({ currentUser }) {
     } catch (err) {
       setError('Erro de conexão')
       setMessages(prev => prev.slice(0, -1)) // Remove a mensagem do usuário
+      setInputMessage(question) // Permite reenviar a mesma pergunta
     } finally {
       setLoading(false)
     }
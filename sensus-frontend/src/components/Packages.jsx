@@ -4,6 +4,7 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/com
 import { Alert, AlertDescription } from '@/components/ui/alert'
 import { Badge } from '@/components/ui/badge'
 import { Package, Check, CreditCard } from 'lucide-react'
+import { postIdempotent } from '@/lib/idempotency'
 
 export default function Packages({ currentUser }) {
   const [packages, setPackages] = useState([])
@@ -37,12 +38,9 @@ export default function Packages({ currentUser }) {
 
     try {
       // Criar transação
-      const response = await fetch('/api/transactions', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        credentials: 'include',
+      // Uma chave por compra: repetir depois de erro de conexão não cria outra transação
+      const response = await postIdempotent('/api/transactions', `buy:${packageId}`, {
+        headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ package_id: packageId }),
       })
 
@@ -50,10 +48,10 @@ export default function Packages({ currentUser }) {
 
       if (response.ok) {
         // Simular pagamento (completar transação automaticamente)
-        const completeResponse = await fetch(`/api/transactions/${data.transaction.id}/complete`, {
-          method: 'POST',
-          credentials: 'include',
-        })
+        const completeResponse = await postIdempotent(
+          `/api/transactions/${data.transaction.id}/complete`,
+          `complete:${data.transaction.id}`
+        )
 
         const completeData = await completeResponse.json()
 
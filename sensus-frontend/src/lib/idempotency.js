@@ -0,0 +1,55 @@
+// Chaves de idempotência por ação do usuário (cabeçalho Idempotency-Key).
+//
+// A chave é criada uma vez por ação (ex.: "chat:<pergunta>", "buy:<pacote>") e
+// reaproveitada em todas as tentativas dessa ação, inclusive quando o usuário
+// tenta de novo depois de um erro de conexão: se a primeira requisição chegou
+// ao servidor, a repetição recebe a mesma resposta em vez de executar outra vez.
+// A chave só é descartada quando o servidor dá uma resposta definitiva.
+
+const pendingKeys = new Map()
+
+const RETRY_DELAYS_MS = [500, 1500]
+const RETRYABLE_STATUSES = [502, 503, 504]
+// Respostas que o servidor não guarda: a mesma chave pode (e deve) ser reenviada
+const TEMPORARY_STATUSES = [409, 429]
+
+export function idempotencyKey(action) {
+  let key = pendingKeys.get(action)
+  if (!key) {
+    key = crypto.randomUUID()
+    pendingKeys.set(action, key)
+  }
+  return key
+}
+
+export function settleIdempotencyKey(action) {
+  pendingKeys.delete(action)
+}
+
+const wait = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+// POST com a chave da ação; repete erros de rede e 502/503/504 com a mesma chave
+export async function postIdempotent(url, action, { body, headers = {} } = {}) {
+  const key = idempotencyKey(action)
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await fetch(url, {
+        method: 'POST',
+        headers: { ...headers, 'Idempotency-Key': key },
+        credentials: 'include',
+        body,
+      })
+      const retryable = RETRYABLE_STATUSES.includes(response.status)
+      if (!retryable || attempt >= RETRY_DELAYS_MS.length) {
+        if (response.status < 500 && !TEMPORARY_STATUSES.includes(response.status)) {
+          settleIdempotencyKey(action)
+        }
+        return response
+      }
+    } catch (err) {
+      // Sem resposta: a chave continua reservada para a próxima tentativa do usuário
+      if (attempt >= RETRY_DELAYS_MS.length) throw err
+    }
+    await wait(RETRY_DELAYS_MS[attempt])
+  }
+}
@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from services.passwords import hash_password, verify_password, password_needs_rehash
 from datetime import datetime
 
 # Instância única do SQLAlchemy para toda a aplicação
@@ -14,12 +16,16 @@ class User(db.Model):
     message_balance = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # incrementada a cada UPDATE
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -35,6 +41,12 @@ class User(db.Model):
             'is_active': self.is_active
         }
 
+@event.listens_for(User, 'before_update')
+def _bump_user_version(mapper, connection, target):
+    # Expressão SQL: o incremento acontece no próprio UPDATE, sem ler o valor atual
+    if db.session.is_modified(target, include_collections=False):
+        target.version = User.version + 1
+
 class MessagePackage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -61,7 +73,7 @@ class Transaction(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     package_id = db.Column(db.Integer, db.ForeignKey('message_package.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'completed', 'failed'
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'completed', 'failed', 'expired'
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     user = db.relationship('User', backref=db.backref('transactions', lazy=True))
@@ -104,3 +116,108 @@ class ChatMessage(db.Model):
             'user': self.user.username if self.user else None
         }
 
+class OutboundEmail(db.Model):
+    """Fila persistente de emails de saída (enviados em segundo plano por services.mailer)"""
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'sending', 'sent' ou 'dead'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_outbound_email_status_next_attempt', 'status', 'next_attempt_at'),)
+
+    def __repr__(self):
+        return f'<OutboundEmail {self.id} {self.status}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'to_email': self.to_email,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+class ChangeEvent(db.Model):
+    """Log de alterações lido pelo feed ao vivo dos admins (services.live_feed), compartilhado entre os workers"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)  # 'message', 'transaction', 'balance' ou 'bulk_update'
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    # Ids nunca reutilizados, mesmo depois da limpeza: os cursores dos assinantes dependem disso
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    def __repr__(self):
+        return f'<ChangeEvent {self.id} {self.kind}>'
+
+class ChatShardAssignment(db.Model):
+    """Shard do histórico de chat de cada usuário (services.chat_shards)"""
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ChatShardAssignment {self.user_id} -> {self.shard}>'
+
+# Colunas adicionadas depois da criação inicial do banco: (tabela, coluna, DDL)
+ADDED_COLUMNS = [
+    ('user', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+]
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    # WAL: leituras não esperam pelas escritas e services.maintenance faz o checkpoint
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+def _enable_incremental_vacuum(engine):
+    """Converter o banco para auto_vacuum=INCREMENTAL (VACUUM completo, só na primeira vez)"""
+    with engine.connect() as conn:
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:
+            return
+        try:
+            conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.exec_driver_sql('VACUUM')
+        except OperationalError as e:
+            # Outro worker convertendo ao mesmo tempo: ele termina a conversão
+            if 'locked' not in str(e):
+                raise
+
+def upgrade_schema():
+    """Criar tabelas ausentes e adicionar colunas novas em bancos já existentes.
+
+    No SQLite também liga o WAL em todas as conexões e converte o banco para
+    ``auto_vacuum=INCREMENTAL``, usados pelas tarefas de services.maintenance.
+    """
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        if not event.contains(engine, 'connect', _configure_sqlite_connection):
+            event.listen(engine, 'connect', _configure_sqlite_connection)
+        _enable_incremental_vacuum(engine)
+    db.create_all()
+    for table, column, ddl in ADDED_COLUMNS:
+        existing = {row[1] for row in db.session.execute(text(f'PRAGMA table_info("{table}")'))}
+        if column in existing:
+            continue
+        try:
+            db.session.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+            db.session.commit()
+        except OperationalError as e:
+            # Outro worker pode ter adicionado a coluna ao mesmo tempo
+            db.session.rollback()
+            if 'duplicate column' not in str(e):
+                raise
+    db.session.commit()
@@ -1,13 +1,29 @@
+import gc
 import os
 import sys
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
 
 # Adicionar o diretório atual ao Python path
 sys.path.insert(0, os.path.dirname(__file__))
 
+# Medição das etapas da inicialização (STARTUP_PROFILE=1)
+from services.startup import StartupTimer, LazyCommand, startup_profile_command
+startup_timer = StartupTimer(os.environ.get('STARTUP_PROFILE') == '1')
+
 # Importar a instância centralizada do banco e modelos
-from database import db, User, MessagePackage, Transaction, ChatMessage
+from database import db, User, MessagePackage, Transaction, ChatMessage, upgrade_schema
+from services.archive import archive_chat_command, archived_count
+from services.user_import import import_users_command
+from services.passwords import configure_password_hashing, calibrate_password_hashing
+from services.kv_store import init_kv_store
+from services.static_assets import build_manifest, serve_asset
+from services.compression import init_compression
+from services.mailer import init_mailer, send_mail_command, mail_sink_command
+from services.scheduler import init_scheduler
+from services.maintenance import run_maintenance_command
+from services.chat_shards import chat_shards_command, rebalance_chat_command
+from services.traffic_capture import init_traffic_capture
 
 # Tentar imports relativos primeiro, depois absolutos
 try:
@@ -28,20 +44,158 @@ except ImportError:
     from src.routes.auth import auth_bp
     from src.routes.health import health_bp
     from src.routes.setup import setup_bp
+startup_timer.mark('imports')
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'sensus-chatbot-system-2025-secret-key'
 
 # Configuração do banco de dados ANTES de registrar blueprints
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Arquivamento do histórico de chat (mensagens antigas saem da tabela quente)
+app.config['CHAT_ARCHIVE_DIR'] = os.environ.get(
+    'CHAT_ARCHIVE_DIR', os.path.join(os.path.dirname(__file__), 'database', 'archive')
+)
+app.config['CHAT_ARCHIVE_AFTER_DAYS'] = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', 90))
+
+# Hash de senhas: 'scrypt' ou 'pbkdf2'; sem custo explícito, calibrar para a latência alvo (no warm_up
+# ou no primeiro hash). MAX_MEMORY_MB limita a memória dos hashes scrypt simultâneos de cada processo.
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+app.config['PASSWORD_HASH_COST'] = int(os.environ.get('PASSWORD_HASH_COST', 0))
+app.config['PASSWORD_HASH_TARGET_MS'] = int(os.environ.get('PASSWORD_HASH_TARGET_MS', 250))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_MAX_MEMORY_MB'] = int(os.environ.get('PASSWORD_HASH_MAX_MEMORY_MB', 128))
+configure_password_hashing(app)
+
+# Cache de usuários entre requisições (por worker)
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 5))
+
+# Armazenamento chave-valor com expiração compartilhado entre workers ('sqlite' ou 'memory')
+app.config['KV_STORE_BACKEND'] = os.environ.get('KV_STORE_BACKEND', 'sqlite')
+app.config['KV_STORE_PATH'] = os.environ.get(
+    'KV_STORE_PATH', os.path.join(os.path.dirname(__file__), 'database', 'kv.db')
+)
+app.config['KV_STORE_SWEEP_INTERVAL'] = int(os.environ.get('KV_STORE_SWEEP_INTERVAL', 60))
+init_kv_store(app)
+
+# Limite de requisições (token bucket no armazenamento compartilhado)
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+app.config['RATE_LIMIT_PROXY_COUNT'] = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0))
+
+# Listas de histórico do admin devolvem prévias deste tamanho (?fields=full traz os textos completos);
+# /chat/history devolve os textos completos e só usa prévias com ?fields=summary
+app.config['HISTORY_PREVIEW_LENGTH'] = int(os.environ.get('HISTORY_PREVIEW_LENGTH', 200))
+
+# Cache de respostas GET (por worker, invalidado via armazenamento compartilhado)
+app.config['RESPONSE_CACHE_ENABLED'] = os.environ.get('RESPONSE_CACHE_ENABLED', '1') == '1'
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 512))
+
+# Compressão das respostas JSON: nível gzip 1-9, brotli 0-11, tamanho mínimo em bytes
+app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', '1') == '1'
+app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+app.config['COMPRESS_BR_LEVEL'] = int(os.environ.get('COMPRESS_BR_LEVEL', 5))
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+# Envio de emails: fila persistente processada em segundo plano (sem MAIL_SERVER, apenas imprime no console)
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', '')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '1') == '1'
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', '')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', '')
+app.config['MAIL_SENDER'] = os.environ.get('MAIL_SENDER', 'noreply@sensustec.com.br')
+app.config['MAIL_TIMEOUT'] = float(os.environ.get('MAIL_TIMEOUT', 10))
+app.config['MAIL_SMTP_IDLE_TIMEOUT'] = float(os.environ.get('MAIL_SMTP_IDLE_TIMEOUT', 60))
+app.config['MAIL_BATCH_SIZE'] = int(os.environ.get('MAIL_BATCH_SIZE', 50))
+app.config['MAIL_MAX_ATTEMPTS'] = int(os.environ.get('MAIL_MAX_ATTEMPTS', 6))
+app.config['MAIL_RETRY_BACKOFF'] = int(os.environ.get('MAIL_RETRY_BACKOFF', 30))
+app.config['MAIL_POLL_INTERVAL'] = float(os.environ.get('MAIL_POLL_INTERVAL', 5))
+app.config['MAIL_SENDER_ENABLED'] = os.environ.get('MAIL_SENDER_ENABLED', '1') == '1'
+init_mailer(app)
+
+# Provedor de LLM: circuit breaker (falhas seguidas até abrir, segundos aberto) e timeout das chamadas
+app.config['LLM_BREAKER_THRESHOLD'] = int(os.environ.get('LLM_BREAKER_THRESHOLD', 5))
+app.config['LLM_BREAKER_COOLDOWN'] = float(os.environ.get('LLM_BREAKER_COOLDOWN', 30))
+app.config['LLM_TIMEOUT'] = float(os.environ.get('LLM_TIMEOUT', 30))
+
+# Readiness probe: cache do resultado, banco considerado lento e se o circuito do LLM aberto tira o worker
+# do ar (desligado: o LLM fora do ar aparece apenas como 'degraded')
+app.config['HEALTH_CACHE_TTL'] = float(os.environ.get('HEALTH_CACHE_TTL', 2))
+app.config['HEALTH_DB_SLOW_MS'] = float(os.environ.get('HEALTH_DB_SLOW_MS', 250))
+app.config['HEALTH_REQUIRE_LLM'] = os.environ.get('HEALTH_REQUIRE_LLM', '0') == '1'
+
+# Diagnóstico (desligado por padrão): consultas acima de SLOW_QUERY_MS no log (0 desliga) e perfil de
+# CPU sob demanda (cabeçalho X-Profile: 1 de um admin ou sorteio por PROFILE_SAMPLE_RATE)
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 0))
+app.config['PROFILE_ENABLED'] = os.environ.get('PROFILE_ENABLED', '0') == '1'
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', 2))
+app.config['PROFILE_DIR'] = os.environ.get(
+    'PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'database', 'profiles')
+)
+app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 50))
+# O módulo de diagnóstico só é carregado quando algum hook está ligado
+if app.config['SLOW_QUERY_MS'] > 0 or app.config['PROFILE_ENABLED']:
+    from services.profiling import init_profiling
+    init_profiling(app)
+
+# Relatórios de análise gerados por jobs (perguntas frequentes)
+app.config['ANALYTICS_DIR'] = os.environ.get(
+    'ANALYTICS_DIR', os.path.join(os.path.dirname(__file__), 'database', 'analytics')
+)
+
+# Agendador de manutenção: um líder entre os workers (prazo em segundos) executa as tarefas periódicas
+app.config['SCHEDULER_ENABLED'] = os.environ.get('SCHEDULER_ENABLED', '1') == '1'
+app.config['SCHEDULER_TICK'] = float(os.environ.get('SCHEDULER_TICK', 5))
+app.config['SCHEDULER_LEASE'] = float(os.environ.get('SCHEDULER_LEASE', 30))
+app.config['TRANSACTION_PENDING_TTL_HOURS'] = float(os.environ.get('TRANSACTION_PENDING_TTL_HOURS', 24))
+app.config['MAIL_RETENTION_DAYS'] = int(os.environ.get('MAIL_RETENTION_DAYS', 7))
+init_scheduler(app)
+
+# Idempotency-Key: respostas guardadas (s), espera máxima por uma requisição igual em andamento (s)
+# e prazo da reserva caso o worker morra no meio (s)
+app.config['IDEMPOTENCY_TTL'] = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+app.config['IDEMPOTENCY_WAIT'] = float(os.environ.get('IDEMPOTENCY_WAIT', 60))
+app.config['IDEMPOTENCY_IN_FLIGHT_TTL'] = int(os.environ.get('IDEMPOTENCY_IN_FLIGHT_TTL', 120))
+
+# Feed ao vivo para admins (SSE): intervalo de leitura do log compartilhado (s), keep-alive (s),
+# duração máxima de uma conexão (s), espera sugerida para reconexão (ms) e retenção do log (h)
+app.config['LIVE_FEED_POLL_INTERVAL'] = float(os.environ.get('LIVE_FEED_POLL_INTERVAL', 1))
+app.config['LIVE_FEED_HEARTBEAT'] = float(os.environ.get('LIVE_FEED_HEARTBEAT', 15))
+app.config['LIVE_FEED_MAX_DURATION'] = float(os.environ.get('LIVE_FEED_MAX_DURATION', 300))
+app.config['LIVE_FEED_RETRY_MS'] = int(os.environ.get('LIVE_FEED_RETRY_MS', 3000))
+app.config['LIVE_FEED_RETENTION_HOURS'] = float(os.environ.get('LIVE_FEED_RETENTION_HOURS', 24))
+
+# Sharding do histórico de chat por usuário: quantidade de arquivos SQLite (0 = desligado),
+# diretório dos shards e espera máxima de uma mensagem durante a migração do usuário (s)
+app.config['CHAT_SHARDS'] = int(os.environ.get('CHAT_SHARDS', 0))
+app.config['CHAT_SHARD_DIR'] = os.environ.get(
+    'CHAT_SHARD_DIR', os.path.join(os.path.dirname(__file__), 'database', 'shards')
+)
+app.config['CHAT_SHARD_MOVE_WAIT'] = float(os.environ.get('CHAT_SHARD_MOVE_WAIT', 30))
+
+# Captura de tráfego para replay: fração das requisições gravada (0 desliga), arquivo JSONL,
+# maior corpo de requisição gravado (bytes) e tamanho máximo do arquivo (MB)
+app.config['TRAFFIC_CAPTURE_RATE'] = float(os.environ.get('TRAFFIC_CAPTURE_RATE', 0))
+app.config['TRAFFIC_CAPTURE_PATH'] = os.environ.get(
+    'TRAFFIC_CAPTURE_PATH', os.path.join(os.path.dirname(__file__), 'database', 'traffic', 'requests.jsonl')
+)
+app.config['TRAFFIC_CAPTURE_MAX_BODY'] = int(os.environ.get('TRAFFIC_CAPTURE_MAX_BODY', 65536))
+app.config['TRAFFIC_CAPTURE_MAX_MB'] = float(os.environ.get('TRAFFIC_CAPTURE_MAX_MB', 100))
+init_traffic_capture(app)
+
 # Inicializar SQLAlchemy com a aplicação
 db.init_app(app)
 
 # Habilitar CORS para permitir requisições do frontend
 CORS(app, supports_credentials=True)
 
+# Compactar respostas JSON grandes conforme Accept-Encoding
+init_compression(app)
+
 # Registrar blueprints
 app.register_blueprint(user_bp)
 app.register_blueprint(packages_bp)
@@ -51,11 +205,43 @@ app.register_blueprint(admin_bp)
 app.register_blueprint(auth_bp)
 app.register_blueprint(health_bp)
 app.register_blueprint(setup_bp)
+startup_timer.mark('configuração e blueprints')
+
+# Garantir tabelas e colunas novas também quando iniciado pelo gunicorn
+with app.app_context():
+    upgrade_schema()
+startup_timer.mark('verificação do schema')
+
+# Manifesto do frontend montado uma vez (arquivos, variantes compactadas e cabeçalhos de cache)
+static_manifest = build_manifest(app.static_folder)
+startup_timer.mark('manifesto estático')
+
+# Comandos de manutenção (flask --app src.main <comando>)
+app.cli.add_command(archive_chat_command)
+app.cli.add_command(import_users_command)
+app.cli.add_command(startup_profile_command)
+app.cli.add_command(send_mail_command)
+app.cli.add_command(mail_sink_command)
+app.cli.add_command(run_maintenance_command)
+app.cli.add_command(chat_shards_command)
+app.cli.add_command(rebalance_chat_command)
+
+# Comandos usados só pela CLI: o módulo é importado quando o comando roda
+for name, target in (
+    ('generate-data', 'services.synthetic_data:generate_data_command'),
+    ('benchmark-endpoints', 'services.benchmark:benchmark_endpoints_command'),
+    ('benchmark-scaling', 'services.benchmark:benchmark_scaling_command'),
+    ('mine-questions', 'services.question_mining:mine_questions_command'),
+    ('replay-traffic', 'services.traffic_replay:replay_traffic_command'),
+    ('soak-test', 'services.soak:soak_test_command'),
+    ('query-budget', 'services.query_budget:query_budget_command'),
+):
+    app.cli.add_command(LazyCommand(name, target))
 
 def init_database():
     """Inicializar banco de dados com dados padrão"""
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
         
         # Criar usuário admin padrão se não existir
         admin = User.query.filter_by(username='admin').first()
@@ -84,6 +270,24 @@ def init_database():
         db.session.commit()
         print("Database initialized successfully!")
 
+def warm_up():
+    """Preparar a aplicação uma única vez no processo mestre do gunicorn (--preload), antes do fork"""
+    init_database()
+    # Custo do hash de senhas calibrado uma vez aqui, não em cada worker
+    calibrate_password_hashing()
+    with app.app_context():
+        # Índices do arquivo de chat lidos aqui ficam compartilhados com os workers
+        archived_count()
+        # Nenhuma conexão SQLite aberta no mestre pode ser herdada pelos workers
+        db.engine.dispose()
+
+    # SDK carregado sob demanda nos workers; no mestre, uma única cópia compartilhada
+    import openai  # noqa: F401
+
+    # Objetos criados até aqui saem das coleções do GC, preservando as páginas copy-on-write
+    gc.collect()
+    gc.freeze()
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
@@ -91,18 +295,18 @@ def serve(path):
     if path.startswith('api/'):
         return "API endpoint not found", 404
     
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
+    if app.static_folder is None:
         return "Static folder not configured", 404
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "Frontend not found. Please build and place the React app in the static folder.", 404
+    # Arquivo existente ou, para rotas do SPA, o index.html (ambos já em memória)
+    asset = static_manifest.get(path) if path != "" else None
+    if asset is None:
+        asset = static_manifest.get('index.html')
+    if asset is None:
+        return "Frontend not found. Please build and place the React app in the static folder.", 404
+    return serve_asset(asset)
+
+startup_timer.report()
 
 if __name__ == '__main__':
     init_database()
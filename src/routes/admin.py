@@ -1,8 +1,19 @@
-from flask import Blueprint, request, jsonify, session
-from database import db, User, ChatMessage, Transaction, MessagePackage
+from flask import Blueprint, request, jsonify, session, send_file, Response
+from database import db, User, Transaction, MessagePackage
 from src.routes.user import admin_required
-from sqlalchemy import func, desc
+from services.archive import paginate_history, archived_count, archived_counts_by_user, archived_monthly_counts
+from services.identity import invalidate_users
+from services.response_cache import invalidate_user_responses
+from services.scheduler import scheduler_status
+from services.live_feed import publish, publish_balance, event_stream
+from services.projections import transaction_query, transaction_to_dict
+from services.chat_shards import (
+    count_messages, page_messages, message_counts_by_user, last_activity_by_user,
+    active_user_count, daily_message_counts, monthly_message_counts
+)
+from sqlalchemy import func, update, insert, not_
 from datetime import datetime, timedelta
+import heapq
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -13,42 +24,50 @@ def get_dashboard_stats():
     try:
         # Contadores básicos
         total_users = User.query.filter_by(user_type='client').count()
-        total_messages = ChatMessage.query.count()
+        total_messages = count_messages() + archived_count()
         total_revenue = db.session.query(func.sum(Transaction.amount)).filter_by(status='completed').scalar() or 0
         
         # Usuários ativos (que enviaram mensagens nos últimos 30 dias)
         thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        active_users = db.session.query(ChatMessage.user_id).filter(
-            ChatMessage.created_at >= thirty_days_ago
-        ).distinct().count()
+        active_users = active_user_count(thirty_days_ago)
         
         # Mensagens por dia nos últimos 7 dias
         seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        daily_messages = db.session.query(
-            func.date(ChatMessage.created_at).label('date'),
-            func.count(ChatMessage.id).label('count')
-        ).filter(
-            ChatMessage.created_at >= seven_days_ago
-        ).group_by(func.date(ChatMessage.created_at)).all()
-        
-        # Top 5 usuários por mensagens
-        top_users = db.session.query(
-            User.username,
-            User.email,
-            func.count(ChatMessage.id).label('message_count')
-        ).join(ChatMessage).group_by(User.id).order_by(desc('message_count')).limit(5).all()
+        daily_messages = sorted(daily_message_counts(seven_days_ago).items())
+        
+        # Top 5 usuários por mensagens (contagens somadas entre os shards e o arquivo)
+        message_counts = _message_counts_by_user()
+        top_ids = heapq.nlargest(5, message_counts, key=message_counts.get)
+        top_users = {row.id: row for row in db.session.query(User.id, User.username, User.email).filter(User.id.in_(top_ids))}
         
         return jsonify({
             'total_users': total_users,
             'total_messages': total_messages,
             'total_revenue': float(total_revenue),
             'active_users': active_users,
-            'daily_messages': [{'date': str(dm.date), 'count': dm.count} for dm in daily_messages],
-            'top_users': [{'username': tu.username, 'email': tu.email, 'message_count': tu.message_count} for tu in top_users]
+            'daily_messages': [{'date': str(date), 'count': count} for date, count in daily_messages],
+            'top_users': [
+                {'username': top_users[uid].username, 'email': top_users[uid].email, 'message_count': message_counts[uid]}
+                for uid in top_ids if uid in top_users
+            ]
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _message_counts_by_user(user_ids=None):
+    """Mensagens por usuário somando os shards e o arquivo (mesma contagem em todas as telas do admin)"""
+    counts = message_counts_by_user(user_ids)
+    for user_id, count in archived_counts_by_user(user_ids).items():
+        counts[user_id] = counts.get(user_id, 0) + count
+    return counts
+
+def _total_spent_by_user(user_ids=None):
+    """Total das transações concluídas por usuário, em uma consulta"""
+    query = db.session.query(Transaction.user_id, func.sum(Transaction.amount)).filter(Transaction.status == 'completed')
+    if user_ids is not None:
+        query = query.filter(Transaction.user_id.in_(user_ids))
+    return dict(query.group_by(Transaction.user_id).all())
+
 @admin_bp.route('/admin/users', methods=['GET'])
 @admin_required
 def get_all_users():
@@ -70,16 +89,16 @@ def get_all_users():
             page=page, per_page=per_page, error_out=False
         )
         
-        # Adicionar estatísticas para cada usuário
+        # Adicionar estatísticas para cada usuário (mensagens agregadas de uma vez para a página)
+        page_ids = [user.id for user in users.items]
+        message_counts = _message_counts_by_user(page_ids)
+        last_activities = last_activity_by_user(page_ids)
+        totals_spent = _total_spent_by_user(page_ids)
         users_data = []
         for user in users.items:
-            message_count = ChatMessage.query.filter_by(user_id=user.id).count()
-            total_spent = db.session.query(func.sum(Transaction.amount)).filter_by(
-                user_id=user.id, status='completed'
-            ).scalar() or 0
-            last_activity = db.session.query(func.max(ChatMessage.created_at)).filter_by(
-                user_id=user.id
-            ).scalar()
+            message_count = message_counts.get(user.id, 0)
+            total_spent = totals_spent.get(user.id) or 0
+            last_activity = last_activities.get(user.id)
             
             user_data = user.to_dict()
             user_data.update({
@@ -109,45 +128,43 @@ def get_user_history(user_id):
         # Histórico de mensagens
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        full = request.args.get('fields') == 'full'
         
-        messages = ChatMessage.query.filter_by(user_id=user_id).order_by(
-            ChatMessage.created_at.desc()
-        ).paginate(page=page, per_page=per_page, error_out=False)
+        message_items, message_total, message_pages = paginate_history(page, per_page, user_id=user_id, full=full)
         
         # Histórico de transações
-        transactions = Transaction.query.filter_by(user_id=user_id).order_by(
+        transactions = transaction_query().filter(Transaction.user_id == user_id).order_by(
             Transaction.created_at.desc()
         ).all()
         
         # Estatísticas do usuário
-        total_messages = ChatMessage.query.filter_by(user_id=user_id).count()
+        total_messages = count_messages(user_id) + archived_count(user_id)
         total_spent = db.session.query(func.sum(Transaction.amount)).filter_by(
             user_id=user_id, status='completed'
         ).scalar() or 0
         
         # Atividade por mês nos últimos 6 meses
         six_months_ago = datetime.utcnow() - timedelta(days=180)
-        monthly_activity = db.session.query(
-            func.strftime('%Y-%m', ChatMessage.created_at).label('month'),
-            func.count(ChatMessage.id).label('count')
-        ).filter(
-            ChatMessage.user_id == user_id,
-            ChatMessage.created_at >= six_months_ago
-        ).group_by('month').all()
+        monthly_activity = monthly_message_counts(user_id, since=six_months_ago)
+        
+        # Somar a atividade dos meses que já foram arquivados
+        monthly_counts = archived_monthly_counts(user_id, since=six_months_ago)
+        for month, count in monthly_activity.items():
+            monthly_counts[month] = monthly_counts.get(month, 0) + count
         
         return jsonify({
             'user': user.to_dict(),
             'messages': {
-                'items': [msg.to_dict() for msg in messages.items],
-                'total': messages.total,
-                'pages': messages.pages,
+                'items': message_items,
+                'total': message_total,
+                'pages': message_pages,
                 'current_page': page
             },
-            'transactions': [t.to_dict() for t in transactions],
+            'transactions': [transaction_to_dict(t) for t in transactions],
             'stats': {
                 'total_messages': total_messages,
                 'total_spent': float(total_spent),
-                'monthly_activity': [{'month': ma.month, 'count': ma.count} for ma in monthly_activity]
+                'monthly_activity': [{'month': month, 'count': count} for month, count in sorted(monthly_counts.items())]
             }
         })
     except Exception as e:
@@ -166,6 +183,7 @@ def add_user_balance(user_id):
             return jsonify({'error': 'Quantidade de mensagens deve ser maior que zero'}), 400
         
         user.message_balance += messages_to_add
+        publish_balance(user, messages_to_add, 'admin')
         db.session.commit()
         
         return jsonify({
@@ -199,11 +217,9 @@ def get_recent_messages():
     try:
         limit = request.args.get('limit', 50, type=int)
         
-        messages = db.session.query(ChatMessage).join(User).order_by(
-            ChatMessage.created_at.desc()
-        ).limit(limit).all()
+        messages = page_messages(0, limit, known_users_only=True)
         
-        return jsonify([msg.to_dict() for msg in messages])
+        return jsonify(messages)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -214,12 +230,12 @@ def export_users():
     try:
         users = User.query.filter_by(user_type='client').all()
         users_data = []
+        message_counts = _message_counts_by_user()
+        totals_spent = _total_spent_by_user()
         
         for user in users:
-            message_count = ChatMessage.query.filter_by(user_id=user.id).count()
-            total_spent = db.session.query(func.sum(Transaction.amount)).filter_by(
-                user_id=user.id, status='completed'
-            ).scalar() or 0
+            message_count = message_counts.get(user.id, 0)
+            total_spent = totals_spent.get(user.id) or 0
             
             user_data = user.to_dict()
             user_data.update({
@@ -236,3 +252,195 @@ def export_users():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+BULK_CHUNK_SIZE = 500
+
+def _chunks(ids, size=BULK_CHUNK_SIZE):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+@admin_bp.route('/admin/users/bulk', methods=['POST'])
+@admin_required
+def bulk_update_users():
+    """Aplicar saldo, status ou pacote a vários usuários em uma única transação.
+
+    Corpo: {"user_ids": [...]} ou {"filter": {"search", "user_type", "is_active"}}
+    e ao menos uma operação: "add_balance", "status" ('activate', 'deactivate',
+    'toggle') ou "package_id".
+    """
+    try:
+        data = request.json or {}
+        user_ids = data.get('user_ids')
+        filters = data.get('filter')
+        add_balance = data.get('add_balance')
+        status = data.get('status')
+        package_id = data.get('package_id')
+        
+        if user_ids is None and filters is None:
+            return jsonify({'error': 'Informe user_ids ou filter'}), 400
+        if add_balance is None and status is None and package_id is None:
+            return jsonify({'error': 'Informe ao menos uma operação: add_balance, status ou package_id'}), 400
+        if filters is not None:
+            if not isinstance(filters, dict):
+                return jsonify({'error': 'filter deve ser um objeto'}), 400
+            if 'is_active' in filters and not isinstance(filters['is_active'], bool):
+                return jsonify({'error': 'filter.is_active deve ser true ou false'}), 400
+            if filters.get('search') is not None and not isinstance(filters['search'], str):
+                return jsonify({'error': 'filter.search deve ser um texto'}), 400
+            if 'user_type' in filters and not isinstance(filters['user_type'], str):
+                return jsonify({'error': 'filter.user_type deve ser um texto'}), 400
+        if user_ids is not None:
+            try:
+                if not isinstance(user_ids, list) or any(isinstance(uid, bool) for uid in user_ids):
+                    raise ValueError
+                user_ids = [int(uid) for uid in user_ids]
+            except (TypeError, ValueError):
+                return jsonify({'error': 'user_ids deve ser uma lista de ids'}), 400
+        if add_balance is not None and (
+            isinstance(add_balance, bool) or not isinstance(add_balance, int) or add_balance <= 0
+        ):
+            return jsonify({'error': 'Quantidade de mensagens deve ser maior que zero'}), 400
+        if status is not None and status not in ('activate', 'deactivate', 'toggle'):
+            return jsonify({'error': "Status deve ser 'activate', 'deactivate' ou 'toggle'"}), 400
+        
+        package = None
+        if package_id is not None:
+            package = MessagePackage.query.filter_by(id=package_id, is_active=True).first()
+            if not package:
+                return jsonify({'error': 'Pacote não encontrado ou inativo'}), 404
+        
+        # Resolver os usuários alvo com uma única consulta
+        query = db.session.query(User.id)
+        if user_ids is not None:
+            requested_ids = list(dict.fromkeys(user_ids))
+            found = set()
+            for chunk in _chunks(requested_ids):
+                found.update(uid for (uid,) in query.filter(User.id.in_(chunk)))
+            target_ids = [uid for uid in requested_ids if uid in found]
+            not_found = [uid for uid in requested_ids if uid not in found]
+        else:
+            query = query.filter(User.user_type == filters.get('user_type', 'client'))
+            if filters.get('search'):
+                query = query.filter(
+                    (User.username.contains(filters['search'])) |
+                    (User.email.contains(filters['search']))
+                )
+            if 'is_active' in filters:
+                query = query.filter(User.is_active == filters['is_active'])
+            target_ids = [uid for (uid,) in query.order_by(User.id)]
+            not_found = []
+        
+        # Atualizações em conjunto: um UPDATE por lote de ids, não um por usuário
+        balance_delta = (add_balance or 0) + (package.message_count if package else 0)
+        values = {User.version: User.version + 1}
+        if balance_delta:
+            values[User.message_balance] = User.message_balance + balance_delta
+        if status == 'activate':
+            values[User.is_active] = True
+        elif status == 'deactivate':
+            values[User.is_active] = False
+        elif status == 'toggle':
+            values[User.is_active] = not_(User.is_active)
+        
+        for chunk in _chunks(target_ids if len(values) > 1 else []):
+            db.session.execute(
+                update(User).where(User.id.in_(chunk)).values(values),
+                execution_options={'synchronize_session': False}
+            )
+        
+        # Atribuição de pacote registra uma transação concluída por usuário (executemany)
+        if package and target_ids:
+            now = datetime.utcnow()
+            db.session.execute(insert(Transaction), [
+                {
+                    'user_id': uid,
+                    'package_id': package.id,
+                    'amount': package.price,
+                    'status': 'completed',
+                    'created_at': now
+                }
+                for uid in target_ids
+            ])
+        
+        # Um único evento no feed ao vivo para o lote inteiro
+        if target_ids:
+            publish('bulk_update', {
+                'users': len(target_ids),
+                'messages_added': balance_delta,
+                'status': status,
+                'package_id': package.id if package else None
+            })
+        db.session.commit()
+        invalidate_users(target_ids)
+        invalidate_user_responses(target_ids)
+        
+        # Resumo por usuário com o estado final
+        results = []
+        for chunk in _chunks(target_ids):
+            rows = db.session.query(
+                User.id, User.username, User.message_balance, User.is_active
+            ).filter(User.id.in_(chunk)).order_by(User.id)
+            results.extend({
+                'id': row.id,
+                'username': row.username,
+                'message_balance': row.message_balance,
+                'is_active': row.is_active,
+                'messages_added': balance_delta,
+                'package': package.name if package else None
+            } for row in rows)
+        
+        return jsonify({
+            'message': f'Operação em lote aplicada a {len(target_ids)} usuários',
+            'updated': len(target_ids),
+            'not_found': not_found,
+            'results': results
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/admin/profiles', methods=['GET'])
+@admin_required
+def get_profiles():
+    """Perfis de CPU capturados (X-Profile: 1 ou amostragem), mais recentes primeiro"""
+    from services.profiling import list_profiles
+    return jsonify({'profiles': list_profiles()})
+
+@admin_bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def download_profile(profile_id):
+    """Baixar um perfil em pilhas colapsadas (flamegraph.pl, speedscope)"""
+    from services.profiling import profile_path
+    path = profile_path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Perfil não encontrado'}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=f'{profile_id}.folded')
+
+@admin_bp.route('/admin/analytics/frequent-questions', methods=['GET'])
+@admin_required
+def get_frequent_questions():
+    """Último relatório de perguntas frequentes (gerado por flask mine-questions)"""
+    from services.question_mining import load_report
+    report = load_report()
+    if report is None:
+        return jsonify({'error': 'Relatório ainda não gerado (execute flask --app src.main mine-questions)'}), 404
+    limit = request.args.get('limit', type=int)
+    if limit:
+        report = dict(report, clusters=report['clusters'][:limit])
+    return jsonify(report)
+
+@admin_bp.route('/admin/maintenance', methods=['GET'])
+@admin_required
+def get_maintenance_status():
+    """Líder do agendador e métricas das tarefas de manutenção"""
+    return jsonify(scheduler_status())
+
+@admin_bp.route('/admin/events', methods=['GET'])
+@admin_required
+def stream_events():
+    """Feed ao vivo (Server-Sent Events) de mensagens, transações e alterações de saldo"""
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    response = Response(event_stream(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # sem buffer em proxies nginx
+    return response
@@ -1,19 +1,22 @@
 from flask import Blueprint, request, jsonify, session
 from database import db, User
 from src.routes.user import login_required
+from services.identity import get_current_user
+from services.kv_store import get_store
+from services.rate_limit import rate_limit
+from services.mailer import enqueue_email
 import secrets
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 import os
 
 auth_bp = Blueprint('auth', __name__)
 
-# Armazenar tokens de recuperação temporariamente (em produção, usar Redis ou banco)
-password_reset_tokens = {}
+# Tokens de recuperação ficam no armazenamento compartilhado entre os workers
+RESET_TOKEN_PREFIX = 'password-reset:'
+RESET_TOKEN_TTL = 3600  # 1 hora
 
 @auth_bp.route('/auth/google', methods=['POST'])
+@rate_limit(10, per=60, burst=5, by='ip')
 def google_auth():
     """Autenticação com Google OAuth"""
     try:
@@ -73,6 +76,7 @@ def google_auth():
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/auth/forgot-password', methods=['POST'])
+@rate_limit(5, per=3600, burst=3, by='ip')
 def forgot_password():
     """Solicitar recuperação de senha"""
     try:
@@ -90,18 +94,17 @@ def forgot_password():
         
         # Gerar token de recuperação
         reset_token = secrets.token_urlsafe(32)
-        password_reset_tokens[reset_token] = {
-            'user_id': user.id,
-            'expires_at': datetime.utcnow() + timedelta(hours=1)
-        }
+        get_store().set(RESET_TOKEN_PREFIX + reset_token, {'user_id': user.id}, ttl=RESET_TOKEN_TTL)
         
-        # Em produção, enviar email real
-        # Por enquanto, vamos simular o envio
         reset_link = f"https://5000-i77deijoxww6ml9zjt1p2-565aa505.manus.computer/reset-password?token={reset_token}"
         
-        # Simular envio de email (em produção, usar SMTP real)
-        print(f"Email de recuperação enviado para {email}")
-        print(f"Link de recuperação: {reset_link}")
+        # Apenas enfileirar: o envio acontece em segundo plano
+        send_email(
+            email,
+            'Recuperação de senha - Sensus',
+            f'<p>Para redefinir sua senha, acesse o link abaixo (válido por 1 hora):</p>'
+            f'<p><a href="{reset_link}">{reset_link}</a></p>'
+        )
         
         return jsonify({
             'message': 'Se o email existir, você receberá instruções para redefinir sua senha',
@@ -112,6 +115,7 @@ def forgot_password():
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/auth/reset-password', methods=['POST'])
+@rate_limit(10, per=60, burst=5, by='ip')
 def reset_password():
     """Redefinir senha com token"""
     try:
@@ -122,15 +126,12 @@ def reset_password():
         if not token or not new_password:
             return jsonify({'error': 'Token e nova senha são obrigatórios'}), 400
         
-        # Verificar token
-        token_data = password_reset_tokens.get(token)
+        # Verificar token (uso único: removido só depois que a nova senha for gravada,
+        # para que uma falha no commit não invalide o link enviado por email)
+        token_data = get_store().get(RESET_TOKEN_PREFIX + token)
         if not token_data:
             return jsonify({'error': 'Token inválido ou expirado'}), 400
         
-        if datetime.utcnow() > token_data['expires_at']:
-            del password_reset_tokens[token]
-            return jsonify({'error': 'Token expirado'}), 400
-        
         # Atualizar senha
         user = User.query.get(token_data['user_id'])
         if not user:
@@ -138,9 +139,7 @@ def reset_password():
         
         user.set_password(new_password)
         db.session.commit()
-        
-        # Remover token usado
-        del password_reset_tokens[token]
+        get_store().delete(RESET_TOKEN_PREFIX + token)
         
         return jsonify({'message': 'Senha redefinida com sucesso'}), 200
         
@@ -148,6 +147,7 @@ def reset_password():
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/auth/validate-reset-token', methods=['POST'])
+@rate_limit(20, per=60, burst=10, by='ip')
 def validate_reset_token():
     """Validar token de recuperação"""
     try:
@@ -157,13 +157,9 @@ def validate_reset_token():
         if not token:
             return jsonify({'error': 'Token é obrigatório'}), 400
         
-        token_data = password_reset_tokens.get(token)
+        token_data = get_store().get(RESET_TOKEN_PREFIX + token)
         if not token_data:
-            return jsonify({'valid': False, 'error': 'Token inválido'}), 200
-        
-        if datetime.utcnow() > token_data['expires_at']:
-            del password_reset_tokens[token]
-            return jsonify({'valid': False, 'error': 'Token expirado'}), 200
+            return jsonify({'valid': False, 'error': 'Token inválido ou expirado'}), 200
         
         user = User.query.get(token_data['user_id'])
         if not user:
@@ -179,6 +175,7 @@ def validate_reset_token():
 
 @auth_bp.route('/auth/change-password', methods=['POST'])
 @login_required
+@rate_limit(5, per=60)
 def change_password():
     """Alterar senha do usuário logado"""
     try:
@@ -189,7 +186,7 @@ def change_password():
         if not current_password or not new_password:
             return jsonify({'error': 'Senha atual e nova senha são obrigatórias'}), 400
         
-        user = User.query.get(session['user_id'])
+        user = get_current_user()
         
         if not user.check_password(current_password):
             return jsonify({'error': 'Senha atual incorreta'}), 400
@@ -203,30 +200,10 @@ def change_password():
         return jsonify({'error': str(e)}), 500
 
 def send_email(to_email, subject, body):
-    """Função auxiliar para envio de emails (implementação básica)"""
+    """Enfileirar um email HTML para envio em segundo plano (ver services.mailer)"""
     try:
-        # Configurações do email (em produção, usar variáveis de ambiente)
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 587
-        sender_email = "noreply@sensustec.com.br"
-        sender_password = "sua_senha_aqui"  # Em produção, usar variáveis de ambiente
-        
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, to_email, text)
-        server.quit()
-        
+        enqueue_email(to_email, subject, body)
         return True
     except Exception as e:
-        print(f"Erro ao enviar email: {e}")
+        print(f"Erro ao enfileirar email: {e}")
         return False
-
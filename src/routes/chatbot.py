@@ -1,7 +1,14 @@
 from flask import Blueprint, request, jsonify, session
-from database import db, ChatMessage, User
+from database import db, User
 from src.routes.user import login_required
-import openai
+from services.archive import paginate_history, archived_count, find_archived
+from services.identity import get_identity, get_current_identity, get_current_user
+from services.rate_limit import rate_limit
+from services.idempotency import idempotent
+from services.response_cache import cached_response
+from services.chat_shards import save_message, discard_message, get_message, count_messages
+from services.llm_gateway import chat_completion
+from services.live_feed import publish_message, publish_balance
 import os
 
 chatbot_bp = Blueprint('chatbot', __name__)
@@ -68,9 +75,9 @@ def get_chatbot_response(question, user_context="", user_id=None):
         # Adicionar contexto do usuário para personalizar a resposta
         user_info = ""
         if user_id:
-            user = User.query.get(user_id)
-            if user:
-                user_info = f"Usuário: {user.username} (ID: {user_id})"
+            identity = get_identity(user_id)
+            if identity:
+                user_info = f"Usuário: {identity['user']['username']} (ID: {user_id})"
         
         system_prompt = f"""
         Você é um assistente especializado em TOTVS Datasul e nos serviços da empresa Sensus RS.
@@ -94,8 +101,7 @@ def get_chatbot_response(question, user_context="", user_id=None):
         - Cada conversa é individual e isolada por usuário
         """
         
-        client = openai.OpenAI()
-        response = client.chat.completions.create(
+        return chat_completion(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -104,14 +110,14 @@ def get_chatbot_response(question, user_context="", user_id=None):
             max_tokens=500,
             temperature=0.7
         )
-        
-        return response.choices[0].message.content.strip()
     
     except Exception as e:
         return f"Desculpe, ocorreu um erro ao processar sua pergunta. Tente novamente ou entre em contato com nosso suporte: (47) 3029-2866"
 
 @chatbot_bp.route('/chat', methods=['POST'])
 @login_required
+@idempotent
+@rate_limit(20, per=60, burst=5)
 def chat():
     """Processar pergunta do chatbot"""
     try:
@@ -122,7 +128,7 @@ def chat():
             return jsonify({'error': 'Question is required'}), 400
         
         user_id = session['user_id']
-        user = User.query.get(user_id)
+        user = get_current_user()
         
         # Verificar se o usuário tem saldo de mensagens
         if user.message_balance <= 0:
@@ -134,18 +140,20 @@ def chat():
         # Gerar resposta do chatbot
         answer = get_chatbot_response(question, user_context="", user_id=user_id)
         
-        # Salvar conversa no histórico
-        chat_message = ChatMessage(
-            user_id=user_id,
-            question=question,
-            answer=answer
-        )
+        # Salvar conversa no histórico (tabela principal ou shard do usuário)
+        chat_message = save_message(user_id, question, answer)
         
         # Decrementar saldo de mensagens
         user.message_balance -= 1
         
-        db.session.add(chat_message)
-        db.session.commit()
+        # Eventos do feed ao vivo dos admins, gravados na mesma transação
+        publish_message(chat_message, user.username)
+        publish_balance(user, -1, 'chat')
+        try:
+            db.session.commit()
+        except Exception:
+            discard_message(chat_message)
+            raise
         
         return jsonify({
             'question': question,
@@ -158,30 +166,29 @@ def chat():
 
 @chatbot_bp.route('/chat/history', methods=['GET'])
 @login_required
+@cached_response('chat-history', per_user=True)
 def get_chat_history():
     """Obter histórico de conversas do usuário - ISOLADO POR USUÁRIO"""
     user_id = session['user_id']
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
+    # Textos completos por padrão: o bundle publicado do frontend não envia ?fields=full
+    full = request.args.get('fields') != 'summary'
     
-    # Garantir isolamento absoluto por usuário
-    messages = ChatMessage.query.filter(
-        ChatMessage.user_id == user_id
-    ).order_by(ChatMessage.created_at.desc())\
-     .paginate(page=page, per_page=per_page, error_out=False)
+    # Garantir isolamento absoluto por usuário (mensagens antigas vêm do arquivo)
+    items, total, pages = paginate_history(page, per_page, user_id=user_id, full=full)
     
     # Filtrar novamente no Python para garantia extra
     filtered_messages = []
-    for msg in messages.items:
-        if msg.user_id == user_id:
-            msg_dict = msg.to_dict()
+    for msg_dict in items:
+        if msg_dict['user_id'] == user_id:
             msg_dict['isolated_user_id'] = user_id  # Adicionar confirmação de isolamento
             filtered_messages.append(msg_dict)
     
     return jsonify({
         'messages': filtered_messages,
         'total': len(filtered_messages),
-        'pages': messages.pages,
+        'pages': pages,
         'current_page': page,
         'user_id': user_id,  # Confirmar o usuário
         'isolation_check': True
@@ -191,37 +198,55 @@ def get_chat_history():
 @login_required
 def get_all_chat_history():
     """Admin pode ver todo o histórico de conversas"""
-    user_id = session['user_id']
-    user = User.query.get(user_id)
+    identity = get_current_identity()
     
-    if user.user_type != 'admin':
+    if not identity or identity['user']['user_type'] != 'admin':
         return jsonify({'error': 'Admin access required'}), 403
     
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    full = request.args.get('fields') == 'full'
     
-    messages = ChatMessage.query.order_by(ChatMessage.created_at.desc())\
-        .paginate(page=page, per_page=per_page, error_out=False)
+    items, total, pages = paginate_history(page, per_page, full=full)
     
     return jsonify({
-        'messages': [msg.to_dict() for msg in messages.items],
-        'total': messages.total,
-        'pages': messages.pages,
+        'messages': items,
+        'total': total,
+        'pages': pages,
         'current_page': page
     })
 
+@chatbot_bp.route('/chat/messages/<int:message_id>', methods=['GET'])
+@login_required
+@cached_response('chat-message', per_user=True, max_age=3600)
+def get_chat_message(message_id):
+    """Mensagem completa (pergunta e resposta) - do próprio usuário ou qualquer uma para admin"""
+    identity = get_current_identity()
+    is_admin = identity and identity['user']['user_type'] == 'admin'
+    owner_id = None if is_admin else session['user_id']
+    
+    message = get_message(message_id, user_id=owner_id)
+    if message:
+        return jsonify(message)
+    
+    message = find_archived(message_id, user_id=owner_id)
+    if not message:
+        return jsonify({'error': 'Message not found'}), 404
+    return jsonify(message)
+
 @chatbot_bp.route('/chat/stats', methods=['GET'])
 @login_required
+@cached_response('chat-stats', per_user=True)
 def get_chat_stats():
     """Estatísticas de uso do chatbot para o usuário"""
     user_id = session['user_id']
     
-    total_messages = ChatMessage.query.filter_by(user_id=user_id).count()
-    user = User.query.get(user_id)
+    total_messages = count_messages(user_id) + archived_count(user_id)
+    user = get_current_identity()['user']
     
     return jsonify({
         'total_messages_sent': total_messages,
-        'remaining_balance': user.message_balance,
-        'user_since': user.created_at.isoformat() if user.created_at else None
+        'remaining_balance': user['message_balance'],
+        'user_since': user['created_at']
     })
 
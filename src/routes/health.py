@@ -1,21 +1,125 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, current_app
+from sqlalchemy import func, text
+from database import db, OutboundEmail
+from services.archive import index_status
+from services.llm_gateway import CLOSED, OPEN, llm_status
 from datetime import datetime
 import os
+import threading
+import time
 
 health_bp = Blueprint('health', __name__)
 
+# Resultado do readiness reaproveitado por HEALTH_CACHE_TTL segundos (por worker)
+_readiness = {'result': None, 'expires_at': 0}
+_readiness_lock = threading.Lock()
+_started_at = time.time()
+
+def _check_database():
+    """Ida e volta real ao banco, cronometrada"""
+    started = time.perf_counter()
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text('SELECT 1 FROM "user" LIMIT 1')).all()
+        status, error = 'up', None
+    except Exception as e:
+        status, error = 'down', str(e)
+    latency_ms = (time.perf_counter() - started) * 1000
+    if status == 'up' and latency_ms > current_app.config.get('HEALTH_DB_SLOW_MS', 250):
+        status = 'degraded'
+    return {'status': status, 'latency_ms': round(latency_ms, 1), 'error': error}
+
+def _pool_status():
+    pool = db.engine.pool
+    status = {'class': type(pool).__name__}
+    for name in ('size', 'checkedout', 'overflow'):
+        if hasattr(pool, name):
+            status[name] = getattr(pool, name)()
+    return status
+
+def _mail_queue_status():
+    counts = dict(
+        db.session.query(OutboundEmail.status, func.count(OutboundEmail.id))
+        .filter(OutboundEmail.status.in_(('pending', 'sending', 'dead')))
+        .group_by(OutboundEmail.status).all()
+    )
+    db.session.rollback()
+    return {status: counts.get(status, 0) for status in ('pending', 'sending', 'dead')}
+
+def _llm_check():
+    """Circuito do LLM aberto ou em teste: dependência degradada (o chat responde com erro)"""
+    status = llm_status()
+    status['status'] = 'up' if status['state'] == CLOSED else 'degraded'
+    return status
+
+def _run_readiness_checks():
+    config = current_app.config
+    checks = {
+        'database': _check_database(),
+        'llm': _llm_check(),
+        'pool': _pool_status()
+    }
+    if checks['database']['status'] != 'down':
+        checks['mail_queue'] = _mail_queue_status()
+    checks['archive_index'] = index_status()
+
+    ready = checks['database']['status'] != 'down'
+    # Por padrão o LLM fora do ar não tira o worker do balanceador (login, compras e histórico seguem)
+    if config.get('HEALTH_REQUIRE_LLM', False) and checks['llm']['state'] == OPEN:
+        ready = False
+    return {
+        'status': 'ready' if ready else 'not_ready',
+        'degraded': [name for name, check in checks.items() if check.get('status') == 'degraded'],
+        'checked_at': datetime.utcnow().isoformat(),
+        'pid': os.getpid(),
+        'checks': checks
+    }
+
+def get_readiness():
+    """Readiness com cache curto: probes frequentes não geram carga extra"""
+    if time.monotonic() < _readiness['expires_at']:
+        return _readiness['result']
+    with _readiness_lock:
+        # Outra thread pode ter acabado de atualizar enquanto esta esperava
+        if time.monotonic() >= _readiness['expires_at']:
+            _readiness['result'] = _run_readiness_checks()
+            _readiness['expires_at'] = time.monotonic() + current_app.config.get('HEALTH_CACHE_TTL', 2)
+        return _readiness['result']
+
+@health_bp.route('/api/health/live', methods=['GET'])
+def liveness():
+    """Liveness: o processo responde (sem consultar dependências)"""
+    return jsonify({
+        'status': 'alive',
+        'pid': os.getpid(),
+        'uptime_seconds': round(time.time() - _started_at, 1),
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+@health_bp.route('/api/health/ready', methods=['GET'])
+def readiness():
+    """Readiness: banco, provedor de LLM, pool de conexões, fila de emails e índices"""
+    result = get_readiness()
+    return jsonify(result), 200 if result['status'] == 'ready' else 503
+
 @health_bp.route('/api/health', methods=['GET'])
 def health_check():
     """Endpoint de health check para diagnóstico"""
+    result = get_readiness()
+    ready = result['status'] == 'ready'
+    if not ready:
+        status = 'unhealthy'
+    else:
+        status = 'degraded' if result['degraded'] else 'healthy'
     return jsonify({
-        'status': 'healthy',
+        'status': status,
         'timestamp': datetime.utcnow().isoformat(),
         'service': 'Sensus Chatbot Backend',
         'version': '1.0.0',
         'environment': os.environ.get('FLASK_ENV', 'production'),
-        'database': 'connected',
+        'database': 'connected' if result['checks']['database']['status'] != 'down' else 'unavailable',
         'cors': 'enabled'
-    })
+    }), 200 if ready else 503
 
 @health_bp.route('/api/ping', methods=['GET'])
 def ping():
@@ -1,10 +1,12 @@
 from flask import Blueprint, request, jsonify, session
 from database import db, MessagePackage
 from src.routes.user import admin_required, login_required
+from services.response_cache import cached_response
 
 packages_bp = Blueprint('packages', __name__)
 
 @packages_bp.route('/packages', methods=['GET'])
+@cached_response('packages', max_age=60)
 def get_packages():
     """Listar todos os pacotes ativos"""
     packages = MessagePackage.query.filter_by(is_active=True).all()
@@ -28,6 +30,7 @@ def create_package():
         return jsonify({'error': str(e)}), 400
 
 @packages_bp.route('/packages/<int:package_id>', methods=['GET'])
+@cached_response('packages', max_age=60)
 def get_package(package_id):
     """Obter detalhes de um pacote específico"""
     package = MessagePackage.query.get_or_404(package_id)
@@ -1,6 +1,11 @@
 from flask import Blueprint, request, jsonify, session
 from database import db, Transaction, User, MessagePackage
+from sqlalchemy import func
 from src.routes.user import admin_required, login_required
+from services.identity import get_current_user
+from services.idempotency import idempotent
+from services.live_feed import publish_transaction, publish_balance
+from services.projections import transaction_query, transaction_to_dict
 
 transactions_bp = Blueprint('transactions', __name__)
 
@@ -9,11 +14,13 @@ transactions_bp = Blueprint('transactions', __name__)
 def get_user_transactions():
     """Listar transações do usuário logado"""
     user_id = session['user_id']
-    transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.created_at.desc()).all()
-    return jsonify([transaction.to_dict() for transaction in transactions])
+    transactions = transaction_query().filter(Transaction.user_id == user_id)\
+        .order_by(Transaction.created_at.desc()).all()
+    return jsonify([transaction_to_dict(transaction) for transaction in transactions])
 
 @transactions_bp.route('/transactions', methods=['POST'])
 @login_required
+@idempotent
 def create_transaction():
     """Criar nova transação (compra de pacote)"""
     try:
@@ -35,6 +42,7 @@ def create_transaction():
         )
         
         db.session.add(transaction)
+        publish_transaction(transaction)
         db.session.commit()
         
         return jsonify({
@@ -47,6 +55,7 @@ def create_transaction():
 
 @transactions_bp.route('/transactions/<int:transaction_id>/complete', methods=['POST'])
 @login_required
+@idempotent
 def complete_transaction(transaction_id):
     """Completar transação e adicionar mensagens ao saldo do usuário"""
     try:
@@ -63,10 +72,12 @@ def complete_transaction(transaction_id):
         transaction.status = 'completed'
         
         # Adicionar mensagens ao saldo do usuário
-        user = User.query.get(user_id)
+        user = get_current_user()
         package = MessagePackage.query.get(transaction.package_id)
         user.message_balance += package.message_count
         
+        publish_transaction(transaction)
+        publish_balance(user, package.message_count, 'purchase')
         db.session.commit()
         
         return jsonify({
@@ -93,6 +104,7 @@ def cancel_transaction(transaction_id):
             return jsonify({'error': 'Transaction cannot be cancelled'}), 400
         
         transaction.status = 'failed'
+        publish_transaction(transaction)
         db.session.commit()
         
         return jsonify({'message': 'Transaction cancelled successfully'})
@@ -103,9 +115,27 @@ def cancel_transaction(transaction_id):
 @transactions_bp.route('/admin/transactions', methods=['GET'])
 @admin_required
 def get_all_transactions():
-    """Listar todas as transações (apenas admin)"""
-    transactions = Transaction.query.order_by(Transaction.created_at.desc()).all()
-    return jsonify([transaction.to_dict() for transaction in transactions])
+    """Listar todas as transações (apenas admin); com ?page= a resposta é paginada"""
+    query = transaction_query().order_by(Transaction.created_at.desc(), Transaction.id.desc())
+    
+    page = request.args.get('page', type=int)
+    if page is None:
+        return jsonify([transaction_to_dict(row) for row in query])
+    
+    page = max(page, 1)
+    per_page = request.args.get('per_page', 50, type=int)
+    if per_page <= 0:
+        per_page = 50
+    total = db.session.query(func.count(Transaction.id)).scalar()
+    rows = query.offset((page - 1) * per_page).limit(per_page).all()
+    
+    return jsonify({
+        'transactions': [transaction_to_dict(row) for row in rows],
+        'total': total,
+        'pages': (total + per_page - 1) // per_page,
+        'current_page': page,
+        'per_page': per_page
+    })
 
 @transactions_bp.route('/admin/transactions/<int:transaction_id>/complete', methods=['POST'])
 @admin_required
@@ -125,6 +155,8 @@ def admin_complete_transaction(transaction_id):
         package = MessagePackage.query.get(transaction.package_id)
         user.message_balance += package.message_count
         
+        publish_transaction(transaction)
+        publish_balance(user, package.message_count, 'purchase')
         db.session.commit()
         
         return jsonify({
@@ -1,6 +1,11 @@
 from flask import Blueprint, request, jsonify, session
 from database import db, User
+from services.user_import import import_users
+from services.identity import get_current_identity
+from services.rate_limit import rate_limit
+from services.response_cache import cached_response
 from functools import wraps
+import io
 
 user_bp = Blueprint('user', __name__)
 
@@ -17,13 +22,14 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             return jsonify({'error': 'Login required'}), 401
-        user = User.query.get(session['user_id'])
-        if not user or user.user_type != 'admin':
+        identity = get_current_identity()
+        if not identity or identity['user']['user_type'] != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         return f(*args, **kwargs)
     return decorated_function
 
 @user_bp.route('/register', methods=['POST'])
+@rate_limit(5, per=60, by='ip')
 def register():
     try:
         data = request.json
@@ -49,12 +55,17 @@ def register():
         return jsonify({'error': str(e)}), 400
 
 @user_bp.route('/login', methods=['POST'])
+@rate_limit(10, per=60, burst=5, by='ip')
 def login():
     try:
         data = request.json
         user = User.query.filter_by(username=data['username']).first()
         
         if user and user.check_password(data['password']) and user.is_active:
+            # Regerar o hash se foi criado com parâmetros desatualizados
+            if user.password_needs_rehash():
+                user.set_password(data['password'])
+                db.session.commit()
             session['user_id'] = user.id
             return jsonify({
                 'message': 'Login successful',
@@ -73,9 +84,12 @@ def logout():
 
 @user_bp.route('/profile', methods=['GET'])
 @login_required
+@cached_response('profile', per_user=True)
 def get_profile():
-    user = User.query.get(session['user_id'])
-    return jsonify(user.to_dict())
+    identity = get_current_identity()
+    if not identity:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify(identity['user'])
 
 @user_bp.route('/users', methods=['GET'])
 @admin_required
@@ -109,6 +123,21 @@ def create_user():
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@user_bp.route('/users/import', methods=['POST'])
+@admin_required
+def import_users_csv():
+    """Importar usuários em massa a partir de um CSV (arquivo 'file' ou corpo text/csv)"""
+    try:
+        upload = request.files.get('file')
+        stream = upload.stream if upload else request.stream
+        lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        
+        batch_size = request.args.get('batch_size', 2000, type=int)
+        summary = import_users(lines, batch_size=batch_size, processes=False)
+        return jsonify(summary), 201 if summary['created'] else 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
 @admin_required
 def get_user(user_id):
@@ -0,0 +1,397 @@
+"""Arquivamento de mensagens antigas do chat em segmentos mensais compactados.
+
+Cada mês arquivado vira um par de arquivos no diretório de arquivo:
+
+- ``chat-AAAA-MM.jsonl.gz``: segmento somente-anexação formado por blocos gzip
+  independentes (o arquivo inteiro continua sendo um gzip válido);
+- ``chat-AAAA-MM.idx``: índice em JSON lines com uma entrada por bloco
+  (usuário, posição no segmento, quantidade e faixa de datas/ids).
+
+Os endpoints de histórico leem primeiro a janela quente (tabela
+``chat_message`` ou os shards, ver services.chat_shards) e continuam no
+arquivo quando a paginação passa do fim da janela quente.
+"""
+import gzip
+import heapq
+import json
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, select, delete
+
+from services.chat_shards import message_sources, count_messages, page_messages, usernames
+from services.projections import summarize_chat_message
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+SEGMENT_SUFFIX = '.jsonl.gz'
+INDEX_SUFFIX = '.idx'
+DEFAULT_BLOCK_SIZE = 500
+DELETE_CHUNK_SIZE = 500
+
+# Cache dos índices já lidos: caminho -> (bytes consumidos, entradas)
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def _archive_dir():
+    return current_app.config['CHAT_ARCHIVE_DIR']
+
+
+def _segment_paths(archive_dir, month):
+    base = os.path.join(archive_dir, f'chat-{month}')
+    return base + SEGMENT_SUFFIX, base + INDEX_SUFFIX
+
+
+def _list_months(archive_dir):
+    """Meses arquivados, do mais recente para o mais antigo"""
+    if not os.path.isdir(archive_dir):
+        return []
+    months = [
+        name[len('chat-'):-len(INDEX_SUFFIX)]
+        for name in os.listdir(archive_dir)
+        if name.startswith('chat-') and name.endswith(INDEX_SUFFIX)
+    ]
+    return sorted(months, reverse=True)
+
+
+def _load_index(index_path):
+    """Ler o índice de um segmento, lendo do disco apenas o trecho anexado desde a última leitura"""
+    try:
+        size = os.path.getsize(index_path)
+    except OSError:
+        return []
+
+    with _index_lock:
+        consumed, entries = _index_cache.get(index_path, (0, []))
+        if size < consumed:
+            # Arquivo recriado: descartar cache
+            consumed, entries = 0, []
+        if size > consumed:
+            with open(index_path, 'rb') as f:
+                f.seek(consumed)
+                data = f.read(size - consumed)
+            # Ignorar uma última linha incompleta (escrita em andamento)
+            complete = data.rfind(b'\n') + 1
+            entries = entries + [json.loads(line) for line in data[:complete].splitlines() if line.strip()]
+            consumed += complete
+            _index_cache[index_path] = (consumed, entries)
+        return entries
+
+
+def _month_entries(archive_dir, month, user_id=None):
+    _, index_path = _segment_paths(archive_dir, month)
+    entries = _load_index(index_path)
+    if user_id is None:
+        return entries
+    return [entry for entry in entries if entry['user_id'] == user_id]
+
+
+def _append_block(archive_dir, month, user_id, records):
+    """Anexar um bloco compactado ao segmento do mês e registrá-lo no índice"""
+    segment_path, index_path = _segment_paths(archive_dir, month)
+    payload = b''.join(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n' for record in records)
+    block = gzip.compress(payload, compresslevel=9)
+
+    with open(segment_path, 'ab') as segment:
+        if fcntl:
+            fcntl.flock(segment, fcntl.LOCK_EX)
+        offset = segment.seek(0, os.SEEK_END)
+        segment.write(block)
+        segment.flush()
+        os.fsync(segment.fileno())
+
+        # O índice só é gravado depois que o bloco está em disco
+        entry = {
+            'user_id': user_id,
+            'offset': offset,
+            'length': len(block),
+            'count': len(records),
+            'first_id': records[0]['id'],
+            'last_id': records[-1]['id'],
+            'first_at': min(record['created_at'] for record in records),
+            'last_at': max(record['created_at'] for record in records)
+        }
+        with open(index_path, 'ab') as index:
+            index.write(json.dumps(entry).encode('utf-8') + b'\n')
+            index.flush()
+            os.fsync(index.fileno())
+    return entry
+
+
+def _read_block(archive_dir, month, entry):
+    segment_path, _ = _segment_paths(archive_dir, month)
+    with open(segment_path, 'rb') as segment:
+        segment.seek(entry['offset'])
+        data = segment.read(entry['length'])
+    return [json.loads(line) for line in gzip.decompress(data).splitlines() if line]
+
+
+def index_status():
+    """Situação dos índices do arquivo neste processo (segmentos existentes e já carregados)"""
+    archive_dir = _archive_dir()
+    months = _list_months(archive_dir)
+    with _index_lock:
+        loaded = [
+            entries for path, (_, entries) in _index_cache.items()
+            if os.path.dirname(path) == archive_dir
+        ]
+    return {
+        'segments': len(months),
+        'loaded': len(loaded),
+        'blocks': sum(len(entries) for entries in loaded)
+    }
+
+
+def archived_count(user_id=None):
+    """Total de mensagens arquivadas (de um usuário ou de todos)"""
+    archive_dir = _archive_dir()
+    return sum(
+        entry['count']
+        for month in _list_months(archive_dir)
+        for entry in _month_entries(archive_dir, month, user_id)
+    )
+
+
+def archived_counts_by_user(user_ids=None):
+    """Mensagens arquivadas por usuário (de todos ou dos ids informados), em uma única passada pelos índices"""
+    archive_dir = _archive_dir()
+    wanted = set(user_ids) if user_ids is not None else None
+    counts = {}
+    for month in _list_months(archive_dir):
+        for entry in _month_entries(archive_dir, month):
+            if wanted is None or entry['user_id'] in wanted:
+                counts[entry['user_id']] = counts.get(entry['user_id'], 0) + entry['count']
+    return counts
+
+
+def archived_monthly_counts(user_id=None, since=None):
+    """Mensagens arquivadas por mês ('AAAA-MM' -> quantidade)"""
+    archive_dir = _archive_dir()
+    since_month = since.strftime('%Y-%m') if since else None
+    counts = {}
+    for month in _list_months(archive_dir):
+        if since_month and month < since_month:
+            continue
+        total = sum(entry['count'] for entry in _month_entries(archive_dir, month, user_id))
+        if total:
+            counts[month] = total
+    return counts
+
+
+def _record_key(record):
+    return record['created_at'], record['id']
+
+
+class _Descending:
+    """Chave com ordem invertida para usar o heap mínimo como heap máximo"""
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return self.key > other.key
+
+
+def _merged_month(archive_dir, month, entries):
+    """Mensagens do mês, mais recentes primeiro, intercalando os blocos sob demanda.
+
+    Blocos são descompactados só quando o maior (created_at, id) possível
+    deles (``last_at``/``last_id`` do índice) alcança a próxima mensagem a sair.
+    """
+    pending = sorted(entries, key=lambda e: (e['last_at'], e['last_id']), reverse=True)
+    heap = []  # (chave invertida, desempate, registros, posição)
+    opened = 0
+    while pending or heap:
+        if pending and (not heap or (pending[0]['last_at'], pending[0]['last_id']) >= heap[0][0].key):
+            records = sorted(_read_block(archive_dir, month, pending.pop(0)), key=_record_key, reverse=True)
+            if records:
+                heapq.heappush(heap, (_Descending(_record_key(records[0])), opened, records, 0))
+                opened += 1
+            continue
+        _, tiebreak, records, position = heapq.heappop(heap)
+        yield records[position]
+        if position + 1 < len(records):
+            heapq.heappush(heap, (_Descending(_record_key(records[position + 1])), tiebreak, records, position + 1))
+
+
+def read_archived(user_id=None, offset=0, limit=20):
+    """Ler mensagens arquivadas da mais recente para a mais antiga.
+
+    Meses e blocos inteiros são pulados usando as contagens do índice; no
+    histórico de todos os usuários os blocos do mês são intercalados sob
+    demanda e a leitura para em ``offset + limit`` mensagens.
+    """
+    archive_dir = _archive_dir()
+    results = []
+    if limit <= 0:
+        return results
+
+    for month in _list_months(archive_dir):
+        entries = _month_entries(archive_dir, month, user_id)
+        if not entries:
+            continue
+        count = sum(entry['count'] for entry in entries)
+        if offset >= count:
+            offset -= count
+            continue
+
+        if user_id is None:
+            # Mensagens de usuários diferentes se intercalam dentro do mês
+            for record in _merged_month(archive_dir, month, entries):
+                if offset:
+                    offset -= 1
+                    continue
+                results.append(record)
+                if len(results) >= limit:
+                    return results
+            continue
+
+        for entry in sorted(entries, key=lambda e: (e['last_at'], e['last_id']), reverse=True):
+            if offset >= entry['count']:
+                offset -= entry['count']
+                continue
+            records = sorted(_read_block(archive_dir, month, entry), key=_record_key, reverse=True)
+            results.extend(records[offset:offset + limit - len(results)])
+            offset = 0
+            if len(results) >= limit:
+                return results
+    return results
+
+
+def paginate_history(page, per_page, user_id=None, full=False):
+    """Paginar o histórico (de um usuário ou de todos) mais recente primeiro,
+    lendo do arquivo quando a página passa da janela quente.
+
+    Por padrão devolve resumos (prévia e tamanho de pergunta e resposta);
+    ``full=True`` traz os textos completos. Retorna (itens serializados, total, páginas).
+    """
+    preview_length = current_app.config.get('HISTORY_PREVIEW_LENGTH', 200)
+    page = max(page, 1)
+    if per_page <= 0:
+        per_page = 20
+    offset = (page - 1) * per_page
+
+    # Janela quente: tabela do banco principal ou shards (services.chat_shards)
+    hot_total = count_messages(user_id)
+    items = []
+    if offset < hot_total:
+        items = page_messages(offset, per_page, user_id=user_id, full=full, preview_length=preview_length)
+
+    if len(items) < per_page:
+        archived = read_archived(user_id, max(0, offset - hot_total), per_page - len(items))
+        if not full:
+            archived = [summarize_chat_message(message, preview_length) for message in archived]
+        items.extend(archived)
+
+    total = hot_total + archived_count(user_id)
+    return items, total, int(math.ceil(total / per_page))
+
+
+def find_archived(message_id, user_id=None):
+    """Procurar uma mensagem arquivada pelo id usando as faixas de ids do índice"""
+    archive_dir = _archive_dir()
+    for month in _list_months(archive_dir):
+        for entry in _month_entries(archive_dir, month, user_id):
+            if entry['first_id'] <= message_id <= entry['last_id']:
+                for record in _read_block(archive_dir, month, entry):
+                    if record['id'] == message_id:
+                        return record
+    return None
+
+
+def _covered_ranges(archive_dir, month):
+    """Faixas de ids já arquivadas por usuário no mês (para retomar uma execução interrompida)"""
+    ranges = {}
+    for entry in _month_entries(archive_dir, month):
+        ranges.setdefault(entry['user_id'], []).append((entry['first_id'], entry['last_id']))
+    return ranges
+
+
+def archive_old_messages(older_than_days=None, block_size=DEFAULT_BLOCK_SIZE):
+    """Mover mensagens mais antigas que a idade configurada para os segmentos mensais"""
+    if older_than_days is None:
+        older_than_days = current_app.config['CHAT_ARCHIVE_AFTER_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    archive_dir = _archive_dir()
+    os.makedirs(archive_dir, exist_ok=True)
+
+    summary = {'archived': 0, 'blocks': 0, 'months': []}
+    # Cada origem (tabela do banco principal ou shard) é arquivada por vez
+    for source in message_sources():
+        table = source.table
+        month_column = func.strftime('%Y-%m', table.c.created_at)
+        with source.engine.connect() as conn:
+            months = conn.execute(select(month_column).where(table.c.created_at < cutoff).distinct()).scalars().all()
+
+        for month in sorted(months):
+            start = datetime.strptime(month, '%Y-%m')
+            next_month = (start + timedelta(days=32)).replace(day=1)
+            end = min(next_month, cutoff)
+            covered = _covered_ranges(archive_dir, month)
+            in_month = (table.c.created_at >= start, table.c.created_at < end)
+
+            with source.engine.connect() as conn:
+                names = usernames(conn.execute(select(table.c.user_id).where(*in_month).distinct()).scalars())
+                rows = conn.execution_options(yield_per=1000).execute(
+                    select(table.c.id, table.c.user_id, table.c.question, table.c.answer, table.c.created_at)
+                    .where(*in_month).order_by(table.c.user_id, table.c.id)
+                )
+
+                archived_ids = []
+                block = []
+
+                def flush():
+                    if block:
+                        _append_block(archive_dir, month, block[0]['user_id'], block)
+                        summary['archived'] += len(block)
+                        summary['blocks'] += 1
+                        block.clear()
+
+                for row in rows:
+                    archived_ids.append(row.id)
+                    if any(first <= row.id <= last for first, last in covered.get(row.user_id, ())):
+                        # Já está no arquivo (execução anterior interrompida antes do DELETE)
+                        continue
+                    if block and (block[0]['user_id'] != row.user_id or len(block) >= block_size):
+                        flush()
+                    block.append({
+                        'id': row.id,
+                        'user_id': row.user_id,
+                        'question': row.question,
+                        'answer': row.answer,
+                        'created_at': row.created_at.isoformat(),
+                        'user': names.get(row.user_id)
+                    })
+                flush()
+
+            with source.engine.begin() as conn:
+                for i in range(0, len(archived_ids), DELETE_CHUNK_SIZE):
+                    chunk = archived_ids[i:i + DELETE_CHUNK_SIZE]
+                    conn.execute(delete(table).where(table.c.id.in_(chunk)))
+            if month not in summary['months']:
+                summary['months'].append(month)
+
+    return summary
+
+
+@click.command('archive-chat')
+@click.option('--days', type=int, default=None, help='Idade mínima (em dias) das mensagens arquivadas.')
+@click.option('--block-size', type=int, default=DEFAULT_BLOCK_SIZE, help='Mensagens por bloco compactado.')
+@with_appcontext
+def archive_chat_command(days, block_size):
+    """Arquivar mensagens antigas do chat em segmentos mensais compactados"""
+    summary = archive_old_messages(older_than_days=days, block_size=block_size)
+    click.echo(
+        f"{summary['archived']} mensagens arquivadas em {summary['blocks']} blocos "
+        f"({', '.join(summary['months']) or 'nenhum mês'})"
+    )
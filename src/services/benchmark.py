@@ -0,0 +1,145 @@
+"""Benchmark de escala dos endpoints de administração e histórico.
+
+Para cada escala (quantidade de mensagens) um banco SQLite sintético é gerado
+uma única vez (``services.synthetic_data``) e os endpoints são cronometrados
+em um processo separado apontado para ele via ``DATABASE_URL``. Entre duas
+escalas consecutivas calcula-se o expoente de crescimento
+``log(t2/t1) / log(n2/n1)``: perto de 0 é constante, 1 é linear e acima de
+``--max-exponent`` o endpoint é marcado como super-linear.
+"""
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from database import db, User
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (nome, caminho); {heavy} é o usuário com mais mensagens
+ENDPOINTS = [
+    ('dashboard', '/admin/dashboard'),
+    ('users', '/admin/users'),
+    ('export_users', '/admin/export/users'),
+    ('user_history', '/admin/users/{heavy}/history'),
+    ('admin_chat_history', '/admin/chat/history?page=1&per_page=20'),
+    ('admin_chat_history_deep', '/admin/chat/history?page=200&per_page=20'),
+    ('recent_messages', '/admin/messages/recent'),
+    ('admin_transactions', '/admin/transactions?page=1&per_page=50'),
+    ('chat_history', '/chat/history?page=1&per_page=20'),
+    ('chat_stats', '/chat/stats'),
+]
+
+# Isolar o processo medido: sem caches, limites, envio de emails nem o arquivo real
+BENCHMARK_ENV = {
+    'RESPONSE_CACHE_ENABLED': '0',
+    'RATE_LIMIT_ENABLED': '0',
+    'MAIL_SENDER_ENABLED': '0',
+    'PROFILE_ENABLED': '0',
+    'SLOW_QUERY_MS': '0',
+    'KV_STORE_BACKEND': 'memory',
+    'PASSWORD_HASH_COST': '32768',
+}
+
+
+def _time_endpoints(repeat):
+    """Cronometrar os endpoints no banco atual (mediana em ms e tamanho da resposta)"""
+    app = current_app._get_current_object()
+    admin = User.query.filter_by(user_type='admin').first()
+    heavy = db.session.query(User.id).filter(User.user_type == 'client').order_by(User.id).first()
+    results = {}
+    for name, path in ENDPOINTS:
+        as_user = heavy.id if path.startswith('/chat/') else admin.id
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = as_user
+        path = path.format(heavy=heavy.id)
+        timings = []
+        status = size = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(path)
+            size = len(response.get_data())
+            timings.append((time.perf_counter() - started) * 1000)
+            status = response.status_code
+        results[name] = {'ms': round(statistics.median(timings), 2), 'status': status, 'bytes': size}
+    return results
+
+
+def _run(args, env):
+    result = subprocess.run(
+        [sys.executable, '-m', 'flask', '--app', 'src.main'] + args,
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise click.ClickException(result.stderr.strip() or result.stdout.strip())
+    return result.stdout
+
+
+def growth_exponents(scales, results):
+    """Expoente de crescimento por endpoint entre escalas consecutivas"""
+    exponents = {}
+    for name, _ in ENDPOINTS:
+        exponents[name] = []
+        for small, large in zip(scales, scales[1:]):
+            t_small, t_large = results[small][name]['ms'], results[large][name]['ms']
+            exponents[name].append(math.log(max(t_large, 0.01) / max(t_small, 0.01)) / math.log(large / small))
+    return exponents
+
+
+@click.command('benchmark-endpoints')
+@click.option('--repeat', type=int, default=5, show_default=True)
+@with_appcontext
+def benchmark_endpoints_command(repeat):
+    """Cronometrar os endpoints no banco atual (saída em JSON; usado por benchmark-scaling)"""
+    click.echo(json.dumps(_time_endpoints(repeat)))
+
+
+@click.command('benchmark-scaling')
+@click.option('--scales', default='1000,10000,100000', show_default=True,
+              help='Quantidades de mensagens, separadas por vírgula (até 10000000).')
+@click.option('--dir', 'directory', default=None, help='Onde guardar os bancos gerados (reaproveitados entre execuções).')
+@click.option('--repeat', type=int, default=5, show_default=True)
+@click.option('--max-exponent', type=float, default=1.2, show_default=True,
+              help='Expoente de crescimento a partir do qual o endpoint é marcado.')
+def benchmark_scaling_command(scales, directory, repeat, max_exponent):
+    """Medir os endpoints de admin e histórico em várias escalas e marcar crescimento super-linear"""
+    scales = sorted(int(scale) for scale in scales.split(','))
+    directory = os.path.abspath(directory or os.path.join(PROJECT_ROOT, 'src', 'database', 'benchmark'))
+    os.makedirs(directory, exist_ok=True)
+
+    results = {}
+    for scale in scales:
+        database = os.path.join(directory, f'bench-{scale}.db')
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}',
+                   CHAT_ARCHIVE_DIR=os.path.join(directory, f'archive-{scale}'), **BENCHMARK_ENV)
+        if not os.path.exists(database):
+            click.echo(f'Gerando {scale} mensagens em {database}...')
+            _run(['generate-data', '--messages', str(scale)], env)
+        click.echo(f'Medindo escala {scale}...')
+        results[scale] = json.loads(_run(['benchmark-endpoints', '--repeat', str(repeat)], env).strip().splitlines()[-1])
+
+    exponents = growth_exponents(scales, results) if len(scales) > 1 else {}
+    header = f"{'endpoint':26}" + ''.join(f'{scale:>12}' for scale in scales) + '   expoente'
+    click.echo('\n' + header)
+    flagged = []
+    for name, _ in ENDPOINTS:
+        row = f'{name:26}' + ''.join(f"{results[scale][name]['ms']:>10.1f}ms" for scale in scales)
+        worst = max(exponents.get(name) or [0])
+        if worst > max_exponent:
+            flagged.append(name)
+            row += f'   {worst:.2f}  SUPER-LINEAR'
+        elif name in exponents:
+            row += f'   {worst:.2f}'
+        click.echo(row)
+
+    if flagged:
+        click.echo(f"\nCrescimento super-linear: {', '.join(flagged)}")
+        sys.exit(1)
@@ -0,0 +1,586 @@
+"""Particionamento (sharding) opcional do histórico de chat por usuário em vários arquivos SQLite.
+
+Com ``CHAT_SHARDS=N`` (N > 0) as mensagens novas vão para
+``CHAT_SHARD_DIR/chat-shard-NN.db``, cada arquivo com o próprio lock de
+escrita. O shard de cada usuário fica registrado em ``chat_shard_assignment``
+no banco principal (gravado na primeira mensagem), então aumentar N não
+muda o lugar de quem já tem histórico; usuários sem registro caem em
+``user_id % N``.
+
+Os ids das mensagens nos shards são globais: ``SHARD_ID_BASE + sequência ×
+MAX_SHARDS + shard``, acima de qualquer id da tabela do banco principal, e
+acompanham a mensagem quando o usuário muda de shard.
+
+Toda leitura do histórico passa por este módulo. Com o sharding desligado,
+a única origem é a tabela ``chat_message`` do banco principal. Com ele
+ligado, consultas de um usuário leem o shard dele e a tabela do banco
+principal (mensagens anteriores ao sharding, até serem importadas).
+Consultas gerais do admin fazem scatter-gather em todos os shards.
+
+``flask --app src.main rebalance-chat`` move usuários entre shards e importa
+para os shards as mensagens que estão no banco principal.
+"""
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, Text, DateTime, Index, create_engine, event, func, select, update, delete
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import db, User, ChatMessage, ChatShardAssignment
+from services.kv_store import get_store
+from services.projections import chat_message_to_dict, chat_message_summary_to_dict
+
+MAX_SHARDS = 64
+SHARD_ID_BASE = 1 << 40  # ids dos shards nunca colidem com os do banco principal (e cabem em um double do JS)
+MOVE_LOCK_PREFIX = 'chat-shards:moving:'
+MOVE_LOCK_TTL = 120
+MOVE_POLL_INTERVAL = 0.05
+BATCH_SIZE = 1000
+ID_CHUNK_SIZE = 500
+
+shard_metadata = MetaData()
+
+shard_messages = Table(
+    'chat_message', shard_metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('user_id', Integer, nullable=False),
+    Column('question', Text, nullable=False),
+    Column('answer', Text, nullable=False),
+    Column('created_at', DateTime, nullable=False),
+    Index('ix_chat_message_user_created', 'user_id', 'created_at')
+)
+
+# Linha única com a sequência local do shard (base dos ids globais)
+shard_sequence = Table(
+    'shard_sequence', shard_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('value', Integer, nullable=False)
+)
+
+_engines = {}
+_engines_pid = None
+_engines_lock = threading.Lock()
+
+
+class MessageSource:
+    """Uma origem de mensagens: um shard ou a tabela do banco principal"""
+
+    def __init__(self, name, engine, table):
+        self.name = name
+        self.engine = engine
+        self.table = table
+
+    def __repr__(self):
+        return f'<MessageSource {self.name}>'
+
+
+def shards_enabled():
+    return current_app.config.get('CHAT_SHARDS', 0) > 0
+
+
+def shard_count():
+    return min(current_app.config.get('CHAT_SHARDS', 0), MAX_SHARDS)
+
+
+def shard_path(shard):
+    return os.path.join(current_app.config['CHAT_SHARD_DIR'], f'chat-shard-{shard:02d}.db')
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    # WAL: leituras do histórico não esperam pelas escritas do próprio shard
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+def get_shard_engine(shard):
+    """Engine do shard (uma por processo; o arquivo e o schema são criados no primeiro uso)"""
+    global _engines_pid
+    if _engines_pid != os.getpid():
+        with _engines_lock:
+            if _engines_pid != os.getpid():
+                # Conexões não atravessam fork: cada worker abre as suas
+                for engine in _engines.values():
+                    engine.dispose(close=False)
+                _engines.clear()
+                _engines_pid = os.getpid()
+    engine = _engines.get(shard)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(shard)
+            if engine is None:
+                path = shard_path(shard)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': 30})
+                event.listen(engine, 'connect', _configure_connection)
+                shard_metadata.create_all(engine)
+                with engine.begin() as conn:
+                    conn.execute(sqlite_insert(shard_sequence).values(id=1, value=0).on_conflict_do_nothing())
+                _engines[shard] = engine
+    return engine
+
+
+def main_source():
+    return MessageSource('main', db.engine, ChatMessage.__table__)
+
+
+def shard_source(shard):
+    return MessageSource(f'shard-{shard:02d}', get_shard_engine(shard), shard_messages)
+
+
+def default_shard(user_id):
+    return user_id % shard_count()
+
+
+def shard_for_user(user_id):
+    """Shard registrado do usuário, ou o padrão (sem gravar o registro)"""
+    assignment = db.session.get(ChatShardAssignment, user_id)
+    return assignment.shard if assignment else default_shard(user_id)
+
+
+def _assigned_shard(user_id):
+    """Shard registrado lido do banco (não da sessão), ou None se o usuário ainda não tem registro"""
+    return db.session.execute(
+        select(ChatShardAssignment.shard).where(ChatShardAssignment.user_id == user_id)
+    ).scalar()
+
+
+def message_sources(user_id=None):
+    """Origens a consultar: as do usuário informado ou todas (scatter-gather)"""
+    if not shards_enabled():
+        return [main_source()]
+    if user_id is not None:
+        return [shard_source(shard_for_user(user_id)), main_source()]
+    return [shard_source(shard) for shard in range(shard_count())] + [main_source()]
+
+
+def _wait_for_move(user_id):
+    """Esperar uma mudança de shard em andamento do usuário terminar"""
+    store = get_store()
+    deadline = time.monotonic() + current_app.config['CHAT_SHARD_MOVE_WAIT']
+    while store.get(MOVE_LOCK_PREFIX + str(user_id)) is not None:
+        if time.monotonic() >= deadline:
+            raise RuntimeError('Histórico do usuário em migração entre shards, tente novamente')
+        time.sleep(MOVE_POLL_INTERVAL)
+
+
+class _ShardChanged(Exception):
+    """O usuário começou a mudar de shard depois que o shard da gravação foi escolhido"""
+
+
+def save_message(user_id, question, answer):
+    """Gravar uma mensagem do chat no lugar certo.
+
+    Sem sharding a mensagem entra na sessão e vai junto com o commit do
+    chamador. Com sharding ela é gravada no shard do usuário na hora (em uma
+    transação do shard) e, na primeira mensagem do usuário, o registro do
+    shard entra na sessão; se o commit do chamador falhar, use
+    :func:`discard_message`.
+    """
+    if not shards_enabled():
+        message = ChatMessage(user_id=user_id, question=question, answer=answer)
+        db.session.add(message)
+        return message
+
+    store = get_store()
+    while True:
+        _wait_for_move(user_id)
+        assigned = _assigned_shard(user_id)
+        shard = assigned if assigned is not None else default_shard(user_id)
+        created_at = datetime.utcnow()
+        try:
+            with get_shard_engine(shard).begin() as conn:
+                # O UPDATE pega o lock de escrita do shard: sequência e INSERT na mesma transação
+                conn.execute(update(shard_sequence).where(shard_sequence.c.id == 1)
+                             .values(value=shard_sequence.c.value + 1))
+                # Com o lock do shard, conferir de novo: uma migração que começou depois da escolha
+                # do shard espera esta transação (move_tenant) ou já trocou o registro
+                if store.get(MOVE_LOCK_PREFIX + str(user_id)) is not None or _assigned_shard(user_id) != assigned:
+                    raise _ShardChanged()
+                sequence = conn.execute(select(shard_sequence.c.value).where(shard_sequence.c.id == 1)).scalar()
+                message_id = SHARD_ID_BASE + sequence * MAX_SHARDS + shard
+                conn.execute(shard_messages.insert().values(
+                    id=message_id, user_id=user_id, question=question, answer=answer, created_at=created_at
+                ))
+        except _ShardChanged:
+            continue
+        break
+    if assigned is None:
+        db.session.execute(
+            sqlite_insert(ChatShardAssignment).values(user_id=user_id, shard=shard, updated_at=created_at)
+            .on_conflict_do_nothing()
+        )
+    return ChatMessage(id=message_id, user_id=user_id, question=question, answer=answer, created_at=created_at)
+
+
+def discard_message(message):
+    """Desfazer um :func:`save_message` cujo commit no banco principal falhou"""
+    if message.id is None or message.id < SHARD_ID_BASE:
+        return  # sem sharding a mensagem some com o rollback da sessão
+    for source in message_sources(message.user_id):
+        with source.engine.begin() as conn:
+            conn.execute(delete(source.table).where(source.table.c.id == message.id))
+
+
+def _chunks(ids, size=ID_CHUNK_SIZE):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def usernames(user_ids):
+    names = {}
+    for chunk in _chunks(set(user_ids)):
+        names.update(db.session.query(User.id, User.username).filter(User.id.in_(chunk)))
+    return names
+
+
+def _message_columns(table, full, preview_length):
+    if full:
+        return [table.c.id, table.c.user_id, table.c.question, table.c.answer, table.c.created_at]
+    return [
+        table.c.id,
+        table.c.user_id,
+        func.substr(table.c.question, 1, preview_length).label('question'),
+        func.length(table.c.question).label('question_length'),
+        func.substr(table.c.answer, 1, preview_length).label('answer'),
+        func.length(table.c.answer).label('answer_length'),
+        table.c.created_at
+    ]
+
+
+def _serialize(rows, full):
+    """Linhas das origens -> dicionários no formato de projections (com o nome do usuário)"""
+    names = usernames(row.user_id for row in rows)
+    to_dict = chat_message_to_dict if full else chat_message_summary_to_dict
+    return [to_dict(SimpleNamespace(**row._mapping, username=names.get(row.user_id))) for row in rows]
+
+
+def page_messages(offset, limit, user_id=None, full=True, preview_length=200, known_users_only=False):
+    """Mensagens mais recentes primeiro, já serializadas (merge das origens)"""
+    if limit <= 0:
+        return []
+    sources = message_sources(user_id)
+    per_source = []
+    for source in sources:
+        table = source.table
+        query = select(*_message_columns(table, full, preview_length))
+        if user_id is not None:
+            query = query.where(table.c.user_id == user_id)
+        query = query.order_by(table.c.created_at.desc(), table.c.id.desc())
+        # Uma origem só: OFFSET no SQL; várias: cada uma traz até offset + limit para o merge
+        query = query.offset(offset).limit(limit) if len(sources) == 1 else query.limit(offset + limit)
+        with source.engine.connect() as conn:
+            per_source.append(conn.execute(query).all())
+    if len(sources) == 1:
+        offset = 0
+
+    rows, seen = [], set()
+    for row in heapq.merge(*per_source, key=lambda r: (r.created_at, r.id), reverse=True):
+        if row.id in seen:
+            continue  # cópia temporária durante a importação para um shard
+        seen.add(row.id)
+        rows.append(row)
+        if len(rows) >= offset + limit:
+            break
+    items = _serialize(rows[offset:], full)
+    if known_users_only:
+        items = [item for item in items if item['user'] is not None]
+    return items
+
+
+def get_message(message_id, user_id=None):
+    """Mensagem completa pelo id (no shard do usuário, ou em todas as origens)"""
+    for source in message_sources(user_id):
+        table = source.table
+        query = select(*_message_columns(table, True, None)).where(table.c.id == message_id)
+        if user_id is not None:
+            query = query.where(table.c.user_id == user_id)
+        with source.engine.connect() as conn:
+            row = conn.execute(query).first()
+        if row:
+            return _serialize([row], True)[0]
+    return None
+
+
+def count_messages(user_id=None, since=None):
+    total = 0
+    for source in message_sources(user_id):
+        table = source.table
+        query = select(func.count()).select_from(table)
+        if user_id is not None:
+            query = query.where(table.c.user_id == user_id)
+        if since is not None:
+            query = query.where(table.c.created_at >= since)
+        with source.engine.connect() as conn:
+            total += conn.execute(query).scalar()
+    return total
+
+
+def _grouped(user_ids, value, since=None, combine=lambda a, b: a + b):
+    """Agregação por usuário em todas as origens: {user_id: valor}"""
+    results = {}
+    chunks = list(_chunks(user_ids)) if user_ids is not None else [None]
+    for source in message_sources():
+        table = source.table
+        for chunk in chunks:
+            query = select(table.c.user_id, value(table)).group_by(table.c.user_id)
+            if chunk is not None:
+                query = query.where(table.c.user_id.in_(chunk))
+            if since is not None:
+                query = query.where(table.c.created_at >= since)
+            with source.engine.connect() as conn:
+                for uid, result in conn.execute(query):
+                    results[uid] = combine(results[uid], result) if uid in results else result
+    return results
+
+
+def message_counts_by_user(user_ids=None, since=None):
+    """Mensagens por usuário ({user_id: quantidade}), de todos ou dos ids informados"""
+    return _grouped(user_ids, lambda table: func.count(), since)
+
+
+def last_activity_by_user(user_ids=None):
+    """Data da última mensagem de cada usuário ({user_id: datetime})"""
+    return _grouped(user_ids, lambda table: func.max(table.c.created_at), combine=max)
+
+
+def active_user_count(since):
+    """Usuários distintos com mensagens desde a data informada"""
+    return len(_grouped(None, lambda table: func.count(), since))
+
+
+def _counts_by(expression, since=None, user_id=None):
+    counts = {}
+    for source in message_sources(user_id):
+        table = source.table
+        key = expression(table.c.created_at).label('key')
+        query = select(key, func.count()).group_by(key)
+        if user_id is not None:
+            query = query.where(table.c.user_id == user_id)
+        if since is not None:
+            query = query.where(table.c.created_at >= since)
+        with source.engine.connect() as conn:
+            for key_value, count in conn.execute(query):
+                counts[key_value] = counts.get(key_value, 0) + count
+    return counts
+
+
+def daily_message_counts(since):
+    """Mensagens por dia ('AAAA-MM-DD' -> quantidade)"""
+    return _counts_by(func.date, since)
+
+
+def monthly_message_counts(user_id=None, since=None):
+    """Mensagens por mês ('AAAA-MM' -> quantidade)"""
+    return _counts_by(lambda column: func.strftime('%Y-%m', column), since, user_id)
+
+
+def iter_message_batches(columns, batch_size=BATCH_SIZE, since=None):
+    """Mensagens em lotes por id crescente, origem por origem (memória constante)"""
+    for source in message_sources():
+        table = source.table
+        last_id = 0
+        while True:
+            query = select(table.c.id, *[table.c[name] for name in columns])\
+                .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+            if since is not None:
+                query = query.where(table.c.created_at >= since)
+            with source.engine.connect() as conn:
+                rows = conn.execute(query).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            yield rows
+
+
+def _copy_rows(source, destination, user_id, after_id, batch_size):
+    """Copiar as mensagens do usuário com id > after_id; retorna (copiadas, último id)"""
+    copied = 0
+    while True:
+        table = source.table
+        with source.engine.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.user_id, table.c.question, table.c.answer, table.c.created_at)
+                .where(table.c.user_id == user_id, table.c.id > after_id)
+                .order_by(table.c.id).limit(batch_size)
+            ).all()
+        if not rows:
+            return copied, after_id
+        with destination.engine.begin() as conn:
+            # OR IGNORE: retomar uma cópia interrompida não duplica nada
+            conn.execute(destination.table.insert().prefix_with('OR IGNORE'), [dict(row._mapping) for row in rows])
+        copied += len(rows)
+        after_id = rows[-1].id
+
+
+def _fence(source):
+    """Transação de escrita vazia no shard: espera as gravações em andamento nele terminarem.
+
+    Gravações que começarem depois veem o lock de migração dentro da própria
+    transação (:func:`save_message`) e desistem do shard antigo.
+    """
+    with source.engine.begin() as conn:
+        conn.execute(update(shard_sequence).where(shard_sequence.c.id == 1)
+                     .values(value=shard_sequence.c.value))
+
+
+def move_tenant(user_id, shard, batch_size=BATCH_SIZE):
+    """Mover o histórico do usuário para o shard informado (e importar o que está no banco principal).
+
+    Cópia em massa sem bloquear o chat; depois, com as escritas do usuário
+    pausadas e os shards de origem cercados (:func:`_fence`), cópia do
+    restante e troca do registro; por fim, uma última cópia do que tiver
+    passado e a remoção nas origens. Retorna a quantidade de mensagens movidas.
+    """
+    from services.response_cache import invalidate_user_responses
+
+    destination = shard_source(shard)
+    sources = [source for source in message_sources(user_id) if source.name != destination.name]
+    last_ids = {}
+    moved = 0
+    for source in sources:
+        copied, last_ids[source.name] = _copy_rows(source, destination, user_id, 0, batch_size)
+        moved += copied
+
+    store = get_store()
+    lock_key = MOVE_LOCK_PREFIX + str(user_id)
+    if not store.add(lock_key, shard, ttl=MOVE_LOCK_TTL):
+        raise RuntimeError(f'Usuário {user_id} já está em migração')
+    try:
+        for source in sources:
+            if source.name != 'main':  # o banco principal não recebe mensagens novas com sharding
+                _fence(source)
+        for source in sources:
+            copied, last_ids[source.name] = _copy_rows(source, destination, user_id, last_ids[source.name], batch_size)
+            moved += copied
+        db.session.execute(
+            sqlite_insert(ChatShardAssignment).values(user_id=user_id, shard=shard, updated_at=datetime.utcnow())
+            .on_conflict_do_update(index_elements=['user_id'], set_={'shard': shard, 'updated_at': datetime.utcnow()})
+        )
+        db.session.commit()
+    finally:
+        store.delete(lock_key)
+    invalidate_user_responses([user_id])
+
+    for source in sources:
+        # Nada gravado na origem depois da cópia final pode ser apagado sem ter sido copiado
+        copied, last_ids[source.name] = _copy_rows(source, destination, user_id, last_ids[source.name], batch_size)
+        moved += copied
+        table = source.table
+        while True:
+            with source.engine.begin() as conn:
+                ids = conn.execute(select(table.c.id).where(table.c.user_id == user_id).limit(batch_size)).scalars().all()
+                if not ids:
+                    break
+                conn.execute(delete(table).where(table.c.id.in_(ids)))
+    return moved
+
+
+def shard_status():
+    """Mensagens, usuários e tamanho em disco de cada origem"""
+    status = []
+    for source in message_sources():
+        table = source.table
+        with source.engine.connect() as conn:
+            messages = conn.execute(select(func.count()).select_from(table)).scalar()
+            users = conn.execute(select(func.count(func.distinct(table.c.user_id)))).scalar()
+        path = shard_path(int(source.name[len('shard-'):])) if source.name != 'main' else None
+        status.append({
+            'source': source.name,
+            'messages': messages,
+            'users': users,
+            'size_bytes': os.path.getsize(path) if path and os.path.exists(path) else None
+        })
+    return status
+
+
+def plan_rebalance(tolerance=0.1, max_moves=100):
+    """Movimentos (user_id, de, para) que aproximam o volume de mensagens dos shards.
+
+    Guloso: move o maior usuário do shard mais cheio que cabe no mais vazio,
+    até a diferença ficar dentro da tolerância (fração da média).
+    """
+    tenants = {}
+    for shard in range(shard_count()):
+        source = shard_source(shard)
+        table = source.table
+        with source.engine.connect() as conn:
+            tenants[shard] = dict(conn.execute(
+                select(table.c.user_id, func.count()).group_by(table.c.user_id)
+            ).all())
+    loads = {shard: sum(counts.values()) for shard, counts in tenants.items()}
+    average = sum(loads.values()) / max(len(loads), 1)
+    moves = []
+    while len(moves) < max_moves:
+        heaviest = max(loads, key=loads.get)
+        lightest = min(loads, key=loads.get)
+        gap = loads[heaviest] - loads[lightest]
+        if gap <= tolerance * average:
+            break
+        # Maior usuário que reduz a diferença entre os dois
+        candidates = [(count, uid) for uid, count in tenants[heaviest].items() if count < gap]
+        if not candidates:
+            break
+        count, uid = max(candidates)
+        moves.append((uid, heaviest, lightest))
+        loads[heaviest] -= count
+        loads[lightest] += count
+        tenants[lightest][uid] = tenants[heaviest].pop(uid)
+    return moves
+
+
+@click.command('chat-shards')
+@with_appcontext
+def chat_shards_command():
+    """Mostrar a distribuição do histórico de chat entre os shards"""
+    if not shards_enabled():
+        raise click.ClickException('Sharding desabilitado (defina CHAT_SHARDS)')
+    for entry in shard_status():
+        size = f"{entry['size_bytes'] / 2 ** 20:.1f} MB" if entry['size_bytes'] is not None else '-'
+        click.echo(f"{entry['source']:<10} {entry['messages']:>10} mensagens {entry['users']:>7} usuários {size:>10}")
+
+
+@click.command('rebalance-chat')
+@click.option('--user', 'user_id', type=int, default=None, help='Usuário a mover (com --to).')
+@click.option('--to', 'target', type=int, default=None, help='Shard de destino do usuário.')
+@click.option('--import-main', is_flag=True, help='Mover para os shards as mensagens do banco principal.')
+@click.option('--auto', is_flag=True, help='Equilibrar o volume de mensagens entre os shards.')
+@click.option('--tolerance', type=float, default=0.1, show_default=True, help='Diferença aceitável (fração da média).')
+@click.option('--dry-run', is_flag=True, help='Apenas mostrar os movimentos.')
+@with_appcontext
+def rebalance_chat_command(user_id, target, import_main, auto, tolerance, dry_run):
+    """Mover históricos de usuários entre shards"""
+    if not shards_enabled():
+        raise click.ClickException('Sharding desabilitado (defina CHAT_SHARDS)')
+    moves = []
+    if user_id is not None:
+        if target is None or not 0 <= target < shard_count():
+            raise click.ClickException(f'Informe --to entre 0 e {shard_count() - 1}')
+        moves.append((user_id, shard_for_user(user_id), target))
+    if import_main:
+        table = ChatMessage.__table__
+        with db.engine.connect() as conn:
+            legacy_users = conn.execute(select(table.c.user_id).distinct()).scalars().all()
+        moves.extend((uid, 'main', shard_for_user(uid)) for uid in legacy_users)
+    if auto:
+        moves.extend(plan_rebalance(tolerance))
+    if not moves:
+        raise click.ClickException('Nada a fazer: use --user/--to, --import-main ou --auto')
+
+    for uid, origin, destination in moves:
+        if dry_run:
+            click.echo(f'usuário {uid}: {origin} -> {destination}')
+            continue
+        moved = move_tenant(uid, destination)
+        click.echo(f'usuário {uid}: {origin} -> {destination} ({moved} mensagens)')
@@ -0,0 +1,100 @@
+"""Compressão gzip/brotli das respostas JSON da API."""
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele, apenas gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json',)
+ENCODINGS = ('br', 'gzip')
+
+
+def encoded_etag(etag, encoding):
+    """ETag da representação compactada: o da original com a codificação como sufixo"""
+    return f'{etag}-{encoding}'
+
+
+def base_etag(etag):
+    """ETag da representação original a partir do de uma representação compactada"""
+    for encoding in ENCODINGS:
+        if etag.endswith(f'-{encoding}'):
+            return etag[:-len(encoding) - 1]
+    return etag
+
+
+def _choose_encoding(accept_encodings):
+    """Codificação preferida pelo cliente entre as disponíveis (brotli vence empates)"""
+    candidates = [('br', accept_encodings['br'])] if brotli else []
+    candidates.append(('gzip', accept_encodings['gzip']))
+    encoding, quality = max(candidates, key=lambda candidate: candidate[1])
+    return encoding if quality > 0 else None
+
+
+def _compressor(encoding, config):
+    if encoding == 'br':
+        return brotli.Compressor(quality=config['COMPRESS_BR_LEVEL'])
+    # wbits=31: formato gzip
+    return zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+
+
+def _compress_stream(chunks, compressor, encoding):
+    # Cada pedaço sai compactado imediatamente, sem esperar o fim da resposta
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if not chunk:
+            continue
+        if encoding == 'br':
+            data = compressor.process(chunk) + compressor.flush()
+        else:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.finish() if encoding == 'br' else compressor.flush()
+
+
+def compress_response(response, config):
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, _compressor(encoding, config), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < config['COMPRESS_MIN_SIZE']:
+            return response
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=config['COMPRESS_BR_LEVEL'])
+        else:
+            compressor = _compressor(encoding, config)
+            compressed = compressor.compress(body) + compressor.flush()
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    # A representação compactada não é byte a byte a original: ganha um ETag próprio,
+    # ainda forte, com a codificação como sufixo
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(encoded_etag(etag, encoding), weak=weak)
+    return response
+
+
+def init_compression(app):
+    """Registrar a compressão das respostas JSON da aplicação"""
+    @app.after_request
+    def _compress(response):
+        if not app.config.get('COMPRESS_ENABLED', True):
+            return response
+        return compress_response(response, app.config)
@@ -0,0 +1,44 @@
+"""Apoio comum às ferramentas que exercitam a aplicação dentro do processo.
+
+O replay de tráfego e o teste de resistência (comandos da CLI) e a suíte de
+orçamento de consultas enviam requisições pelo cliente de teste do Flask.
+Todos desligam as mesmas partes da aplicação durante a execução e
+trocam o LLM por um stub (:func:`harness_config`), e cada requisição roda em
+um contexto de aplicação próprio (:func:`open_isolated`).
+"""
+from contextlib import contextmanager
+
+from services.llm_gateway import set_completion_stub
+
+# Desligado durante as ferramentas: captura, limites, threads de fundo e amostragem de perfis
+HARNESS_CONFIG = {
+    'TRAFFIC_CAPTURE_RATE': 0,
+    'RATE_LIMIT_ENABLED': False,
+    'MAIL_SENDER_ENABLED': False,
+    'SCHEDULER_ENABLED': False,
+    'PROFILE_SAMPLE_RATE': 0
+}
+
+
+@contextmanager
+def harness_config(app, completion_stub, overrides=None):
+    """Aplicar ``HARNESS_CONFIG`` (mais ``overrides``) e o stub do LLM no bloco, restaurando tudo no fim"""
+    config = dict(HARNESS_CONFIG, **(overrides or {}))
+    previous = {key: app.config.get(key) for key in config}
+    app.config.update(config)
+    set_completion_stub(completion_stub)
+    try:
+        yield
+    finally:
+        set_completion_stub(None)
+        app.config.update(previous)
+
+
+def open_isolated(app, client, *args, **kwargs):
+    """``client.open`` em um contexto de aplicação próprio.
+
+    Dentro do contexto do comando a requisição herdaria ``g`` e a sessão do
+    banco das anteriores (usuário carregado, objetos na sessão).
+    """
+    with app.app_context():
+        return client.open(*args, **kwargs)
@@ -0,0 +1,86 @@
+"""Chaves de idempotência (cabeçalho ``Idempotency-Key``) para POSTs com efeito colateral.
+
+A primeira requisição com uma chave reserva a entrada no armazenamento
+compartilhado, executa o handler e grava a resposta por ``IDEMPOTENCY_TTL``.
+Repetições com a mesma chave (mesmo usuário e endpoint) recebem a resposta
+gravada, com ``Idempotent-Replayed: true``; se a primeira ainda estiver em
+andamento, a repetição espera por ela até ``IDEMPOTENCY_WAIT`` segundos. A
+mesma chave com outro corpo é recusada (422). Respostas 5xx, 409 e 429
+(falhas temporárias: conflito ou limite de requisições) não são guardadas: a
+chave é liberada e a próxima tentativa executa de novo.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+
+from services.kv_store import get_store
+
+KEY_PREFIX = 'idempotency:'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+RETRYABLE_STATUSES = (409, 429)  # além dos 5xx
+
+
+def _fingerprint():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def _replay(entry):
+    response = current_app.response_class(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(f):
+    """Aceitar ``Idempotency-Key``; aplicar depois de ``login_required``"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return f(*args, **kwargs)
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'Idempotency-Key deve ter no máximo {MAX_KEY_LENGTH} caracteres'}), 400
+
+        store = get_store()
+        config = current_app.config
+        key = f"{KEY_PREFIX}{request.endpoint}:{session.get('user_id')}:{idempotency_key}"
+        fingerprint = _fingerprint()
+        deadline = time.monotonic() + config['IDEMPOTENCY_WAIT']
+
+        # Reservar a chave; quem não conseguir espera a resposta de quem conseguiu
+        while not store.add(key, {'state': 'in_flight', 'fingerprint': fingerprint},
+                            ttl=config['IDEMPOTENCY_IN_FLIGHT_TTL']):
+            entry = store.get(key)
+            if entry is None:
+                continue  # a primeira falhou ou expirou: tentar reservar de novo
+            if entry['fingerprint'] != fingerprint:
+                return jsonify({'error': 'Idempotency-Key já usada com outro conteúdo'}), 422
+            if entry['state'] == 'done':
+                return _replay(entry)
+            if time.monotonic() >= deadline:
+                response = jsonify({'error': 'Requisição com esta Idempotency-Key ainda em processamento'})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            store.delete(key)
+            raise
+        if response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES or response.is_streamed:
+            store.delete(key)
+            return response
+        store.set(key, {
+            'state': 'done',
+            'fingerprint': fingerprint,
+            'status': response.status_code,
+            'mimetype': response.mimetype,
+            'body': response.get_data(as_text=True)
+        }, ttl=config['IDEMPOTENCY_TTL'])
+        return response
+
+    return decorated_function
@@ -0,0 +1,112 @@
+"""Carregamento do usuário logado: uma vez por requisição, com cache LRU entre requisições.
+
+- ``get_current_user()`` devolve a instância ORM (para alterações), carregada
+  no máximo uma vez por requisição e guardada em ``flask.g``;
+- ``get_identity(user_id)`` devolve um retrato somente-leitura do usuário
+  (``to_dict()`` + versão da linha) a partir de um LRU em memória.
+
+Cada acerto no LRU confere a versão da linha no banco (``SELECT version``
+pela chave primária, sem carregar o usuário): qualquer UPDATE, inclusive
+feito por outro worker, incrementa a versão e o retrato é recarregado. Assim
+tipo de usuário e ``is_active``, usados na autorização, nunca ficam
+desatualizados. Após o commit, as entradas alteradas neste processo também
+são descartadas.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_app_context, session
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from database import db, User
+
+_cache = OrderedDict()  # user_id -> (version, dados, expira_em)
+_cache_lock = threading.Lock()
+
+
+def _remember(user):
+    data = user.to_dict()
+    expires_at = time.monotonic() + current_app.config.get('USER_CACHE_TTL', 5)
+    with _cache_lock:
+        _cache[user.id] = (user.version, data, expires_at)
+        _cache.move_to_end(user.id)
+        while len(_cache) > current_app.config.get('USER_CACHE_SIZE', 1024):
+            _cache.popitem(last=False)
+    return user.version, data
+
+
+def invalidate_users(user_ids):
+    with _cache_lock:
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+def get_identity(user_id):
+    """Retrato do usuário ({'version': ..., 'user': to_dict()}) ou None se não existir"""
+    if user_id is None:
+        return None
+
+    with _cache_lock:
+        entry = _cache.get(user_id)
+    if entry and entry[2] > time.monotonic():
+        version = db.session.query(User.version).filter(User.id == user_id).scalar()
+        if version == entry[0]:
+            with _cache_lock:
+                if user_id in _cache:
+                    _cache.move_to_end(user_id)
+            return {'version': entry[0], 'user': entry[1]}
+        invalidate_users([user_id])
+        if version is None:
+            return None
+
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+    version, data = _remember(user)
+    return {'version': version, 'user': data}
+
+
+def get_current_identity():
+    """Retrato do usuário logado, resolvido no máximo uma vez por requisição"""
+    if 'current_identity' not in g:
+        g.current_identity = get_identity(session.get('user_id'))
+    return g.current_identity
+
+
+def get_current_user():
+    """Instância ORM do usuário logado, carregada no máximo uma vez por requisição"""
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        user = db.session.get(User, user_id) if user_id is not None else None
+        if user:
+            _remember(user)
+        g.current_user = user
+    return g.current_user
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_on_write(mapper, connection, target):
+    # O LRU só é limpo no commit; até lá outras requisições ainda veem a versão antiga
+    session = object_session(target)
+    if session is None:
+        invalidate_users([target.id])
+    else:
+        session.info.setdefault('identity_invalidate', set()).add(target.id)
+    # Alterações posteriores na mesma requisição devem ser vistas pelo retrato
+    if has_app_context():
+        g.pop('current_identity', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    user_ids = session.info.pop('identity_invalidate', None)
+    if user_ids:
+        invalidate_users(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('identity_invalidate', None)
@@ -0,0 +1,270 @@
+"""Armazenamento chave-valor com expiração, compartilhado entre os workers do gunicorn.
+
+Dois backends com a mesma interface:
+
+- ``SQLiteStore``: arquivo SQLite próprio (fora do ``app.db``, para não
+  disputar o lock de escrita da aplicação), visível para todos os workers;
+- ``MemoryStore``: dicionário em memória, para testes e desenvolvimento.
+
+Valores são serializados em JSON. Chaves expiradas nunca são devolvidas e
+são removidas periodicamente por uma thread de limpeza em cada processo.
+"""
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SWEEP_BATCH_SIZE = 1000
+
+_store = None
+_sweeper_pid = None
+_sweeper_lock = threading.Lock()
+
+
+class ExpiringStore:
+    """Interface comum dos backends. ``ttl`` em segundos; None = sem expiração."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Gravar apenas se a chave não existir (ou já tiver expirado). Retorna True se gravou."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def pop(self, key):
+        """Ler e remover atomicamente (útil para tokens de uso único)"""
+        raise NotImplementedError
+
+    def update(self, key, fn, ttl=None):
+        """Ler-modificar-gravar atômico: grava fn(valor_atual); se fn devolver None, remove a chave"""
+        raise NotImplementedError
+
+    def sweep(self):
+        """Remover chaves expiradas. Retorna quantas foram removidas."""
+        raise NotImplementedError
+
+
+class MemoryStore(ExpiringStore):
+    def __init__(self):
+        self._data = {}  # chave -> (json, expira_em)
+        self._expirations = []  # heap de (expira_em, chave)
+        self._lock = threading.RLock()
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry and (entry[1] is None or entry[1] > now):
+            return entry
+        return None
+
+    def _put(self, key, value, ttl):
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._data[key] = (json.dumps(value), expires_at)
+        if expires_at is not None:
+            heapq.heappush(self._expirations, (expires_at, key))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.time())
+            return json.loads(entry[0]) if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._put(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            if self._live(key, time.time()):
+                return False
+            self._put(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._live(key, time.time())
+            self._data.pop(key, None)
+            return json.loads(entry[0]) if entry else None
+
+    def update(self, key, fn, ttl=None):
+        with self._lock:
+            entry = self._live(key, time.time())
+            value = fn(json.loads(entry[0]) if entry else None)
+            if value is None:
+                self._data.pop(key, None)
+            else:
+                self._put(key, value, ttl)
+            return value
+
+    def sweep(self):
+        removed = 0
+        now = time.time()
+        with self._lock:
+            while self._expirations and self._expirations[0][0] <= now:
+                expires_at, key = heapq.heappop(self._expirations)
+                entry = self._data.get(key)
+                # A chave pode ter sido regravada com outra expiração
+                if entry and entry[1] == expires_at:
+                    del self._data[key]
+                    removed += 1
+        return removed
+
+
+class SQLiteStore(ExpiringStore):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS kv_store ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL) WITHOUT ROWID'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_kv_store_expires_at '
+            'ON kv_store (expires_at) WHERE expires_at IS NOT NULL'
+        )
+
+    def _connection(self):
+        # Uma conexão por thread e por processo (conexões não atravessam fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _select(self, conn, key, now):
+        row = conn.execute(
+            'SELECT value FROM kv_store WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, now)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _upsert(self, conn, key, value, ttl):
+        expires_at = time.time() + ttl if ttl is not None else None
+        conn.execute(
+            'INSERT INTO kv_store (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+            (key, json.dumps(value), expires_at)
+        )
+
+    def get(self, key):
+        return self._select(self._connection(), key, time.time())
+
+    def set(self, key, value, ttl=None):
+        self._upsert(self._connection(), key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        cursor = self._connection().execute(
+            'INSERT INTO kv_store (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at '
+            'WHERE kv_store.expires_at IS NOT NULL AND kv_store.expires_at <= ?',
+            (key, json.dumps(value), now + ttl if ttl is not None else None, now)
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM kv_store WHERE key = ?', (key,))
+
+    def pop(self, key):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            value = self._select(conn, key, time.time())
+            conn.execute('DELETE FROM kv_store WHERE key = ?', (key,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def update(self, key, fn, ttl=None):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            value = fn(self._select(conn, key, time.time()))
+            if value is None:
+                conn.execute('DELETE FROM kv_store WHERE key = ?', (key,))
+            else:
+                self._upsert(conn, key, value, ttl)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def sweep(self):
+        conn = self._connection()
+        removed = 0
+        while True:
+            cursor = conn.execute(
+                'DELETE FROM kv_store WHERE key IN ('
+                'SELECT key FROM kv_store WHERE expires_at IS NOT NULL AND expires_at <= ? LIMIT ?)',
+                (time.time(), SWEEP_BATCH_SIZE)
+            )
+            removed += cursor.rowcount
+            if cursor.rowcount < SWEEP_BATCH_SIZE:
+                return removed
+
+    def checkpoint(self):
+        """Levar o WAL para o arquivo principal e truncá-lo. Retorna (ocupado, páginas no log, copiadas)."""
+        return tuple(self._connection().execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone())
+
+
+def _sweep_forever(store, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            store.sweep()
+        except Exception as e:
+            print(f"Erro ao limpar chaves expiradas: {e}")
+
+
+def _ensure_sweeper(store, interval):
+    # Uma thread de limpeza por processo, iniciada no primeiro uso (após o fork)
+    global _sweeper_pid
+    if not interval or _sweeper_pid == os.getpid():
+        return
+    with _sweeper_lock:
+        if _sweeper_pid != os.getpid():
+            threading.Thread(
+                target=_sweep_forever, args=(store, interval), name='kv-store-sweeper', daemon=True
+            ).start()
+            _sweeper_pid = os.getpid()
+
+
+def create_store(backend, path=None):
+    if backend == 'memory':
+        return MemoryStore()
+    if backend == 'sqlite':
+        return SQLiteStore(path)
+    raise ValueError(f"KV_STORE_BACKEND inválido: {backend} (use 'sqlite' ou 'memory')")
+
+
+def init_kv_store(app):
+    """Criar o armazenamento configurado para a aplicação"""
+    global _store
+    _store = create_store(app.config.get('KV_STORE_BACKEND', 'sqlite'), app.config.get('KV_STORE_PATH'))
+    _store.sweep_interval = app.config.get('KV_STORE_SWEEP_INTERVAL', 60)
+    return _store
+
+
+def get_store():
+    if _store is None:
+        raise RuntimeError('Armazenamento chave-valor não inicializado (chame init_kv_store)')
+    _ensure_sweeper(_store, _store.sweep_interval)
+    return _store
@@ -0,0 +1,208 @@
+"""Feed ao vivo da atividade (mensagens, transações e saldos) para admins via SSE.
+
+As rotas registram eventos com :func:`publish` na mesma transação da
+alteração; eles vão para a tabela ``change_event``, o log compartilhado entre
+os workers. Em cada processo um hub mantém as conexões SSE abertas e uma
+thread de repasse lê o log a partir do último id visto e distribui os
+eventos. O commit local acorda o repasse na hora; eventos de outros workers
+chegam em até ``LIVE_FEED_POLL_INTERVAL`` segundos. Sem assinantes, o
+repasse dorme e não consulta o banco.
+
+Clientes que reconectam enviam ``Last-Event-ID`` e recebem o que perderam.
+"""
+import json
+import queue
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db, ChangeEvent
+
+RELAY_BATCH_SIZE = 500
+REPLAY_LIMIT = 1000
+QUEUE_SIZE = 1000
+
+
+def _format(change):
+    return f"id: {change['id']}\nevent: {change['kind']}\ndata: {json.dumps(change, ensure_ascii=False)}\n\n"
+
+
+def _to_dict(row):
+    return dict(json.loads(row.payload), id=row.id, kind=row.kind, created_at=row.created_at.isoformat())
+
+
+class LiveFeedHub:
+    """Distribuição, dentro do processo, dos eventos lidos do log compartilhado"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._cursor = None
+        self._thread_started = False
+
+    def subscribe(self, app):
+        """Nova assinatura; retorna (fila, último id já coberto pelo repasse)"""
+        subscriber = queue.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            if self._cursor is None:
+                self._cursor = db.session.query(db.func.max(ChangeEvent.id)).scalar() or 0
+                db.session.rollback()
+            self._subscribers.add(subscriber)
+            cursor = self._cursor
+            if not self._thread_started:
+                threading.Thread(target=self._relay, args=(app,), name='live-feed-relay', daemon=True).start()
+                self._thread_started = True
+        self._wakeup.set()
+        return subscriber, cursor
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _relay(self, app):
+        while True:
+            with self._lock:
+                idle = not self._subscribers
+                if idle:
+                    self._cursor = None  # a próxima assinatura recomeça do fim do log
+            # Ocioso: esperar uma assinatura sem consultar o banco
+            self._wakeup.wait(None if idle else app.config['LIVE_FEED_POLL_INTERVAL'])
+            self._wakeup.clear()
+            if idle:
+                continue
+            try:
+                with app.app_context():
+                    self._fan_out()
+            except Exception as e:
+                print(f"Erro no repasse do feed ao vivo: {e}")
+                time.sleep(1)
+
+    def _fan_out(self):
+        while True:
+            with self._lock:
+                cursor = self._cursor
+            if cursor is None:
+                return
+            rows = ChangeEvent.query.filter(ChangeEvent.id > cursor)\
+                .order_by(ChangeEvent.id).limit(RELAY_BATCH_SIZE).all()
+            db.session.rollback()
+            if not rows:
+                return
+            changes = [_to_dict(row) for row in rows]
+            with self._lock:
+                self._cursor = rows[-1].id
+                subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                for change in changes:
+                    try:
+                        subscriber.put_nowait(change)
+                    except queue.Full:
+                        # Cliente lento: encerrar a conexão (ele reconecta com Last-Event-ID)
+                        self.unsubscribe(subscriber)
+                        while not subscriber.empty():
+                            subscriber.get_nowait()
+                        subscriber.put_nowait(None)
+                        break
+            if len(rows) < RELAY_BATCH_SIZE:
+                return
+
+
+hub = LiveFeedHub()
+
+
+def publish(kind, payload):
+    """Registrar um evento na transação atual (visível para os assinantes após o commit)"""
+    db.session.add(ChangeEvent(kind=kind, payload=json.dumps(payload, ensure_ascii=False)))
+    db.session.info['live_feed_pending'] = True
+
+
+def publish_message(message, username=None, preview_length=200):
+    db.session.flush()
+    publish('message', {
+        'message_id': message.id,
+        'user_id': message.user_id,
+        'user': username,
+        'question': message.question[:preview_length],
+        'truncated': len(message.question) > preview_length
+    })
+
+
+def publish_transaction(transaction):
+    db.session.flush()
+    publish('transaction', {
+        'transaction_id': transaction.id,
+        'user_id': transaction.user_id,
+        'package_id': transaction.package_id,
+        'amount': transaction.amount,
+        'status': transaction.status
+    })
+
+
+def publish_balance(user, delta, reason):
+    publish('balance', {
+        'user_id': user.id,
+        'user': user.username,
+        'message_balance': user.message_balance,
+        'delta': delta,
+        'reason': reason
+    })
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_after_commit(session):
+    if session.info.pop('live_feed_pending', False):
+        hub.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('live_feed_pending', None)
+
+
+def replay_since(last_event_id, up_to):
+    """Eventos perdidos por um cliente que reconectou (id em (last_event_id, up_to])"""
+    rows = ChangeEvent.query.filter(ChangeEvent.id > last_event_id, ChangeEvent.id <= up_to)\
+        .order_by(ChangeEvent.id).limit(REPLAY_LIMIT).all()
+    db.session.rollback()
+    return [_to_dict(row) for row in rows]
+
+
+def event_stream(last_event_id=None):
+    """Gerador SSE para um assinante: eventos perdidos, depois os novos e keep-alives"""
+    app = current_app._get_current_object()
+    config = app.config
+    subscriber, cursor = hub.subscribe(app)
+    backlog = replay_since(last_event_id, cursor) if last_event_id is not None else []
+
+    def generate():
+        last_sent = last_event_id or 0
+        deadline = time.monotonic() + config['LIVE_FEED_MAX_DURATION']
+        try:
+            yield f"retry: {int(config['LIVE_FEED_RETRY_MS'])}\n\n"
+            for change in backlog:
+                last_sent = change['id']
+                yield _format(change)
+            # Conexões têm duração máxima: o navegador reconecta sozinho com Last-Event-ID
+            while time.monotonic() < deadline:
+                try:
+                    change = subscriber.get(timeout=config['LIVE_FEED_HEARTBEAT'])
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if change is None:
+                    return
+                if change['id'] <= last_sent:
+                    continue
+                last_sent = change['id']
+                yield _format(change)
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return generate()
@@ -0,0 +1,149 @@
+"""Acesso ao provedor de LLM (OpenAI) com circuit breaker e latência média móvel.
+
+Depois de ``LLM_BREAKER_THRESHOLD`` falhas seguidas o circuito abre e as
+chamadas falham imediatamente durante ``LLM_BREAKER_COOLDOWN`` segundos; em
+seguida uma única chamada de teste (meio-aberto) decide se ele fecha de novo.
+O estado é por processo e aparece no readiness probe (``/api/health/ready``).
+
+O tempo gasto no provedor durante uma requisição fica em ``g.llm_ms``.
+Ferramentas de replay e carga trocam o provedor por uma função com
+:func:`set_completion_stub`.
+"""
+import os
+import threading
+import time
+
+from flask import current_app, g, has_request_context
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+EWMA_ALPHA = 0.2
+
+
+class CircuitOpenError(Exception):
+    """Provedor de LLM indisponível: chamada recusada sem contatar o provedor"""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.latency_ewma_ms = None
+        self.last_error = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    raise CircuitOpenError('Circuito do provedor de LLM aberto')
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._trial_in_flight:
+                    raise CircuitOpenError('Circuito do provedor de LLM em teste')
+                self._trial_in_flight = True
+
+    def record_success(self, elapsed_ms):
+        with self._lock:
+            self._observe(elapsed_ms)
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, elapsed_ms, error):
+        with self._lock:
+            self._observe(elapsed_ms)
+            self.failures += 1
+            self.last_error = f'{type(error).__name__}: {error}'
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def _observe(self, elapsed_ms):
+        if self.latency_ewma_ms is None:
+            self.latency_ewma_ms = elapsed_ms
+        else:
+            self.latency_ewma_ms = EWMA_ALPHA * elapsed_ms + (1 - EWMA_ALPHA) * self.latency_ewma_ms
+
+    def status(self):
+        with self._lock:
+            state = self.state
+            if state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                state = HALF_OPEN  # a próxima chamada será o teste
+            return {
+                'state': state,
+                'consecutive_failures': self.failures,
+                'latency_ewma_ms': round(self.latency_ewma_ms, 1) if self.latency_ewma_ms is not None else None,
+                'last_error': self.last_error
+            }
+
+
+_breaker = None
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+_stub = None
+
+
+def get_breaker():
+    global _breaker
+    if _breaker is None:
+        with _lock:
+            if _breaker is None:
+                config = current_app.config
+                _breaker = CircuitBreaker(config.get('LLM_BREAKER_THRESHOLD', 5), config.get('LLM_BREAKER_COOLDOWN', 30))
+    return _breaker
+
+
+def get_openai_client():
+    # Cliente criado no primeiro uso (o SDK é pesado para importar) e recriado após fork
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        import openai
+        _client = openai.OpenAI(timeout=current_app.config.get('LLM_TIMEOUT', 30))
+        _client_pid = os.getpid()
+    return _client
+
+
+def set_completion_stub(stub):
+    """Responder com ``stub(messages, **options)`` em vez do provedor (None volta ao provedor)"""
+    global _stub
+    _stub = stub
+
+
+def _record_request_time(elapsed_ms):
+    if has_request_context():
+        g.llm_ms = g.get('llm_ms', 0) + elapsed_ms
+
+
+def chat_completion(messages, **options):
+    """Chamar o provedor passando pelo circuit breaker; retorna o texto da resposta"""
+    started = time.perf_counter()
+    if _stub is not None:
+        try:
+            return _stub(messages, **options)
+        finally:
+            _record_request_time((time.perf_counter() - started) * 1000)
+    breaker = get_breaker()
+    breaker.before_call()
+    try:
+        response = get_openai_client().chat.completions.create(messages=messages, **options)
+    except Exception as e:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        breaker.record_failure(elapsed_ms, e)
+        _record_request_time(elapsed_ms)
+        raise
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    breaker.record_success(elapsed_ms)
+    _record_request_time(elapsed_ms)
+    return response.choices[0].message.content.strip()
+
+
+def llm_status():
+    return get_breaker().status()
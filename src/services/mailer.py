@@ -0,0 +1,356 @@
+"""Envio de emails em segundo plano a partir de uma fila persistente.
+
+Os handlers apenas gravam a mensagem na tabela ``outbound_email``
+(:func:`enqueue_email`). Uma thread por processo reivindica lotes da fila e
+os envia reaproveitando a mesma conexão SMTP autenticada entre mensagens e
+lotes. Falhas temporárias voltam para a fila com backoff exponencial; falhas
+permanentes, ou o fim das tentativas, deixam a mensagem como ``dead``.
+
+Sem ``MAIL_SERVER`` configurado as mensagens são apenas impressas no console.
+Para desenvolvimento e testes, ``flask --app src.main mail-sink`` sobe um
+servidor SMTP local que guarda as mensagens recebidas como ``.eml``.
+"""
+import os
+import smtplib
+import socketserver
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, or_, select, update
+
+from database import db, OutboundEmail
+
+# Mensagens 'sending' de um processo que morreu voltam para a fila depois deste prazo
+CLAIM_LEASE = timedelta(minutes=10)
+MAX_BACKOFF = 6 * 3600
+
+_wakeup = threading.Event()
+_sender_pid = None
+_sender_lock = threading.Lock()
+
+
+class ConsoleTransport:
+    """Sem servidor SMTP configurado: apenas imprimir as mensagens"""
+
+    def send(self, sender, recipient, message):
+        print(f"Email para {recipient}:\n{message}")
+
+    def close(self):
+        pass
+
+    def close_idle(self):
+        pass
+
+
+class SMTPTransport:
+    """Conexão SMTP autenticada reaproveitada entre mensagens (uma por thread de envio)"""
+
+    def __init__(self, config):
+        self.config = config
+        self._conn = None
+        self._last_used = 0
+
+    def _connect(self):
+        config = self.config
+        conn = smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config['MAIL_TIMEOUT'])
+        if config['MAIL_USE_TLS']:
+            conn.starttls()
+        if config['MAIL_USERNAME']:
+            conn.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        return conn
+
+    def _connection(self):
+        self.close_idle()
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def send(self, sender, recipient, message):
+        try:
+            self._connection().sendmail(sender, [recipient], message)
+        except smtplib.SMTPServerDisconnected:
+            # A conexão reaproveitada caiu: tentar uma vez com uma conexão nova
+            self.close()
+            self._connection().sendmail(sender, [recipient], message)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._conn = None
+
+    def close_idle(self):
+        # Servidores derrubam conexões ociosas; melhor encerrar antes
+        if self._conn is not None and time.monotonic() - self._last_used > self.config['MAIL_SMTP_IDLE_TIMEOUT']:
+            self.close()
+
+
+def create_transport(config):
+    if not config.get('MAIL_SERVER'):
+        return ConsoleTransport()
+    return SMTPTransport(config)
+
+
+def _build_message(sender, email):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = email.to_email
+    msg['Subject'] = email.subject
+    msg.attach(MIMEText(email.body, 'html'))
+    return msg.as_string()
+
+
+def _is_connection_error(error):
+    # Erros que valem para o lote inteiro: o restante volta para a fila sem ser tentado
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                          smtplib.SMTPHeloError, smtplib.SMTPAuthenticationError)):
+        return True
+    # smtplib.SMTPException também é OSError; aqui só interessam erros de rede
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _is_permanent(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    # Inclui SMTPAuthenticationError: 535 (credenciais recusadas) mata a mensagem na hora,
+    # 454 (falha temporária) volta para a fila; corrigidas as credenciais,
+    # ``send-mail --requeue-dead`` devolve as mortas
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _claimable(now):
+    return or_(
+        and_(OutboundEmail.status == 'pending', OutboundEmail.next_attempt_at <= now),
+        and_(OutboundEmail.status == 'sending', OutboundEmail.claimed_at < now - CLAIM_LEASE)
+    )
+
+
+def _claim_batch(batch_size):
+    """Reivindicar até ``batch_size`` mensagens para este processo"""
+    now = datetime.utcnow()
+    # Leitura barata pelo índice antes do UPDATE: fila vazia não pega o lock de escrita do banco
+    if db.session.execute(select(OutboundEmail.id).where(_claimable(now)).limit(1)).first() is None:
+        return []
+    token = uuid.uuid4().hex
+    candidates = select(OutboundEmail.id).where(_claimable(now)).order_by(OutboundEmail.id).limit(batch_size)
+    # A condição é reavaliada no próprio UPDATE: dois processos nunca reivindicam a mesma mensagem
+    db.session.execute(
+        update(OutboundEmail)
+        .where(OutboundEmail.id.in_(candidates), _claimable(now))
+        .values(status='sending', claim_token=token, claimed_at=now),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return OutboundEmail.query.filter_by(claim_token=token).order_by(OutboundEmail.id).all()
+
+
+def _record_failure(email, error, config, summary, attempted=True):
+    """Reagendar ou matar a mensagem; ``attempted=False``: nem chegou a ser enviada (não conta tentativa)"""
+    if attempted:
+        email.attempts += 1
+    email.claim_token = None
+    email.last_error = f'{type(error).__name__}: {error}'
+    if attempted and (_is_permanent(error) or email.attempts >= config['MAIL_MAX_ATTEMPTS']):
+        email.status = 'dead'
+        summary['dead'] += 1
+    else:
+        backoff = min(MAX_BACKOFF, config['MAIL_RETRY_BACKOFF'] * 2 ** max(email.attempts - 1, 0))
+        email.status = 'pending'
+        email.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff)
+        summary['retried'] += 1
+
+
+def process_queue(transport=None, batch_size=None):
+    """Enviar as mensagens pendentes em lotes; retorna as contagens por resultado"""
+    config = current_app.config
+    batch_size = batch_size or config['MAIL_BATCH_SIZE']
+    own_transport = transport is None
+    if own_transport:
+        transport = create_transport(config)
+
+    summary = {'sent': 0, 'retried': 0, 'dead': 0}
+    try:
+        while True:
+            batch = _claim_batch(batch_size)
+            connection_error = None
+            for email in batch:
+                if connection_error is not None:
+                    # Servidor inacessível: o restante do lote volta para a fila sem novas tentativas de conexão
+                    _record_failure(email, connection_error, config, summary, attempted=False)
+                    continue
+                try:
+                    transport.send(config['MAIL_SENDER'], email.to_email, _build_message(config['MAIL_SENDER'], email))
+                except Exception as e:
+                    if _is_connection_error(e):
+                        connection_error = e
+                        transport.close()
+                    _record_failure(email, e, config, summary)
+                    continue
+                email.status = 'sent'
+                email.attempts += 1
+                email.claim_token = None
+                email.last_error = None
+                email.sent_at = datetime.utcnow()
+                summary['sent'] += 1
+            db.session.commit()
+            if len(batch) < batch_size or connection_error is not None:
+                break
+    finally:
+        if own_transport:
+            transport.close()
+    return summary
+
+
+def requeue_dead():
+    """Devolver as mensagens mortas para a fila com as tentativas zeradas"""
+    count = OutboundEmail.query.filter_by(status='dead').update(
+        {'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    _wakeup.set()
+    return count
+
+
+def _send_forever(app):
+    transport = create_transport(app.config)
+    while True:
+        _wakeup.wait(app.config['MAIL_POLL_INTERVAL'])
+        _wakeup.clear()
+        try:
+            with app.app_context():
+                process_queue(transport)
+            transport.close_idle()
+        except Exception as e:
+            print(f"Erro ao enviar emails da fila: {e}")
+
+
+def _ensure_sender(app):
+    # Uma thread de envio por processo, iniciada no primeiro uso (após o fork)
+    global _sender_pid
+    if not app.config.get('MAIL_SENDER_ENABLED', True) or _sender_pid == os.getpid():
+        return
+    with _sender_lock:
+        if _sender_pid != os.getpid():
+            threading.Thread(target=_send_forever, args=(app,), name='mail-sender', daemon=True).start()
+            _sender_pid = os.getpid()
+
+
+def enqueue_email(to_email, subject, body):
+    """Gravar um email na fila de saída; o envio acontece em segundo plano"""
+    email = OutboundEmail(to_email=to_email, subject=subject, body=body)
+    db.session.add(email)
+    db.session.commit()
+    _ensure_sender(current_app._get_current_object())
+    _wakeup.set()
+    return email
+
+
+def init_mailer(app):
+    """Garantir a thread de envio nos processos que atendem requisições"""
+    @app.before_request
+    def _start_mail_sender():
+        _ensure_sender(app)
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 sensus-mail-sink ESMTP')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-sensus-mail-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n')
+            elif verb == 'HELO':
+                self.reply('250 sensus-mail-sink')
+            elif verb == 'AUTH':
+                self.reply('235 2.7.0 Authentication successful')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip(' <>'), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip(' <>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data.rstrip(b'\r\n') == b'.':
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                self.server.deliver(sender, recipients, b''.join(lines))
+                self.reply('250 OK')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class MailSink(socketserver.ThreadingTCPServer):
+    """Servidor SMTP local mínimo (sem TLS) que aceita tudo e guarda as mensagens recebidas"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 1025), directory=None):
+        super().__init__(address, _SinkHandler)
+        self.directory = directory
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def deliver(self, sender, recipients, data):
+        with self._lock:
+            self.messages.append((sender, recipients, data))
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f'{time.time():.6f}-{len(self.messages)}.eml')
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+
+@click.command('send-mail')
+@click.option('--requeue-dead', 'requeue', is_flag=True, help='Devolver as mensagens mortas para a fila antes de enviar.')
+@with_appcontext
+def send_mail_command(requeue):
+    """Enviar agora as mensagens pendentes da fila de emails"""
+    if requeue:
+        click.echo(f'{requeue_dead()} mensagens devolvidas para a fila')
+    summary = process_queue()
+    click.echo(f"{summary['sent']} enviadas, {summary['retried']} reagendadas, {summary['dead']} mortas")
+
+
+@click.command('mail-sink')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', type=int, default=1025, show_default=True)
+@click.option('--dir', 'directory', default=None, help='Diretório onde gravar as mensagens (.eml).')
+def mail_sink_command(host, port, directory):
+    """Servidor SMTP local para desenvolvimento (use MAIL_USE_TLS=0)"""
+    server = MailSink((host, port), directory)
+    click.echo(f'Recebendo emails em {host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
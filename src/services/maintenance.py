@@ -0,0 +1,145 @@
+"""Tarefas de manutenção executadas pelo agendador (services.scheduler).
+
+- ``expire_pending_transactions``: transações pendentes há mais de
+  ``TRANSACTION_PENDING_TTL_HOURS`` passam para ``expired``;
+- ``sweep_expired_keys``: remove tokens e chaves expiradas do armazenamento;
+- ``prune_outbound_email``: apaga emails enviados há mais de ``MAIL_RETENTION_DAYS``;
+- ``refresh_statistics``: ``ANALYZE`` limitado, para o planejador do SQLite;
+- ``incremental_vacuum``: devolve páginas livres ao sistema de arquivos;
+- ``checkpoint_wal``: checkpoint com truncamento dos arquivos WAL;
+- ``prune_change_log``: apaga eventos do feed ao vivo com mais de ``LIVE_FEED_RETENTION_HOURS``.
+
+O WAL e o ``auto_vacuum=INCREMENTAL`` do banco principal são ligados por
+``database.upgrade_schema`` na inicialização.
+"""
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import update
+
+from database import db, Transaction, OutboundEmail, ChangeEvent
+from services.kv_store import get_store
+from services.scheduler import register_job, get_jobs, run_job
+
+BATCH_SIZE = 500
+MAX_VACUUM_PAGES = 10000  # por execução
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+@register_job('expire_pending_transactions', interval=900)
+def expire_pending_transactions():
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config['TRANSACTION_PENDING_TTL_HOURS'])
+    expired = 0
+    while True:
+        ids = [transaction_id for (transaction_id,) in db.session.query(Transaction.id).filter(
+            Transaction.status == 'pending', Transaction.created_at < cutoff
+        ).order_by(Transaction.id).limit(BATCH_SIZE)]
+        if not ids:
+            break
+        # Lotes curtos: a trava de escrita do SQLite fica livre entre eles
+        result = db.session.execute(
+            update(Transaction).where(Transaction.id.in_(ids), Transaction.status == 'pending')
+            .values(status='expired'),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        expired += result.rowcount
+    return {'expired': expired}
+
+
+@register_job('sweep_expired_keys', interval=300)
+def sweep_expired_keys():
+    return {'removed': get_store().sweep()}
+
+
+@register_job('prune_outbound_email', interval=3600)
+def prune_outbound_email():
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['MAIL_RETENTION_DAYS'])
+    removed = 0
+    while True:
+        ids = [email_id for (email_id,) in db.session.query(OutboundEmail.id).filter(
+            OutboundEmail.status == 'sent', OutboundEmail.sent_at < cutoff
+        ).limit(BATCH_SIZE)]
+        if not ids:
+            break
+        OutboundEmail.query.filter(OutboundEmail.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        removed += len(ids)
+    return {'removed': removed}
+
+
+@register_job('refresh_statistics', interval=86400)
+def refresh_statistics():
+    with db.engine.connect() as conn:
+        # Amostragem limitada: custo estável mesmo com tabelas grandes
+        conn.exec_driver_sql('PRAGMA analysis_limit=1000')
+        conn.exec_driver_sql('ANALYZE')
+        conn.commit()
+    return {'analyzed': True}
+
+
+@register_job('incremental_vacuum', interval=86400)
+def incremental_vacuum():
+    with db.engine.connect() as conn:
+        mode = AUTO_VACUUM_MODES.get(conn.exec_driver_sql('PRAGMA auto_vacuum').scalar(), 'unknown')
+        free_before = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+        if mode != 'incremental':
+            return {'auto_vacuum': mode, 'freelist_pages': free_before, 'skipped': True}
+        # O driver avança a instrução um passo por execução, e cada passo libera uma página
+        for _ in range(min(free_before, MAX_VACUUM_PAGES)):
+            conn.exec_driver_sql('PRAGMA incremental_vacuum(1)')
+        conn.commit()
+        free_after = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+    return {'auto_vacuum': mode, 'pages_released': free_before - free_after}
+
+
+@register_job('checkpoint_wal', interval=600)
+def checkpoint_wal():
+    result = {}
+    with db.engine.connect() as conn:
+        mode = conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+        if mode == 'wal':
+            result['database'] = list(conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').one())
+        else:
+            result['database'] = {'journal_mode': mode, 'skipped': True}
+    store = get_store()
+    if hasattr(store, 'checkpoint'):
+        result['kv_store'] = list(store.checkpoint())
+    return result
+
+
+@register_job('prune_change_log', interval=3600)
+def prune_change_log():
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config['LIVE_FEED_RETENTION_HOURS'])
+    removed = 0
+    while True:
+        ids = [event_id for (event_id,) in db.session.query(ChangeEvent.id).filter(
+            ChangeEvent.created_at < cutoff
+        ).order_by(ChangeEvent.id).limit(BATCH_SIZE)]
+        if not ids:
+            break
+        ChangeEvent.query.filter(ChangeEvent.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        removed += len(ids)
+    return {'removed': removed}
+
+
+@click.command('run-maintenance')
+@click.argument('jobs', nargs=-1)
+@with_appcontext
+def run_maintenance_command(jobs):
+    """Executar agora as tarefas de manutenção (todas ou as informadas)"""
+    registered = get_jobs()
+    unknown = [name for name in jobs if name not in registered]
+    if unknown:
+        raise click.ClickException(f"Tarefas desconhecidas: {', '.join(unknown)} (disponíveis: {', '.join(registered)})")
+    for name in jobs or registered:
+        state = run_job(registered[name])
+        if state is None:
+            click.echo(f'{name}: já em execução, ignorada')
+        elif state['last_error']:
+            click.echo(f"{name}: erro em {state['last_duration_ms']} ms - {state['last_error']}")
+        else:
+            click.echo(f"{name}: {state['last_duration_ms']} ms {state['last_result']}")
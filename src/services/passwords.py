@@ -0,0 +1,162 @@
+"""Hash de senhas fora da thread da requisição, com algoritmo e custo configuráveis.
+
+hashlib.scrypt e hashlib.pbkdf2_hmac liberam o GIL enquanto calculam, então um
+pool pequeno de threads limita quantos hashes rodam ao mesmo tempo sem travar
+as demais requisições do worker.
+
+O scrypt usa 1 KiB por unidade de N (r=8): o N é limitado para que as threads
+do pool, juntas, caibam em ``PASSWORD_HASH_MAX_MEMORY_MB``. Sem custo
+explícito, a calibração roda uma vez, no ``warm_up`` do mestre do gunicorn ou
+no primeiro hash do processo, e não na importação.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+# Custos mínimos (nunca calibrar abaixo) e máximos aceitos por algoritmo
+MIN_COST = {'scrypt': 2 ** 15, 'pbkdf2': 600000}
+MAX_COST = {'scrypt': 2 ** 17, 'pbkdf2': 5000000}
+SCRYPT_R = 8
+CALIBRATION_PASSWORD = 'calibracao-sensus'
+
+# cost None: calibrar para target_ms no primeiro uso
+_settings = {'method': 'scrypt', 'cost': MIN_COST['scrypt'], 'workers': 2, 'target_ms': 0, 'max_cost': MAX_COST['scrypt']}
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_calibration_lock = threading.Lock()
+
+
+def _method_string(method, cost):
+    if method == 'scrypt':
+        return f'scrypt:{cost}:{SCRYPT_R}:1'
+    return f'pbkdf2:sha256:{cost}'
+
+
+def _parse_method(pwhash):
+    """Algoritmo e custo a partir do prefixo de um hash armazenado"""
+    parts = pwhash.split('$', 1)[0].split(':')
+    if parts[0] == 'scrypt':
+        return 'scrypt', int(parts[1]) if len(parts) > 1 else 2 ** 15
+    if parts[0] == 'pbkdf2':
+        return 'pbkdf2', int(parts[2]) if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+    return parts[0], 0
+
+
+def _get_executor():
+    # Criado sob demanda e recriado após fork (threads não sobrevivem ao fork)
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=_settings['workers'], thread_name_prefix='password-hash'
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def scrypt_memory(cost):
+    """Memória usada por um hash scrypt com N=cost, em bytes"""
+    return 128 * SCRYPT_R * cost
+
+
+def max_scrypt_cost(memory_bytes, workers):
+    """Maior N (potência de 2) com ``workers`` hashes simultâneos dentro de ``memory_bytes``"""
+    cost = 1
+    while workers * scrypt_memory(cost * 2) <= memory_bytes:
+        cost *= 2
+    return cost
+
+
+def _current_cost():
+    if _settings['cost'] is None:
+        with _calibration_lock:
+            if _settings['cost'] is None:
+                _settings['cost'] = calibrate(_settings['method'], _settings['target_ms'], _settings['max_cost'])
+    return _settings['cost']
+
+
+def current_method():
+    """String de método do werkzeug com os parâmetros atuais (ex.: 'scrypt:32768:8:1')"""
+    return _method_string(_settings['method'], _current_cost())
+
+
+def hash_password(password):
+    return _get_executor().submit(generate_password_hash, password, current_method()).result()
+
+
+def hash_passwords(passwords):
+    """Hashes de várias senhas no mesmo pool limitado (importação via HTTP)"""
+    return list(_get_executor().map(partial(generate_password_hash, method=current_method()), passwords))
+
+
+def verify_password(pwhash, password):
+    return _get_executor().submit(check_password_hash, pwhash, password).result()
+
+
+def password_needs_rehash(pwhash):
+    """Hash gerado com outro algoritmo, com custo menor que o atual ou acima do limite de memória.
+
+    Dentro do limite só atualiza para cima: workers calibrados com custos
+    ligeiramente diferentes não ficam regerando o hash um do outro.
+    """
+    method, cost = _parse_method(pwhash)
+    return method != _settings['method'] or cost < _current_cost() or cost > _settings['max_cost']
+
+
+def _time_hash(method, cost):
+    start = time.perf_counter()
+    generate_password_hash(CALIBRATION_PASSWORD, _method_string(method, cost))
+    return (time.perf_counter() - start) * 1000
+
+
+def calibrate(method, target_ms, max_cost=None):
+    """Maior custo cujo hash fica dentro da latência alvo (respeitando o mínimo e ``max_cost``)"""
+    limit = min(MAX_COST[method], max_cost or MAX_COST[method])
+    cost = MIN_COST[method]
+    elapsed = _time_hash(method, cost)
+    if method == 'scrypt':
+        # O tempo do scrypt cresce linearmente com N, que precisa ser potência de 2
+        while cost * 2 <= limit and elapsed * 2 <= target_ms:
+            cost *= 2
+            elapsed *= 2
+    else:
+        scaled = int(cost * target_ms / elapsed) // 100000 * 100000
+        cost = min(max(scaled, cost), limit)
+    return cost
+
+
+def configure_password_hashing(app):
+    """Aplicar a configuração de hash de senhas da aplicação (a calibração, se necessária, fica para depois)"""
+    method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+    if method not in MIN_COST:
+        raise ValueError(f"PASSWORD_HASH_METHOD inválido: {method} (use 'scrypt' ou 'pbkdf2')")
+
+    workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+    max_cost = MAX_COST[method]
+    if method == 'scrypt':
+        memory = app.config.get('PASSWORD_HASH_MAX_MEMORY_MB', 128) * 2 ** 20
+        max_cost = min(max_cost, max_scrypt_cost(memory, workers))
+        if max_cost < MIN_COST[method]:
+            needed = workers * scrypt_memory(MIN_COST[method]) // 2 ** 20
+            raise ValueError(f'PASSWORD_HASH_MAX_MEMORY_MB insuficiente: {workers} hashes scrypt simultâneos '
+                             f'com N={MIN_COST[method]} precisam de {needed} MB')
+
+    cost = app.config.get('PASSWORD_HASH_COST')
+    target_ms = app.config.get('PASSWORD_HASH_TARGET_MS')
+    if cost and method == 'scrypt' and cost > max_cost:
+        raise ValueError(f'PASSWORD_HASH_COST={cost} passa do limite de memória (N máximo {max_cost})')
+    if not cost and not target_ms:
+        cost = MIN_COST[method]
+
+    _settings.update(method=method, cost=cost or None, workers=workers, target_ms=target_ms, max_cost=max_cost)
+
+
+def calibrate_password_hashing():
+    """Calibrar agora, se ainda não calibrado (no mestre, antes do fork, os workers herdam o resultado)"""
+    return current_method()
@@ -0,0 +1,215 @@
+"""Diagnóstico de desempenho: log de consultas lentas e perfil de CPU por requisição.
+
+- Consultas SQL acima de ``SLOW_QUERY_MS`` são impressas com a rota, o formato
+  dos parâmetros (nunca os valores) e o ponto do código que as disparou.
+- Uma requisição é perfilada quando um admin envia ``X-Profile: 1`` ou quando
+  é sorteada por ``PROFILE_SAMPLE_RATE``. Uma thread amostra a pilha da
+  requisição e o resultado é gravado no formato de pilhas colapsadas
+  (``.folded``), aceito por flamegraph.pl e speedscope; o id volta no
+  cabeçalho ``X-Profile-Id`` e o arquivo é baixado em ``/admin/profiles/<id>``.
+
+Com ambos desligados nenhum hook é registrado.
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from services.identity import get_current_identity
+
+PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_IGNORED_CALLERS = (os.path.abspath(__file__), os.path.join(SOURCE_ROOT, 'database.py'))
+
+_slow_query_ms = 0
+
+
+def _parameters_shape(parameters, executemany):
+    if executemany:
+        rows = list(parameters)
+        return f'{len(rows)} x {_parameters_shape(rows[0], False) if rows else "()"}'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in parameters or ()) + ')'
+
+
+def query_caller(ignored=()):
+    """Primeiro quadro da pilha que pertence ao código da aplicação (fora de ``ignored``)"""
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(SOURCE_ROOT) and frame.filename not in _IGNORED_CALLERS \
+                and frame.filename not in ignored:
+            return f'{os.path.relpath(frame.filename, SOURCE_ROOT)}:{frame.lineno} in {frame.name}'
+    return '?'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append((cursor, time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _, started = conn.info['query_started'].pop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms < _slow_query_ms:
+        return
+    route = f'{request.method} {request.path} ({request.endpoint})' if has_request_context() else '-'
+    print(
+        f"[slow-query] {elapsed_ms:.1f} ms | {route} | {query_caller()} | "
+        f"params {_parameters_shape(parameters, executemany)} | {' '.join(statement.split())[:1000]}"
+    )
+
+
+def _handle_error(exception_context):
+    # Consulta que falhou não passa pelo after_cursor_execute: tirar o início da pilha da conexão
+    conn, context = exception_context.connection, exception_context.execution_context
+    if conn is None or context is None:
+        return
+    started = conn.info.get('query_started')
+    if started and started[-1][0] is context.cursor:
+        started.pop()
+
+
+class StackSampler:
+    """Amostrar periodicamente a pilha de uma thread e contar as pilhas colapsadas"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.counts.most_common())
+
+
+def _profile_dir():
+    return current_app.config['PROFILE_DIR']
+
+
+def _should_profile():
+    if request.headers.get('X-Profile') == '1':
+        identity = get_current_identity()
+        return identity is not None and identity['user']['user_type'] == 'admin'
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def _start_profile():
+    if not _should_profile():
+        return
+    sampler = StackSampler(threading.get_ident(), current_app.config['PROFILE_INTERVAL_MS'] / 1000)
+    g.profile = (sampler, time.perf_counter())
+    sampler.start()
+
+
+def _finish_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    sampler, started = profile
+    sampler.stop()
+    profile_id = uuid.uuid4().hex
+    save_profile(profile_id, sampler.collapsed(), {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        'samples': sum(sampler.counts.values()),
+        'created_at': time.time()
+    })
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def _abandon_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile[0].stop()
+
+
+def save_profile(profile_id, collapsed, metadata):
+    """Gravar o perfil (.folded) e seus metadados, mantendo só os PROFILE_KEEP mais recentes"""
+    profile_dir = _profile_dir()
+    os.makedirs(profile_dir, exist_ok=True)
+    with open(os.path.join(profile_dir, f'{profile_id}.folded'), 'w') as f:
+        f.write(collapsed)
+    with open(os.path.join(profile_dir, f'{profile_id}.json'), 'w') as f:
+        json.dump(metadata, f)
+
+    profiles = list_profiles()
+    for old in profiles[current_app.config['PROFILE_KEEP']:]:
+        for suffix in ('.folded', '.json'):
+            try:
+                os.remove(os.path.join(profile_dir, old['id'] + suffix))
+            except OSError:
+                pass
+
+
+def list_profiles():
+    """Metadados dos perfis gravados, do mais recente para o mais antigo"""
+    profile_dir = _profile_dir()
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for name in os.listdir(profile_dir):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(profile_dir, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda p: p['created_at'], reverse=True)
+
+
+def profile_path(profile_id):
+    """Caminho do arquivo .folded de um perfil, ou None se não existir"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(_profile_dir(), f'{profile_id}.folded')
+    return path if os.path.exists(path) else None
+
+
+def init_profiling(app):
+    """Registrar apenas os hooks habilitados na configuração"""
+    global _slow_query_ms
+    _slow_query_ms = app.config.get('SLOW_QUERY_MS', 0)
+    if _slow_query_ms > 0 and not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    if app.config.get('PROFILE_ENABLED', False):
+        app.before_request(_start_profile)
+        app.after_request(_finish_profile)
+        app.teardown_request(_abandon_profile)
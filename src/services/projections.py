@@ -0,0 +1,76 @@
+"""Consultas por projeção: apenas as colunas necessárias, com joins explícitos.
+
+As linhas viram dicionários diretamente, no mesmo formato dos ``to_dict()``
+dos modelos, sem hidratar objetos ORM nem disparar um lazy-load por linha
+para ``user`` e ``package``.
+"""
+from database import db, User, MessagePackage, Transaction
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def transaction_query():
+    return db.session.query(
+        Transaction.id,
+        Transaction.user_id,
+        Transaction.package_id,
+        Transaction.amount,
+        Transaction.status,
+        Transaction.created_at,
+        User.username,
+        MessagePackage.name.label('package_name')
+    ).outerjoin(User, User.id == Transaction.user_id)\
+     .outerjoin(MessagePackage, MessagePackage.id == Transaction.package_id)
+
+
+def transaction_to_dict(row):
+    return {
+        'id': row.id,
+        'user_id': row.user_id,
+        'package_id': row.package_id,
+        'amount': row.amount,
+        'status': row.status,
+        'created_at': _isoformat(row.created_at),
+        'user': row.username,
+        'package': row.package_name
+    }
+
+
+def chat_message_to_dict(row):
+    return {
+        'id': row.id,
+        'user_id': row.user_id,
+        'question': row.question,
+        'answer': row.answer,
+        'created_at': _isoformat(row.created_at),
+        'user': row.username
+    }
+
+
+def chat_message_summary_to_dict(row):
+    return {
+        'id': row.id,
+        'user_id': row.user_id,
+        'question': row.question,
+        'answer': row.answer,
+        'question_length': row.question_length,
+        'answer_length': row.answer_length,
+        'truncated': row.question_length > len(row.question) or row.answer_length > len(row.answer),
+        'created_at': _isoformat(row.created_at),
+        'user': row.username
+    }
+
+
+def summarize_chat_message(message, preview_length):
+    """Mesmo resumo a partir de uma mensagem completa já serializada (ex.: vinda do arquivo)"""
+    summary = dict(message)
+    summary.update({
+        'question': message['question'][:preview_length],
+        'answer': message['answer'][:preview_length],
+        'question_length': len(message['question']),
+        'answer_length': len(message['answer']),
+        'truncated': len(message['question']) > preview_length or len(message['answer']) > preview_length
+    })
+    return summary
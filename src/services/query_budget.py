@@ -0,0 +1,169 @@
+"""Orçamento de consultas SQL por endpoint, medido com eventos do engine do SQLAlchemy.
+
+:class:`QueryRecorder` conta, na thread atual, as consultas executadas e as
+linhas lidas (em todos os engines: banco principal e shards de chat). Testes
+usam :func:`query_budget` para exigir um máximo em um trecho de código::
+
+    with query_budget(queries=5, rows=100):
+        client.get('/admin/users')
+
+Os orçamentos de todas as rotas dos blueprints ficam em
+``tests/test_query_budget.py``: cada rota é chamada em um banco temporário
+com dados de teste e precisa responder 2xx dentro do orçamento. O orçamento
+não depende do volume de dados: um N+1 numa página de ``per_page=50`` estoura
+na hora. Estouros listam as consultas, agrupadas, com o ponto do código que
+as disparou. O comando ``flask query-budget`` roda essa suíte.
+"""
+import os
+import subprocess
+import sys
+import threading
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from importlib.util import find_spec
+
+import click
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from services.profiling import query_caller
+
+Budget = namedtuple('Budget', 'queries rows')
+
+SUITE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'tests', 'test_query_budget.py'
+)
+
+_IGNORED_CALLERS = (os.path.abspath(__file__),)
+_active = threading.local()
+_listeners_installed = False
+_install_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Consultas ou linhas acima do orçamento; a mensagem lista as consultas"""
+
+
+class _CountingCursor:
+    """Cursor DBAPI que soma as linhas lidas no gravador ativo"""
+
+    def __init__(self, cursor, entry):
+        self._cursor = cursor
+        self._entry = entry
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._entry['rows'] += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._entry['rows'] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._entry['rows'] += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._entry['rows'] += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorder = getattr(_active, 'recorder', None)
+    if recorder is None:
+        return
+    entry = {'statement': ' '.join(statement.split()), 'rows': 0, 'caller': query_caller(_IGNORED_CALLERS)}
+    recorder.statements.append(entry)
+    if context is not None and not executemany and cursor.description is not None:
+        # O resultado é montado depois deste evento a partir de context.cursor
+        context.cursor = _CountingCursor(cursor, entry)
+
+
+def _install_listeners():
+    global _listeners_installed
+    with _install_lock:
+        if not _listeners_installed:
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _listeners_installed = True
+
+
+class QueryRecorder:
+    """Gravar as consultas executadas na thread atual enquanto ativo"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def queries(self):
+        return len(self.statements)
+
+    @property
+    def rows(self):
+        return sum(entry['rows'] for entry in self.statements)
+
+    def __enter__(self):
+        _install_listeners()
+        self._previous = getattr(_active, 'recorder', None)
+        _active.recorder = self
+        return self
+
+    def __exit__(self, *exc):
+        _active.recorder = self._previous
+        return False
+
+    def violations(self, budget):
+        problems = []
+        if budget.queries is not None and self.queries > budget.queries:
+            problems.append(f'{self.queries} consultas (máximo {budget.queries})')
+        if budget.rows is not None and self.rows > budget.rows:
+            problems.append(f'{self.rows} linhas lidas (máximo {budget.rows})')
+        return problems
+
+    def report(self, limit=20):
+        """Consultas agrupadas pelo texto, mais repetidas primeiro"""
+        groups = Counter()
+        rows = Counter()
+        callers = {}
+        for entry in self.statements:
+            key = entry['statement'][:300]
+            groups[key] += 1
+            rows[key] += entry['rows']
+            callers.setdefault(key, entry['caller'])
+        return '\n'.join(
+            f'  {count:>4}x {rows[key]:>6} linhas  {callers[key]}\n         {key}'
+            for key, count in groups.most_common(limit)
+        )
+
+
+@contextmanager
+def query_budget(queries=None, rows=None, label=''):
+    """Exigir no máximo ``queries`` consultas e ``rows`` linhas lidas dentro do bloco"""
+    with QueryRecorder() as recorder:
+        yield recorder
+    problems = recorder.violations(Budget(queries, rows))
+    if problems:
+        raise QueryBudgetExceeded(f"{label + ': ' if label else ''}{', '.join(problems)}\n{recorder.report()}")
+
+
+@click.command('query-budget')
+@click.option('--endpoint', 'endpoints', multiple=True, help='Verificar apenas este endpoint (repetível).')
+@click.option('--verbose', is_flag=True, help='Listar as consultas de todas as rotas, não só das que estouraram.')
+def query_budget_command(endpoints, verbose):
+    """Rodar a suíte de orçamento de consultas (banco temporário, o banco configurado não é usado)"""
+    if find_spec('pytest') is None or not os.path.exists(SUITE_PATH):
+        raise click.ClickException('A suíte precisa do pytest e da pasta tests (pip install -r requirements-dev.txt)')
+    args = [sys.executable, '-m', 'pytest', '-q', SUITE_PATH]
+    if endpoints:
+        args += ['-k', ' or '.join(f'[{endpoint}]' for endpoint in endpoints)]
+    if verbose:
+        args.append('-rA')
+    if subprocess.call(args, cwd=os.path.dirname(os.path.dirname(SUITE_PATH))):
+        raise click.ClickException('Orçamento de consultas estourado ou rota com erro (ver a saída do pytest)')
@@ -0,0 +1,283 @@
+"""Mineração das perguntas mais frequentes do chat (agrupamento de perguntas parecidas).
+
+O job lê as perguntas do chat em lotes por id (memória constante) e faz
+três passadas:
+
+1. frequência de documentos dos termos, para o IDF;
+2. k-means em mini-lotes (esférico, por similaridade de cosseno) sobre
+   vetores TF-IDF com *feature hashing* (``dimensions`` colunas, sem
+   vocabulário em memória);
+3. atribuição final: contagem por grupo, série mensal e as formulações mais
+   frequentes de cada grupo (Misra-Gries, com capacidade fixa por grupo).
+
+A memória fica limitada a ``batch_size × dimensions`` + ``clusters ×
+dimensions`` floats, independente do total de mensagens. Requer numpy,
+importado só quando o job roda (os workers web não carregam a biblioteca).
+"""
+import heapq
+import json
+import math
+import os
+import re
+import unicodedata
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from services.chat_shards import iter_message_batches
+
+np = None  # numpy, carregado por _load_numpy()
+
+REPORT_NAME = 'frequent-questions.json'
+TOKEN = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset('''
+    a o as os um uma uns umas de do da dos das no na nos nas em ao aos para por pelo pela com sem
+    e ou que se me eu voce voces ele ela isso esse essa este esta como qual quais quando onde
+    porque por que e ja nao sim mais muito tem ter ser foi sao seu sua meu minha preciso gostaria
+    saber favor ola oi bom dia tarde noite obrigado obrigada
+'''.split())
+
+
+def normalize_question(question):
+    """Minúsculas, sem acentos e sem pontuação (chave das formulações repetidas)"""
+    text = unicodedata.normalize('NFKD', question.lower())
+    return ' '.join(TOKEN.findall(''.join(c for c in text if not unicodedata.combining(c))))
+
+
+def _features(normalized, dimensions):
+    """Índices das colunas (palavras e bigramas) de uma pergunta já normalizada"""
+    words = [word for word in normalized.split() if word not in STOPWORDS and len(word) > 1]
+    terms = words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+    return [zlib.crc32(term.encode('utf-8')) % dimensions for term in terms]
+
+
+class _HeavyHitters:
+    """Itens mais frequentes de um fluxo com memória fixa (Misra-Gries)"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.examples = {}
+
+    def add(self, key, example):
+        if key in self.counts:
+            self.counts[key] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = 1
+            self.examples[key] = example
+        else:
+            for other in list(self.counts):
+                self.counts[other] -= 1
+                if not self.counts[other]:
+                    del self.counts[other]
+                    del self.examples[other]
+
+    def top(self, n):
+        return [(self.examples[key], count) for key, count in heapq.nlargest(n, self.counts.items(), key=lambda i: i[1])]
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError('A mineração de perguntas requer numpy (pip install numpy)') from None
+        np = numpy
+    return np
+
+
+def _iter_batches(batch_size, since=None):
+    """Perguntas em lotes por id crescente (em cada shard): (perguntas, datas de criação)"""
+    for rows in iter_message_batches(('question', 'created_at'), batch_size, since):
+        yield [row.question for row in rows], [row.created_at for row in rows]
+
+
+class _Vectorizer:
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self.document_frequency = np.zeros(dimensions, dtype=np.int64)
+        self.documents = 0
+        self.idf = None
+
+    def observe(self, normalized_questions):
+        for normalized in normalized_questions:
+            columns = np.unique(np.array(_features(normalized, self.dimensions), dtype=np.int64))
+            self.document_frequency[columns] += 1
+        self.documents += len(normalized_questions)
+
+    def finish(self):
+        self.idf = (np.log((1 + self.documents) / (1 + self.document_frequency)) + 1).astype(np.float32)
+
+    def transform(self, normalized_questions):
+        """Matriz (perguntas × dimensões) TF-IDF com linhas normalizadas (L2)"""
+        matrix = np.zeros((len(normalized_questions), self.dimensions), dtype=np.float32)
+        for row, normalized in enumerate(normalized_questions):
+            columns = _features(normalized, self.dimensions)
+            if columns:
+                np.add.at(matrix[row], columns, 1.0)
+        np.log1p(matrix, out=matrix)  # TF sublinear
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+def _init_centroids(matrix, clusters, rng):
+    """k-means++ sobre um lote (apenas linhas não nulas)"""
+    candidates = matrix[np.linalg.norm(matrix, axis=1) > 0]
+    if len(candidates) == 0:
+        return None
+    centroids = [candidates[rng.integers(len(candidates))]]
+    distance = 1 - candidates @ centroids[0]
+    for _ in range(1, min(clusters, len(candidates))):
+        weights = np.clip(distance, 0, None)
+        if weights.sum() <= 0:
+            break
+        centroids.append(candidates[rng.choice(len(candidates), p=weights / weights.sum())])
+        distance = np.minimum(distance, 1 - candidates @ centroids[-1])
+    return np.array(centroids, dtype=np.float32)
+
+
+def _minibatch_update(centroids, seen, matrix):
+    """Um passo do k-means em mini-lotes (Sculley, 2010) com centróides normalizados"""
+    matrix = matrix[np.linalg.norm(matrix, axis=1) > 0]
+    if len(matrix) == 0:
+        return
+    assignment = np.argmax(matrix @ centroids.T, axis=1)
+    membership = np.zeros((len(centroids), len(matrix)), dtype=np.float32)
+    membership[assignment, np.arange(len(matrix))] = 1
+    sums = membership @ matrix
+    counts = membership.sum(axis=1)
+    seen += counts
+    updated = counts > 0
+    rate = (counts[updated] / seen[updated])[:, None]
+    centroids[updated] = (1 - rate) * centroids[updated] + rate * (sums[updated] / counts[updated][:, None])
+    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    np.divide(centroids, norms, out=centroids, where=norms > 0)
+
+
+def mine_frequent_questions(clusters=30, batch_size=2000, dimensions=2048, epochs=1, days=None,
+                            examples=5, seed=42, echo=print):
+    """Agrupar as perguntas do chat e devolver o relatório com os grupos ordenados por volume"""
+    _load_numpy()
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    rng = np.random.default_rng(seed)
+    vectorizer = _Vectorizer(dimensions)
+
+    echo('Passada 1: frequência dos termos...')
+    for questions, _ in _iter_batches(batch_size, since):
+        vectorizer.observe([normalize_question(question) for question in questions])
+    if vectorizer.documents == 0:
+        return {'generated_at': datetime.utcnow().isoformat(), 'messages': 0, 'clusters': []}
+    vectorizer.finish()
+
+    echo(f'Passada 2: k-means em mini-lotes ({vectorizer.documents} perguntas)...')
+    centroids, seen = None, None
+    for _ in range(epochs):
+        for questions, _ in _iter_batches(batch_size, since):
+            matrix = vectorizer.transform([normalize_question(question) for question in questions])
+            if centroids is None:
+                centroids = _init_centroids(matrix, clusters, rng)
+                if centroids is None:
+                    continue
+                seen = np.zeros(len(centroids), dtype=np.float32)
+            _minibatch_update(centroids, seen, matrix)
+    if centroids is None:
+        return {'generated_at': datetime.utcnow().isoformat(), 'messages': vectorizer.documents, 'clusters': []}
+
+    echo('Passada 3: atribuição e tendências...')
+    k = len(centroids)
+    counts = np.zeros(k, dtype=np.int64)
+    similarity_sums = np.zeros(k, dtype=np.float64)
+    monthly = [Counter() for _ in range(k)]
+    phrasings = [_HeavyHitters(examples * 4) for _ in range(k)]
+    unclustered = 0
+    for questions, dates in _iter_batches(batch_size, since):
+        normalized = [normalize_question(question) for question in questions]
+        similarities = vectorizer.transform(normalized) @ centroids.T
+        assignment = np.argmax(similarities, axis=1)
+        best = similarities[np.arange(len(questions)), assignment]
+        for question, key, created_at, cluster, similarity in zip(questions, normalized, dates, assignment, best):
+            if similarity <= 0:
+                unclustered += 1  # sem termos relevantes (só saudações, por exemplo)
+                continue
+            counts[cluster] += 1
+            similarity_sums[cluster] += similarity
+            monthly[cluster][created_at.strftime('%Y-%m')] += 1
+            phrasings[cluster].add(key, question.strip())
+
+    report = []
+    for cluster in np.argsort(-counts):
+        if counts[cluster] == 0:
+            continue
+        months = sorted(monthly[cluster].items())
+        trend = None
+        if len(months) >= 2 and months[-2][1]:
+            trend = round((months[-1][1] - months[-2][1]) / months[-2][1], 3)
+        report.append({
+            'rank': len(report) + 1,
+            'count': int(counts[cluster]),
+            'share': round(int(counts[cluster]) / vectorizer.documents, 4),
+            'cohesion': round(float(similarity_sums[cluster] / counts[cluster]), 3),
+            'representative_questions': [
+                {'question': question, 'count': count} for question, count in phrasings[cluster].top(examples)
+            ],
+            'monthly': dict(months),
+            'trend': trend
+        })
+    return {
+        'generated_at': datetime.utcnow().isoformat(),
+        'messages': vectorizer.documents,
+        'unclustered': unclustered,
+        'since': since.isoformat() if since else None,
+        'clusters': report
+    }
+
+
+def report_path():
+    return os.path.join(current_app.config['ANALYTICS_DIR'], REPORT_NAME)
+
+
+def load_report():
+    """Último relatório gerado, ou None"""
+    try:
+        with open(report_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_report(report):
+    path = report_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(report, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+@click.command('mine-questions')
+@click.option('--clusters', type=int, default=30, show_default=True, help='Quantidade de grupos (k).')
+@click.option('--batch-size', type=int, default=2000, show_default=True, help='Perguntas lidas por lote.')
+@click.option('--dimensions', type=int, default=2048, show_default=True, help='Colunas do feature hashing.')
+@click.option('--epochs', type=int, default=1, show_default=True, help='Passadas do k-means sobre os dados.')
+@click.option('--days', type=int, default=None, help='Considerar apenas os últimos N dias.')
+@with_appcontext
+def mine_questions_command(clusters, batch_size, dimensions, epochs, days):
+    """Agrupar as perguntas do chat e gravar o relatório de perguntas frequentes"""
+    try:
+        _load_numpy()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    budget_mb = (batch_size + clusters * 2) * dimensions * 4 / 2 ** 20
+    click.echo(f'Memória das matrizes: ~{math.ceil(budget_mb)} MB')
+    report = mine_frequent_questions(clusters, batch_size, dimensions, epochs, days, echo=click.echo)
+    save_report(report)
+    click.echo(f"{len(report['clusters'])} grupos a partir de {report['messages']} perguntas")
+    for cluster in report['clusters'][:10]:
+        top = cluster['representative_questions'][0]['question'] if cluster['representative_questions'] else ''
+        click.echo(f"  #{cluster['rank']:<3} {cluster['count']:>8}  {top[:90]}")
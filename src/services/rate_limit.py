@@ -0,0 +1,79 @@
+"""Limite de requisições por usuário ou IP com token bucket no armazenamento compartilhado."""
+import math
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+
+from services.kv_store import get_store
+
+KEY_PREFIX = 'rate-limit:'
+
+
+def client_ip():
+    """IP do cliente, considerando apenas os proxies confiáveis configurados"""
+    proxy_count = current_app.config.get('RATE_LIMIT_PROXY_COUNT', 0)
+    route = request.access_route
+    if proxy_count and len(route) >= proxy_count:
+        return route[-proxy_count]
+    return request.remote_addr
+
+
+def _take_token(key, rate, per, burst):
+    """Consumir uma ficha do balde. Retorna 0 se permitido ou os segundos até a próxima ficha."""
+    refill_per_second = rate / per
+    result = {}
+
+    def consume(bucket):
+        now = time.time()
+        if bucket is None:
+            tokens = burst
+        else:
+            tokens = min(burst, bucket['tokens'] + (now - bucket['ts']) * refill_per_second)
+        if tokens >= 1:
+            tokens -= 1
+            result['retry_after'] = 0
+        else:
+            result['retry_after'] = (1 - tokens) / refill_per_second
+        return {'tokens': tokens, 'ts': now}
+
+    # Depois de encher por completo o balde equivale a um novo: pode expirar
+    get_store().update(key, consume, ttl=burst / refill_per_second)
+    return result['retry_after']
+
+
+def rate_limit(rate, per=60, burst=None, by='user'):
+    """Limitar a rota a ``rate`` requisições a cada ``per`` segundos, com rajada de ``burst``.
+
+    ``by``: 'user' (usuário logado, ou IP se anônimo) ou 'ip'.
+    """
+    burst = burst or rate
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+                return f(*args, **kwargs)
+
+            if by == 'user' and 'user_id' in session:
+                identity = f"user:{session['user_id']}"
+            else:
+                identity = f'ip:{client_ip()}'
+            key = f'{KEY_PREFIX}{request.endpoint}:{identity}'
+
+            try:
+                retry_after = _take_token(key, rate, per, burst)
+            except Exception as e:
+                # Falha no armazenamento não deve derrubar a rota
+                print(f"Erro no limite de requisições: {e}")
+                retry_after = 0
+
+            if retry_after:
+                seconds = int(math.ceil(retry_after))
+                return jsonify({
+                    'error': 'Too many requests',
+                    'message': f'Muitas requisições. Tente novamente em {seconds} segundos.'
+                }), 429, {'Retry-After': str(seconds)}
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
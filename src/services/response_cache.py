@@ -0,0 +1,161 @@
+"""Cache de respostas GET com ETag forte, Cache-Control e respostas 304.
+
+O corpo serializado fica em memória (LRU por worker). Cada entrada guarda a
+"geração" do seu namespace (e do usuário, para respostas por usuário); as
+gerações ficam no armazenamento compartilhado e são incrementadas depois do
+commit de qualquer alteração relevante, invalidando o cache em todos os
+workers sem que eles precisem conversar entre si.
+"""
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from database import User, MessagePackage, ChatMessage
+from services.compression import base_etag
+from services.kv_store import get_store
+
+GENERATION_PREFIX = 'cache-generation:'
+
+CachedResponse = namedtuple('CachedResponse', 'generation body mimetype etag')
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _generation(namespace, user_id=None):
+    store = get_store()
+    generation = (store.get(f'{GENERATION_PREFIX}ns:{namespace}') or 0,)
+    if user_id is not None:
+        generation += (store.get(f'{GENERATION_PREFIX}user:{user_id}') or 0,)
+    return generation
+
+
+def _bump(key):
+    get_store().update(GENERATION_PREFIX + key, lambda value: (value or 0) + 1)
+
+
+def invalidate_namespace(namespace):
+    _bump(f'ns:{namespace}')
+
+
+def invalidate_user_responses(user_ids):
+    for user_id in set(user_ids):
+        _bump(f'user:{user_id}')
+
+
+def _lookup(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry:
+            _cache.move_to_end(key)
+        return entry
+
+
+def _remember(key, entry):
+    with _cache_lock:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > current_app.config.get('RESPONSE_CACHE_SIZE', 512):
+            _cache.popitem(last=False)
+
+
+def _matching_etag(etag):
+    """ETag de If-None-Match que identifica a mesma resposta (com ou sem sufixo de compressão)"""
+    if_none_match = request.if_none_match
+    if if_none_match.contains_weak(etag):
+        return etag
+    for tag in if_none_match:
+        if base_etag(tag) == etag:
+            return tag
+    return None
+
+
+def cached_response(namespace, per_user=False, max_age=0):
+    """Guardar a resposta da rota em memória e responder 304 a requisições condicionais.
+
+    ``per_user``: a resposta depende do usuário logado (chave e geração por usuário,
+    ``Cache-Control: private``). ``max_age``: segundos que o navegador pode
+    reutilizar a resposta sem revalidar.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or not current_app.config.get('RESPONSE_CACHE_ENABLED', True):
+                return f(*args, **kwargs)
+
+            user_id = session.get('user_id') if per_user else None
+            generation = _generation(namespace, user_id)
+            key = (namespace, user_id, request.full_path)
+
+            entry = _lookup(key)
+            if entry is None or entry.generation != generation:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = CachedResponse(generation, body, response.mimetype, hashlib.sha1(body).hexdigest())
+                _remember(key, entry)
+
+            # O cliente devolve o ETag que recebeu, com o sufixo da compressão se a
+            # resposta veio compactada; o 304 repete esse mesmo ETag
+            matched = _matching_etag(entry.etag)
+            if matched:
+                response = current_app.response_class(status=304)
+                response.set_etag(matched)
+            else:
+                response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+                response.set_etag(entry.etag)
+            response.headers['Cache-Control'] = (
+                f"{'private' if per_user else 'public'}, max-age={max_age}, must-revalidate"
+            )
+            if per_user:
+                response.vary.add('Cookie')
+            return response
+        return decorated_function
+    return decorator
+
+
+# Invalidação automática: marcar durante o flush, incrementar gerações após o commit
+
+def _pending(target):
+    session = object_session(target)
+    return session.info.setdefault('response_cache_pending', {'namespaces': set(), 'users': set()})
+
+
+@event.listens_for(MessagePackage, 'after_insert')
+@event.listens_for(MessagePackage, 'after_update')
+@event.listens_for(MessagePackage, 'after_delete')
+def _package_changed(mapper, connection, target):
+    _pending(target)['namespaces'].add('packages')
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    _pending(target)['users'].add(target.id)
+
+
+@event.listens_for(ChatMessage, 'after_insert')
+@event.listens_for(ChatMessage, 'after_delete')
+def _chat_message_changed(mapper, connection, target):
+    _pending(target)['users'].add(target.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _flush_invalidations(session):
+    pending = session.info.pop('response_cache_pending', None)
+    if not pending:
+        return
+    for namespace in pending['namespaces']:
+        invalidate_namespace(namespace)
+    invalidate_user_responses(pending['users'])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop('response_cache_pending', None)
@@ -0,0 +1,176 @@
+"""Agendador de tarefas periódicas dentro da aplicação, com um líder entre os workers.
+
+Cada processo tem uma thread que a cada ``SCHEDULER_TICK`` segundos tenta
+obter (ou renovar) a liderança: uma chave no armazenamento compartilhado com
+prazo ``SCHEDULER_LEASE``. Só o líder executa as tarefas; se ele morrer, a
+chave expira e outro worker assume.
+
+As tarefas são registradas com :func:`register_job`. Próxima execução,
+duração, contagens e último erro ficam no armazenamento compartilhado (o
+agendamento sobrevive a reinícios e troca de líder) e cada execução segura
+uma trava própria, então a mesma tarefa nunca roda em paralelo, nem quando
+disparada à mão com ``flask --app src.main run-maintenance``.
+"""
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+
+from flask import current_app
+
+from database import db
+from services.kv_store import get_store
+
+LEADER_KEY = 'scheduler:leader'
+JOB_LOCK_PREFIX = 'scheduler:running:'
+JOB_STATE_PREFIX = 'scheduler:job:'
+
+_jobs = {}
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+class Job:
+    def __init__(self, name, fn, interval, jitter, timeout):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+
+    def interval_seconds(self):
+        # Intervalo fixo ou nome de uma chave da configuração
+        if isinstance(self.interval, str):
+            return float(current_app.config[self.interval])
+        return float(self.interval)
+
+    def next_run_after(self, now):
+        interval = self.interval_seconds()
+        return now + interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+def register_job(name, interval, jitter=0.1, timeout=3600):
+    """Registrar uma tarefa periódica (``interval`` em segundos ou chave da configuração)"""
+    def decorator(fn):
+        _jobs[name] = Job(name, fn, interval, jitter, timeout)
+        return fn
+    return decorator
+
+
+def get_jobs():
+    return dict(_jobs)
+
+
+def _identity():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _hold_leadership(store, lease):
+    """Obter ou renovar a liderança; apenas o dono renova a própria chave"""
+    identity = _identity()
+    if store.get(LEADER_KEY) == identity:
+        return store.update(LEADER_KEY, lambda current: identity if current in (None, identity) else current,
+                            ttl=lease) == identity
+    return store.add(LEADER_KEY, identity, ttl=lease)
+
+
+def run_job(job):
+    """Executar uma tarefa agora, com trava contra sobreposição e registro de métricas.
+
+    Retorna o estado atualizado da tarefa, ou None se ela já estava em execução.
+    """
+    store = get_store()
+    lock_key = JOB_LOCK_PREFIX + job.name
+    token = f'{_identity()}:{uuid.uuid4().hex[:8]}'
+    if not store.add(lock_key, token, ttl=job.timeout):
+        return None
+
+    started_at = time.time()
+    started = time.perf_counter()
+    result, error = None, None
+    try:
+        result = job.fn()
+    except Exception as e:
+        db.session.rollback()
+        error = f'{type(e).__name__}: {e}'
+    finally:
+        store.update(lock_key, lambda current: None if current == token else current, ttl=job.timeout)
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def record(state):
+        state = state or {'runs': 0, 'failures': 0}
+        state.update({
+            'runs': state['runs'] + 1,
+            'failures': state['failures'] + (1 if error else 0),
+            'last_started_at': started_at,
+            'last_duration_ms': duration_ms,
+            'last_result': result,
+            'last_error': error,
+            'last_runner': _identity(),
+            'next_run_at': job.next_run_after(time.time())
+        })
+        return state
+    state = store.update(JOB_STATE_PREFIX + job.name, record)
+    if error:
+        print(f"Erro na tarefa agendada {job.name}: {error}")
+    return state
+
+
+def run_due_jobs(lease):
+    """Executar as tarefas vencidas (apenas no líder); retorna os nomes executados"""
+    store = get_store()
+    executed = []
+    for job in list(_jobs.values()):
+        # Renovar antes de cada tarefa: uma tarefa longa não pode deixar a liderança expirar em silêncio
+        if not _hold_leadership(store, lease):
+            break
+        state = store.get(JOB_STATE_PREFIX + job.name)
+        now = time.time()
+        if state is None:
+            # Primeira vez: espalhar o início em vez de rodar tudo junto no boot
+            store.add(JOB_STATE_PREFIX + job.name, {
+                'runs': 0, 'failures': 0,
+                'next_run_at': now + job.interval_seconds() * job.jitter * random.random()
+            })
+            continue
+        if state.get('next_run_at', 0) <= now and run_job(job) is not None:
+            executed.append(job.name)
+    return executed
+
+
+def scheduler_status():
+    """Líder atual e estado de cada tarefa registrada"""
+    store = get_store()
+    jobs = []
+    for job in _jobs.values():
+        state = store.get(JOB_STATE_PREFIX + job.name) or {}
+        jobs.append(dict(state, name=job.name, interval=job.interval_seconds(),
+                         running=store.get(JOB_LOCK_PREFIX + job.name) is not None))
+    return {'leader': store.get(LEADER_KEY), 'jobs': jobs}
+
+
+def _schedule_forever(app):
+    while True:
+        tick = app.config['SCHEDULER_TICK']
+        time.sleep(tick * (1 + random.uniform(-0.2, 0.2)))
+        try:
+            with app.app_context():
+                if _hold_leadership(get_store(), app.config['SCHEDULER_LEASE']):
+                    run_due_jobs(app.config['SCHEDULER_LEASE'])
+        except Exception as e:
+            print(f"Erro no agendador de tarefas: {e}")
+
+
+def init_scheduler(app):
+    """Iniciar a thread do agendador nos processos que atendem requisições (após o fork)"""
+    @app.before_request
+    def _start_scheduler():
+        global _scheduler_pid
+        if not app.config.get('SCHEDULER_ENABLED', True) or _scheduler_pid == os.getpid():
+            return
+        with _scheduler_lock:
+            if _scheduler_pid != os.getpid():
+                threading.Thread(target=_schedule_forever, args=(app,), name='scheduler', daemon=True).start()
+                _scheduler_pid = os.getpid()
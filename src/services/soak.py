@@ -0,0 +1,285 @@
+"""Teste de resistência (soak): muitas requisições simuladas dentro do processo, medindo a memória.
+
+Uma mistura ponderada de requisições (``SCENARIO``: chat com corpos grandes
+de vez em quando, histórico, recuperação de senha, login, telas de admin...)
+é enviada por clientes de teste, um por usuário local, com o LLM trocado por
+um stub. A cada ``--sample-every`` requisições, após um ``gc.collect()``,
+registram-se o RSS do processo, a memória rastreada pelo ``tracemalloc`` e
+quantas instâncias de modelos ORM continuam vivas.
+
+Depois do aquecimento o crescimento é a inclinação (mínimos quadrados) de
+cada série por 10 mil requisições. Acima dos limites o comando falha e lista
+os pontos de alocação que mais cresceram desde o fim do aquecimento (com o
+quadro do código da aplicação que os originou) e os modelos ORM acumulados.
+
+O teste grava no banco (mensagens, transações, saldos): use ``DATABASE_URL``
+apontando para uma cópia ou para dados de ``flask generate-data``.
+"""
+import gc
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from database import db, User
+from services.harness import harness_config, open_isolated
+
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_ANSWER = ('Resposta simulada do assistente para o teste de resistência. ' * 12).strip()
+LARGE_QUESTION_EVERY = 20
+LARGE_QUESTION_CHARS = 20000
+
+# (peso, nome, método, caminho, admin?)
+SCENARIO = [
+    (30, 'chat', 'POST', '/chat', False),
+    (15, 'chat_history', 'GET', '/chat/history?page=1&per_page=20', False),
+    (8, 'chat_stats', 'GET', '/chat/stats', False),
+    (8, 'profile', 'GET', '/profile', False),
+    (5, 'packages', 'GET', '/packages', False),
+    (5, 'transactions', 'GET', '/transactions', False),
+    (5, 'forgot_password', 'POST', '/auth/forgot-password', False),
+    (3, 'validate_reset_token', 'POST', '/auth/validate-reset-token', False),
+    (2, 'login', 'POST', '/login', False),
+    (3, 'admin_dashboard', 'GET', '/admin/dashboard', True),
+    (3, 'admin_users', 'GET', '/admin/users?page=1&per_page=50', True),
+    (3, 'admin_recent', 'GET', '/admin/messages/recent', True),
+    (3, 'admin_chat_history', 'GET', '/admin/chat/history?page=1&per_page=20', True),
+    (2, 'admin_transactions', 'GET', '/admin/transactions?page=1&per_page=50', True),
+]
+
+
+def rss_bytes():
+    """Memória residente atual do processo (pico, fora do Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def orm_instance_counts():
+    """Instâncias vivas de cada modelo ORM"""
+    return Counter(type(obj).__name__ for obj in gc.get_objects() if isinstance(obj, db.Model))
+
+
+def growth_per_10k(samples, key):
+    """Inclinação da série por 10 mil requisições (mínimos quadrados)"""
+    if len(samples) < 2:
+        return 0.0
+    slope, _ = statistics.linear_regression([s['requests'] for s in samples], [s[key] for s in samples])
+    return slope * 10000
+
+
+def _app_frame(traceback):
+    for frame in reversed(traceback):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(SOURCE_ROOT) and filename != os.path.abspath(__file__):
+            return f'{os.path.relpath(filename, SOURCE_ROOT)}:{frame.lineno}'
+    return None
+
+
+def allocation_growth(baseline, snapshot, top):
+    """Pontos de alocação que mais cresceram entre dois snapshots do tracemalloc"""
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+    ])
+    sites = []
+    for stat in snapshot.compare_to(baseline, 'traceback')[:top]:
+        if stat.size_diff <= 0:
+            break
+        frame = stat.traceback[-1]
+        sites.append({
+            'site': f'{frame.filename}:{frame.lineno}',
+            'app_frame': _app_frame(stat.traceback),
+            'size_diff_kb': round(stat.size_diff / 1024, 1),
+            'count_diff': stat.count_diff
+        })
+    return sites
+
+
+def _snapshot():
+    gc.collect()
+    return tracemalloc.take_snapshot()
+
+
+class _Driver:
+    """Envia as requisições do cenário com um cliente de teste por usuário"""
+
+    def __init__(self, app, users, admin, password, seed):
+        self.app = app
+        self.users = users
+        self.admin = admin
+        self.password = password
+        self.random = random.Random(seed)
+        self.clients = {}
+        self.tokens = []
+        self.chats = 0
+        self.statuses = Counter()
+        self.weights = [weight for weight, *_ in SCENARIO]
+
+    def _client(self, user_id):
+        if user_id not in self.clients:
+            client = self.app.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = user_id
+            self.clients[user_id] = client
+        return self.clients[user_id]
+
+    def _body(self, name, user):
+        if name == 'chat':
+            self.chats += 1
+            if self.chats % LARGE_QUESTION_EVERY == 0:
+                return {'question': ('Pergunta longa sobre o pedido ' * 700)[:LARGE_QUESTION_CHARS]}
+            return {'question': f'Pergunta {self.chats} sobre prazos e entregas?'}
+        if name == 'forgot_password':
+            return {'email': user[2]}
+        if name == 'validate_reset_token':
+            token = self.tokens.pop() if self.tokens else uuid.uuid4().hex
+            return {'token': token}
+        if name == 'login':
+            return {'username': user[1], 'password': self.password}
+        return None
+
+    def step(self):
+        _, name, method, path, as_admin = self.random.choices(SCENARIO, weights=self.weights)[0]
+        user = self.admin if as_admin else self.random.choice(self.users)
+        client = self.app.test_client() if name == 'login' else self._client(user[0])
+        headers = {'Idempotency-Key': uuid.uuid4().hex} if name == 'chat' and self.chats % 2 else {}
+        response = open_isolated(self.app, client, path, method=method, json=self._body(name, user), headers=headers)
+        if name == 'forgot_password' and response.status_code == 200:
+            link = (response.get_json(silent=True) or {}).get('reset_link')
+            if link and len(self.tokens) < 100:
+                self.tokens.append(link.rsplit('token=', 1)[-1])
+        self.statuses[f'{name} {response.status_code}'] += 1
+        response.close()
+
+
+def run_soak(requests, warmup, sample_every, users=20, frames=10, top=15, password='senha123', seed=0, report=None):
+    """Executar o teste; retorna amostras, crescimentos, pontos de alocação e status"""
+    app = current_app._get_current_object()
+    clients = db.session.query(User.id, User.username, User.email)\
+        .filter(User.user_type == 'client', User.is_active.is_(True)).order_by(User.id).limit(users).all()
+    admin = db.session.query(User.id, User.username, User.email)\
+        .filter(User.user_type == 'admin', User.is_active.is_(True)).order_by(User.id).first()
+    if not clients or not admin:
+        raise click.ClickException('São necessários um admin e clientes ativos (ver flask generate-data)')
+    # Saldo suficiente para o chat não virar só respostas 402
+    User.query.filter(User.id.in_([user.id for user in clients]), User.message_balance < requests)\
+        .update({'message_balance': requests}, synchronize_session=False)
+    db.session.commit()
+    db.session.remove()
+
+    driver = _Driver(app, [tuple(user) for user in clients], tuple(admin), password, seed)
+    samples = []
+    with harness_config(app, lambda messages, **options: STUB_ANSWER):
+        tracemalloc.start(frames)
+        try:
+            # Sem aquecimento a referência é o estado antes da primeira requisição
+            baseline = None if warmup else _snapshot()
+            started = time.perf_counter()
+            for done in range(1, warmup + requests + 1):
+                driver.step()
+                if done == warmup:
+                    baseline = _snapshot()
+                if done >= warmup and (done - warmup) % sample_every == 0:
+                    gc.collect()
+                    orm = orm_instance_counts()
+                    sample = {
+                        'requests': done - warmup,
+                        'elapsed_s': round(time.perf_counter() - started, 1),
+                        'rss_mb': round(rss_bytes() / 2 ** 20, 2),
+                        'traced_mb': round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 2),
+                        'orm_instances': sum(orm.values()),
+                        'orm': dict(orm)
+                    }
+                    samples.append(sample)
+                    if report:
+                        report(sample)
+            sites = allocation_growth(baseline, _snapshot(), top)
+        finally:
+            tracemalloc.stop()
+
+    first, last = samples[0]['orm'], samples[-1]['orm']
+    orm_growth = {name: last.get(name, 0) - first.get(name, 0) for name in set(first) | set(last)}
+    return {
+        'samples': samples,
+        'growth_per_10k': {
+            'rss_mb': round(growth_per_10k(samples, 'rss_mb'), 3),
+            'traced_mb': round(growth_per_10k(samples, 'traced_mb'), 3),
+            'orm_instances': round(growth_per_10k(samples, 'orm_instances'), 1)
+        },
+        'orm_growth': {name: diff for name, diff in orm_growth.items() if diff > 0},
+        'allocation_sites': sites,
+        'statuses': dict(driver.statuses)
+    }
+
+
+@click.command('soak-test')
+@click.option('--requests', 'total', type=int, default=50000, show_default=True, help='Requisições medidas (após o aquecimento).')
+@click.option('--warmup', type=click.IntRange(min=0), default=2000, show_default=True,
+              help='Requisições antes da primeira medição (0: mede desde o início).')
+@click.option('--sample-every', type=int, default=5000, show_default=True)
+@click.option('--users', type=int, default=20, show_default=True, help='Clientes locais usados no cenário.')
+@click.option('--password', default='senha123', show_default=True, help='Senha dos clientes locais (login).')
+@click.option('--frames', type=int, default=10, show_default=True, help='Profundidade das pilhas do tracemalloc.')
+@click.option('--top', type=int, default=15, show_default=True, help='Pontos de alocação listados.')
+@click.option('--seed', type=int, default=0, show_default=True)
+@click.option('--max-rss-growth', type=float, default=8.0, show_default=True, help='MB de RSS por 10 mil requisições.')
+@click.option('--max-traced-growth', type=float, default=2.0, show_default=True,
+              help='MB rastreados pelo tracemalloc por 10 mil requisições.')
+@click.option('--max-orm-growth', type=float, default=50, show_default=True,
+              help='Instâncias ORM vivas a mais por 10 mil requisições.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Gravar o relatório em JSON.')
+@with_appcontext
+def soak_test_command(total, warmup, sample_every, users, password, frames, top, seed,
+                      max_rss_growth, max_traced_growth, max_orm_growth, output):
+    """Simular muitas requisições e falhar se a memória crescer com o volume"""
+    if total < 2 * sample_every:
+        raise click.ClickException('--requests precisa cobrir ao menos duas amostras (2 x --sample-every)')
+    click.echo(f"{'requisições':>12} {'tempo':>8} {'req/s':>7} {'RSS MB':>9} {'traced MB':>10} {'ORM vivos':>10}")
+
+    def report(sample):
+        rate = (sample['requests'] + warmup) / sample['elapsed_s'] if sample['elapsed_s'] else 0
+        click.echo(f"{sample['requests']:>12} {sample['elapsed_s']:>7}s {rate:>7.0f} {sample['rss_mb']:>9} "
+                   f"{sample['traced_mb']:>10} {sample['orm_instances']:>10}")
+
+    result = run_soak(total, warmup, sample_every, users=users, frames=frames, top=top,
+                      password=password, seed=seed, report=report)
+    growth = result['growth_per_10k']
+    click.echo(f"\nCrescimento por 10 mil requisições: RSS {growth['rss_mb']:+.2f} MB, "
+               f"tracemalloc {growth['traced_mb']:+.2f} MB, ORM {growth['orm_instances']:+.0f} instâncias")
+    errors = sorted((key, count) for key, count in result['statuses'].items() if key.endswith(('500', '503')))
+    if errors:
+        click.echo('Respostas com erro: ' + ', '.join(f'{key} x{count}' for key, count in errors))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    if growth['rss_mb'] > max_rss_growth:
+        failures.append(f"RSS {growth['rss_mb']:+.2f} MB")
+    if growth['traced_mb'] > max_traced_growth:
+        failures.append(f"tracemalloc {growth['traced_mb']:+.2f} MB")
+    if growth['orm_instances'] > max_orm_growth:
+        failures.append(f"ORM {growth['orm_instances']:+.0f} instâncias")
+    if failures:
+        if not result['allocation_sites'] or growth['traced_mb'] <= max_traced_growth / 4:
+            click.echo('\nO heap do Python quase não cresceu: o RSS a mais vem de fora dele (extensões em C, '
+                       'cache do SQLite, fragmentação) ou de um aquecimento curto demais.')
+        click.echo('\nPontos de alocação que mais cresceram:')
+        for site in result['allocation_sites']:
+            origin = f"  (via {site['app_frame']})" if site['app_frame'] and site['app_frame'] not in site['site'] else ''
+            click.echo(f"  {site['size_diff_kb']:>10} KB {site['count_diff']:>+8}  {site['site']}{origin}")
+        if result['orm_growth']:
+            click.echo('Modelos ORM acumulados: ' + ', '.join(f'{name} +{diff}' for name, diff in sorted(result['orm_growth'].items())))
+        raise click.ClickException('Crescimento de memória acima do limite: ' + ', '.join(failures))
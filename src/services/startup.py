@@ -0,0 +1,94 @@
+"""Diagnóstico do tempo de inicialização da aplicação."""
+import importlib
+import os
+import subprocess
+import sys
+import time
+
+import click
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StartupTimer:
+    """Marcar o tempo de cada etapa da inicialização (ativo com STARTUP_PROFILE=1)"""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.started = self.last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase):
+        if self.enabled:
+            now = time.perf_counter()
+            self.phases.append((phase, (now - self.last) * 1000))
+            self.last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        print('Inicialização por etapa (ms):')
+        for phase, elapsed in self.phases:
+            print(f'  {elapsed:9.1f}  {phase}')
+        print(f'  {(time.perf_counter() - self.started) * 1000:9.1f}  total')
+
+
+class LazyCommand(click.Command):
+    """Comando da CLI cujo módulo só é importado quando o comando roda ou mostra a ajuda.
+
+    ``target`` é 'módulo:atributo'; parâmetros, ajuda e execução vêm do
+    comando real, carregado no primeiro uso.
+    """
+
+    def __init__(self, name, target):
+        super().__init__(name)
+        self.target = target
+        self._command = None
+
+    def _load(self):
+        if self._command is None:
+            module, attribute = self.target.split(':')
+            self._command = getattr(importlib.import_module(module), attribute)
+            self.help = self._command.help
+        return self._command
+
+    def get_params(self, ctx):
+        return self._load().get_params(ctx)
+
+    def get_short_help_str(self, limit=45):
+        return self._load().get_short_help_str(limit)
+
+    def invoke(self, ctx):
+        return self._load().invoke(ctx)
+
+
+def import_costs(module='src.main'):
+    """Importar o módulo em um processo novo com ``-X importtime``.
+
+    Retorna (saída do processo, [(módulo, próprio_us, acumulado_us), ...]).
+    """
+    env = dict(os.environ, STARTUP_PROFILE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True
+    )
+    costs = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        costs.append((name.strip(), int(self_us), int(cumulative_us)))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return result.stdout, costs
+
+
+@click.command('startup-profile')
+@click.option('--top', type=int, default=25, help='Quantidade de módulos listados.')
+def startup_profile_command(top):
+    """Medir etapas da inicialização e os imports mais caros da aplicação"""
+    output, costs = import_costs()
+    click.echo(output.rstrip())
+    click.echo(f'\nImports mais caros (acumulado, ms) - {len(costs)} módulos:')
+    for name, self_us, cumulative_us in sorted(costs, key=lambda c: c[2], reverse=True)[:top]:
+        click.echo(f'  {cumulative_us / 1000:9.1f}  (próprio {self_us / 1000:7.1f})  {name}')
@@ -0,0 +1,122 @@
+"""Servir o frontend a partir de um manifesto da pasta estática montado na inicialização.
+
+Arquivos pequenos ficam em memória junto com variantes gzip/brotli geradas uma
+única vez (ou lidas de ``.gz``/``.br`` já existentes ao lado do arquivo).
+Assets com hash no nome (gerados pelo Vite) recebem cache de um ano
+``immutable``; ``index.html`` é sempre revalidado.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_file
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele, apenas gzip
+    brotli = None
+
+# Nome com hash de conteúdo do Vite (8 caracteres, só em assets/): assets/index-DXp3pH_h.js,
+# assets/sensus-logo-BxmOMpT4.png; apple-touch-icon.png na raiz não é imutável
+HASHED_NAME = re.compile(r'^assets/(?:.+/)?[^/]+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'image/x-icon',
+                      'image/vnd.microsoft.icon')
+MAX_IN_MEMORY_SIZE = 2 * 1024 * 1024
+MIN_COMPRESS_SIZE = 512
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+INDEX_CACHE = 'no-cache'
+DEFAULT_CACHE = 'public, max-age=3600'
+
+
+class StaticAsset:
+    def __init__(self, path, full_path, mimetype, cache_control):
+        self.path = path
+        self.full_path = full_path
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.variants = {}  # codificação ('identity', 'gzip', 'br') -> (corpo, etag)
+
+    def add_variant(self, encoding, body):
+        self.variants[encoding] = (body, hashlib.sha1(body).hexdigest())
+
+
+def _compressible(mimetype):
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def build_manifest(static_folder):
+    """Percorrer a pasta estática uma vez e montar o manifesto (caminho relativo -> StaticAsset)"""
+    manifest = {}
+    if not static_folder or not os.path.isdir(static_folder):
+        return manifest
+
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if name.endswith(('.gz', '.br')):
+                continue
+            full_path = os.path.join(root, name)
+            path = os.path.relpath(full_path, static_folder).replace(os.sep, '/')
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+            if path == 'index.html':
+                cache_control = INDEX_CACHE
+            elif HASHED_NAME.match(path):
+                cache_control = IMMUTABLE_CACHE
+            else:
+                cache_control = DEFAULT_CACHE
+
+            asset = StaticAsset(path, full_path, mimetype, cache_control)
+            manifest[path] = asset
+            if os.path.getsize(full_path) > MAX_IN_MEMORY_SIZE:
+                continue  # servido do disco, sem variantes
+
+            body = _read(full_path)
+            asset.add_variant('identity', body)
+            if not _compressible(mimetype) or len(body) < MIN_COMPRESS_SIZE:
+                continue
+
+            # Variantes pré-geradas no build têm prioridade
+            if os.path.exists(full_path + '.gz'):
+                asset.add_variant('gzip', _read(full_path + '.gz'))
+            else:
+                asset.add_variant('gzip', gzip.compress(body, compresslevel=9, mtime=0))
+            if os.path.exists(full_path + '.br'):
+                asset.add_variant('br', _read(full_path + '.br'))
+            elif brotli:
+                asset.add_variant('br', brotli.compress(body, quality=11))
+    return manifest
+
+
+def _negotiate(asset):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.variants and accepted[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+def serve_asset(asset):
+    """Resposta para um asset do manifesto, com a melhor codificação aceita pelo cliente"""
+    if not asset.variants:
+        response = send_file(asset.full_path, mimetype=asset.mimetype, conditional=True, etag=True)
+        response.headers['Cache-Control'] = asset.cache_control
+        return response
+
+    encoding = _negotiate(asset)
+    body, etag = asset.variants[encoding]
+    response = current_app.response_class(body, mimetype=asset.mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    if len(asset.variants) > 1:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = asset.cache_control
+    return response.make_conditional(request)
@@ -0,0 +1,185 @@
+"""Gerador de dados sintéticos para testar o desempenho em escala de produção.
+
+Popula o banco configurado (use ``DATABASE_URL`` para apontar para um arquivo
+SQLite separado) com usuários, transações e mensagens de chat:
+
+- uso concentrado: o peso de cada usuário segue uma lei de potência (Zipf),
+  então poucos usuários "pesados" têm a maior parte das mensagens;
+- meses de histórico, com o volume diário crescendo ao longo do período;
+- perguntas e respostas com tamanhos variados, montadas a partir de trechos
+  do domínio (Datasul, Sensus).
+
+As linhas são gravadas com ``executemany`` direto na conexão SQLite, em
+lotes, para chegar a 10^7 mensagens em tempo razoável. Todos os usuários
+compartilham o mesmo hash de senha (``senha123``).
+"""
+import itertools
+import random
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+
+from database import db, User, MessagePackage, Transaction, ChatMessage
+from services.passwords import hash_password
+
+INSERT_BATCH_SIZE = 50000
+SQLITE_DATETIME = '%Y-%m-%d %H:%M:%S.%f'
+
+QUESTION_PARTS = [
+    'Como configurar', 'Qual o procedimento para', 'Onde encontro', 'Por que ocorre erro ao',
+    'É possível automatizar', 'Como integrar', 'Quais parâmetros afetam'
+]
+QUESTION_TOPICS = [
+    'o Bloco K no Datasul', 'a emissão de NFe', 'o cálculo do MRP', 'o apontamento de produção',
+    'a coleta de dados com Android', 'o app Entrega EPI', 'o checklist de manutenção',
+    'o fechamento de estoque', 'os eventos do E-Social', 'a integração com o ERP'
+]
+ANSWER_SENTENCES = [
+    'Acesse o programa de parâmetros do módulo e revise as configurações da empresa.',
+    'Verifique se o período fiscal está aberto antes de processar os movimentos.',
+    'A Sensus pode apoiar a implantação com consultoria especializada.',
+    'Recomenda-se validar o cadastro de itens e as unidades de medida.',
+    'Os coletores de dados enviam os apontamentos em tempo real para o ERP.',
+    'Depois da alteração, reprocesse as transações pendentes do período.',
+    'Consulte o log de integração para identificar o registro com falha.',
+    'Em caso de dúvida, entre em contato com o suporte: (47) 3029-2866.'
+]
+
+
+def _text_samples(rng, count):
+    """Pares (pergunta, resposta) pré-montados, com tamanhos de resposta bem variados"""
+    samples = []
+    for _ in range(count):
+        question = f'{rng.choice(QUESTION_PARTS)} {rng.choice(QUESTION_TOPICS)}?'
+        if rng.random() < 0.3:
+            question += ' ' + ' '.join(rng.choices(ANSWER_SENTENCES, k=rng.randint(1, 4)))
+        sentences = max(1, int(rng.lognormvariate(1.6, 0.6)))
+        samples.append((question, ' '.join(rng.choices(ANSWER_SENTENCES, k=sentences))))
+    return samples
+
+
+def _zipf_weights(count, exponent):
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def _daily_counts(total, days, growth):
+    """Distribuir ``total`` entre os dias com volume crescendo linearmente ao longo do período"""
+    weights = [1 + growth * day / max(days - 1, 1) for day in range(days)]
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    counts[-1] += total - sum(counts)
+    return counts
+
+
+def _insert_rows(cursor, sql, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + INSERT_BATCH_SIZE])
+
+
+def generate_dataset(messages, users=None, transactions=None, months=6, skew=1.1, growth=2.0, seed=42, echo=print):
+    """Gerar o conjunto de dados no banco da aplicação; retorna as quantidades inseridas"""
+    rng = random.Random(seed)
+    users = users or max(10, messages // 100)
+    transactions = transactions if transactions is not None else max(1, messages // 50)
+    now = datetime.utcnow().replace(microsecond=0)
+    start = now - timedelta(days=30 * months)
+    days = (now - start).days
+
+    db.create_all()
+    if MessagePackage.query.count() == 0:
+        db.session.add_all([
+            MessagePackage(name='Pacote Básico', message_count=500, price=49.90),
+            MessagePackage(name='Pacote Intermediário', message_count=1000, price=90.00),
+            MessagePackage(name='Pacote Avançado', message_count=2000, price=160.00),
+            MessagePackage(name='Pacote Premium', message_count=5000, price=350.00)
+        ])
+        db.session.commit()
+    packages = [(package.id, package.price) for package in MessagePackage.query.all()]
+    password_hash = hash_password('senha123')
+    if User.query.filter_by(user_type='admin').first() is None:
+        db.session.add(User(username='admin', email='admin@sensustec.com.br', user_type='admin',
+                            message_balance=1000, password_hash=password_hash))
+        db.session.commit()
+
+    raw = db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        # Apenas para a carga: sem fsync por lote
+        cursor.execute('PRAGMA synchronous=OFF')
+        first_id = (cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{User.__tablename__}"').fetchone()[0]) + 1
+        user_ids = list(range(first_id, first_id + users))
+
+        echo(f'Inserindo {users} usuários...')
+        user_rows = []
+        for user_id in user_ids:
+            created_at = start - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399))
+            user_rows.append((
+                user_id, f'user{user_id:07d}', f'user{user_id:07d}@exemplo.com.br', password_hash,
+                'client', rng.randint(0, 5000), created_at.strftime(SQLITE_DATETIME), int(rng.random() > 0.05)
+            ))
+        _insert_rows(cursor, f'INSERT INTO "{User.__tablename__}" (id, username, email, password_hash, user_type, '
+                             'message_balance, created_at, is_active) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', user_rows)
+        raw.commit()
+
+        # Os primeiros usuários gerados são os mais pesados
+        cum_weights = _zipf_weights(users, skew)
+
+        echo(f'Inserindo {transactions} transações...')
+        transaction_rows = []
+        for user_id in rng.choices(user_ids, cum_weights=cum_weights, k=transactions):
+            package_id, price = rng.choice(packages)
+            created_at = start + timedelta(seconds=rng.randint(0, days * 86400))
+            status = 'completed' if rng.random() < 0.9 else rng.choice(('pending', 'failed'))
+            transaction_rows.append((
+                user_id, package_id, price, status,
+                created_at.strftime(SQLITE_DATETIME)
+            ))
+        transaction_rows.sort(key=lambda row: row[4])
+        _insert_rows(cursor, f'INSERT INTO "{Transaction.__tablename__}" (user_id, package_id, amount, status, '
+                             'created_at) VALUES (?, ?, ?, ?, ?)', transaction_rows)
+        raw.commit()
+
+        echo(f'Inserindo {messages} mensagens em {days} dias...')
+        samples = _text_samples(rng, 1000)
+        sql = (f'INSERT INTO "{ChatMessage.__tablename__}" (user_id, question, answer, created_at) '
+               'VALUES (?, ?, ?, ?)')
+        batch, inserted = [], 0
+        for day, count in enumerate(_daily_counts(messages, days, growth)):
+            day_start = start + timedelta(days=day)
+            authors = rng.choices(user_ids, cum_weights=cum_weights, k=count)
+            for offset, user_id in zip(sorted(rng.randint(0, 86399) for _ in range(count)), authors):
+                question, answer = rng.choice(samples)
+                batch.append((user_id, question, answer, (day_start + timedelta(seconds=offset)).strftime(SQLITE_DATETIME)))
+            if len(batch) >= INSERT_BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                raw.commit()
+                inserted += len(batch)
+                batch = []
+                echo(f'  {inserted}/{messages}')
+        if batch:
+            cursor.executemany(sql, batch)
+            raw.commit()
+        cursor.execute('ANALYZE')
+        raw.commit()
+    finally:
+        raw.close()
+
+    return {'users': users, 'transactions': transactions, 'messages': messages, 'heaviest_user_id': user_ids[0]}
+
+
+@click.command('generate-data')
+@click.option('--messages', type=int, default=100000, show_default=True, help='Mensagens de chat geradas.')
+@click.option('--users', type=int, default=None, help='Usuários gerados (padrão: mensagens / 100).')
+@click.option('--transactions', type=int, default=None, help='Transações geradas (padrão: mensagens / 50).')
+@click.option('--months', type=int, default=6, show_default=True, help='Meses de histórico.')
+@click.option('--skew', type=float, default=1.1, show_default=True, help='Expoente Zipf da concentração por usuário.')
+@click.option('--seed', type=int, default=42, show_default=True)
+@with_appcontext
+def generate_data_command(messages, users, transactions, months, skew, seed):
+    """Popular o banco (DATABASE_URL) com dados sintéticos em escala"""
+    summary = generate_dataset(messages, users, transactions, months, skew, seed=seed, echo=click.echo)
+    click.echo(
+        f"{summary['users']} usuários, {summary['transactions']} transações e {summary['messages']} mensagens "
+        f"gerados (usuário mais pesado: {summary['heaviest_user_id']})"
+    )
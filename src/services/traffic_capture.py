@@ -0,0 +1,151 @@
+"""Captura opcional de tráfego real da API em JSON lines, para replay (services.traffic_replay).
+
+Com ``TRAFFIC_CAPTURE_RATE`` > 0 uma fração das requisições é gravada em
+``TRAFFIC_CAPTURE_PATH``, uma linha por requisição: método, endpoint e
+argumentos da rota, query string e corpo anonimizados, usuário da sessão
+(pseudônimo), status, duração, tempo gasto no LLM e tamanhos.
+
+Anonimização: senhas e tokens viram ``********``; os demais textos são
+trocados por pseudônimos do mesmo tamanho (HMAC com a ``SECRET_KEY``, o
+mesmo valor sempre gera o mesmo pseudônimo); números (inclusive na query
+string), booleanos e os campos de enumeração (``ENUM_KEYS``) são mantidos.
+Ids de usuário viram pseudônimos ``u:...`` para o replay associá-los a
+usuários do banco local.
+
+Respostas em stream (SSE), arquivos estáticos e health checks não são
+capturados. A captura para quando o arquivo passa de ``TRAFFIC_CAPTURE_MAX_MB``.
+"""
+import hashlib
+import hmac
+import json
+import os
+import random
+import threading
+import time
+
+from flask import current_app, g, request, session
+
+from services.identity import get_identity
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+SECRET_KEYS = frozenset({
+    'password', 'new_password', 'current_password', 'token', 'google_token', 'google_id'
+})
+ENUM_KEYS = frozenset({'status', 'user_type', 'fields', 'order', 'sort', 'kind'})
+USER_ID_KEYS = frozenset({'user_id'})
+SKIPPED_ENDPOINTS = frozenset({'static', 'serve', 'health.liveness', 'health.readiness', 'health.health_check'})
+MASK = '********'
+
+_write_lock = threading.Lock()
+_full_warned = False
+
+
+def pseudonym(value, length=12):
+    """Pseudônimo estável de um valor (HMAC com a SECRET_KEY)"""
+    key = current_app.config['SECRET_KEY'].encode('utf-8')
+    return hmac.new(key, str(value).encode('utf-8'), hashlib.sha256).hexdigest()[:length]
+
+
+def user_pseudonym(user_id):
+    return f'u:{pseudonym(user_id)}' if user_id is not None else None
+
+
+def _anonymize_text(value):
+    if '@' in value and ' ' not in value:
+        return f'{pseudonym(value, 10)}@example.com'
+    digest = pseudonym(value, 64)
+    return (digest * (len(value) // len(digest) + 1))[:len(value)]
+
+
+def anonymize(value, key=None):
+    """Cópia anonimizada de um valor JSON (ver docstring do módulo)"""
+    if isinstance(value, dict):
+        return {k: anonymize(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [anonymize(item, key) for item in value]
+    if key in SECRET_KEYS:
+        return MASK
+    if key in USER_ID_KEYS and (isinstance(value, int) and not isinstance(value, bool) or str(value).isdigit()):
+        return user_pseudonym(int(value))
+    if isinstance(value, str) and key not in ENUM_KEYS and not value.isdigit():
+        return _anonymize_text(value)
+    return value
+
+
+def _sampled():
+    rate = current_app.config.get('TRAFFIC_CAPTURE_RATE', 0)
+    if rate <= 0 or request.endpoint is None or request.endpoint in SKIPPED_ENDPOINTS:
+        return False
+    return rate >= 1 or random.random() < rate
+
+
+def _start_capture():
+    if _sampled():
+        g.capture_started = time.perf_counter()
+        g.capture_user_id = session.get('user_id')
+
+
+def _request_body():
+    max_body = current_app.config['TRAFFIC_CAPTURE_MAX_BODY']
+    if not request.content_length or request.content_length > max_body:
+        return None
+    body = request.get_json(silent=True)
+    return anonymize(body) if body is not None else None
+
+
+def _finish_capture(response):
+    started = g.pop('capture_started', None)
+    if started is None or response.is_streamed:
+        return response
+    try:
+        # Depois do login vale o usuário novo; depois do logout, o que estava logado
+        user_id = session.get('user_id', g.pop('capture_user_id', None))
+        identity = get_identity(user_id) if user_id is not None else None
+        record = {
+            'ts': round(time.time(), 3),
+            'method': request.method,
+            'endpoint': request.endpoint,
+            'view_args': anonymize(request.view_args or {}),
+            'query': anonymize(request.args.to_dict(flat=True)),
+            'body': _request_body(),
+            'request_bytes': request.content_length or 0,
+            'idempotency_key': 'Idempotency-Key' in request.headers,
+            'user': user_pseudonym(user_id),
+            'user_type': identity['user']['user_type'] if identity else None,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            'llm_ms': round(g.get('llm_ms', 0), 2),
+            'response_bytes': response.calculate_content_length() or len(response.get_data())
+        }
+        write_record(record)
+    except Exception as e:
+        print(f"Erro na captura de tráfego: {e}")
+    return response
+
+
+def write_record(record):
+    """Anexar um registro ao arquivo de captura (respeitando o tamanho máximo)"""
+    global _full_warned
+    path = current_app.config['TRAFFIC_CAPTURE_PATH']
+    line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with _write_lock, open(path, 'a', encoding='utf-8') as f:
+        if f.tell() >= current_app.config['TRAFFIC_CAPTURE_MAX_MB'] * 2 ** 20:
+            if not _full_warned:
+                print(f"Captura de tráfego interrompida: {path} atingiu o tamanho máximo")
+                _full_warned = True
+            return
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(line)
+
+
+def init_traffic_capture(app):
+    """Registrar os hooks de captura apenas se ela estiver habilitada"""
+    if app.config.get('TRAFFIC_CAPTURE_RATE', 0) > 0:
+        app.before_request(_start_capture)
+        app.after_request(_finish_capture)
@@ -0,0 +1,208 @@
+"""Replay determinístico de uma captura de tráfego (services.traffic_capture) contra o banco local.
+
+As requisições são refeitas em ordem, dentro do processo, com o LLM
+substituído por um stub (com a latência gravada ou nenhuma) e no ritmo
+gravado, acelerado (``--speed``) ou o mais rápido possível. Cada pseudônimo
+de usuário é associado sempre ao mesmo usuário local do mesmo tipo; logins
+usam esse usuário e a senha informada (``senha123`` nos dados de
+``flask generate-data``).
+
+O relatório compara, por endpoint, a latência gravada e a do replay sem o
+tempo do LLM, além dos status diferentes. O replay grava no banco (mensagens,
+transações): use ``DATABASE_URL`` apontando para uma cópia ou para dados
+sintéticos.
+"""
+import json
+import time
+import uuid
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from database import db, User
+from services.harness import harness_config, open_isolated
+
+STUB_ANSWER = ('Resposta simulada do assistente para o replay de tráfego. ' * 12).strip()
+LOGIN_ENDPOINTS = frozenset({'user.login'})
+LOGOUT_ENDPOINTS = frozenset({'user.logout'})
+
+
+def load_capture(path, limit=None):
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+                if limit and len(records) >= limit:
+                    break
+    return records
+
+
+def percentile(values, fraction):
+    """Percentil por posição (valores já ordenados)"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class _UserMap:
+    """Pseudônimo gravado -> usuário local do mesmo tipo (sempre o mesmo)"""
+
+    def __init__(self):
+        self.by_type = {}
+        for user_id, username, user_type in db.session.query(User.id, User.username, User.user_type)\
+                .filter(User.is_active.is_(True)).order_by(User.id):
+            self.by_type.setdefault(user_type, []).append((user_id, username))
+
+    def resolve(self, user_pseudonym, user_type='client'):
+        candidates = self.by_type.get(user_type or 'client') or self.by_type.get('client')
+        if not user_pseudonym or not candidates:
+            return None
+        return candidates[int(user_pseudonym[2:], 16) % len(candidates)]
+
+
+def _map_user_ids(values, users):
+    mapped = {}
+    for key, value in values.items():
+        if key == 'user_id' and isinstance(value, str) and value.startswith('u:'):
+            local = users.resolve(value)
+            value = local[0] if local else 0
+        mapped[key] = value
+    return mapped
+
+
+def replay_capture(records, speed=0, llm_latency=True, password='senha123'):
+    """Refazer as requisições gravadas; retorna um resultado por requisição"""
+    app = current_app._get_current_object()
+    users = _UserMap()
+    adapter = app.url_map.bind('localhost')
+    run_id = uuid.uuid4().hex[:8]
+    clients = {}
+    current = {'llm_ms': 0, 'stub_ms': 0}
+
+    def stub(messages, **options):
+        if llm_latency and current['llm_ms']:
+            time.sleep(current['llm_ms'] / 1000)
+        current['stub_ms'] += current['llm_ms'] if llm_latency else 0
+        return STUB_ANSWER
+
+    def client_for(local):
+        key = local[0] if local else None
+        if key not in clients:
+            clients[key] = app.test_client()
+            if local:
+                with clients[key].session_transaction() as session:
+                    session['user_id'] = local[0]
+        return clients[key]
+
+    results = []
+    with harness_config(app, stub):
+        first_ts = records[0]['ts'] if records else 0
+        started_at = time.monotonic()
+        for index, record in enumerate(records):
+            if speed > 0:
+                delay = started_at + (record['ts'] - first_ts) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            local = users.resolve(record.get('user'), record.get('user_type'))
+            body = record.get('body')
+            if record['endpoint'] in LOGIN_ENDPOINTS:
+                client = client_for(None)
+                if local:
+                    body = {'username': local[1], 'password': password}
+            else:
+                client = client_for(local)
+            url = adapter.build(
+                record['endpoint'],
+                dict(_map_user_ids(record.get('view_args') or {}, users), **_map_user_ids(record.get('query') or {}, users)),
+                method=record['method']
+            )
+            headers = {'Idempotency-Key': f'replay-{run_id}-{index}'} if record.get('idempotency_key') else {}
+
+            current['llm_ms'], current['stub_ms'] = record.get('llm_ms', 0), 0
+            request_started = time.perf_counter()
+            response = open_isolated(app, client, url, method=record['method'], json=body, headers=headers)
+            elapsed_ms = (time.perf_counter() - request_started) * 1000
+            if record['endpoint'] in LOGOUT_ENDPOINTS:
+                clients.pop(local[0] if local else None, None)
+
+            results.append({
+                'endpoint': record['endpoint'],
+                'method': record['method'],
+                'recorded_ms': record['duration_ms'],
+                'recorded_app_ms': max(record['duration_ms'] - record.get('llm_ms', 0), 0),
+                'replay_ms': round(elapsed_ms, 2),
+                'replay_app_ms': round(max(elapsed_ms - current['stub_ms'], 0), 2),
+                'recorded_status': record['status'],
+                'status': response.status_code,
+                'recorded_bytes': record.get('response_bytes'),
+                'bytes': len(response.get_data())
+            })
+    return results
+
+
+def summarize(results):
+    """Comparação por endpoint: medianas e p95 (sem o LLM), diferença e status divergentes"""
+    groups = {}
+    for result in results:
+        groups.setdefault(f"{result['method']} {result['endpoint']}", []).append(result)
+    summary = []
+    for name, items in groups.items():
+        recorded = sorted(item['recorded_app_ms'] for item in items)
+        replayed = sorted(item['replay_app_ms'] for item in items)
+        recorded_p50, replay_p50 = percentile(recorded, 0.5), percentile(replayed, 0.5)
+        summary.append({
+            'endpoint': name,
+            'requests': len(items),
+            'recorded_p50_ms': round(recorded_p50, 2),
+            'recorded_p95_ms': round(percentile(recorded, 0.95), 2),
+            'replay_p50_ms': round(replay_p50, 2),
+            'replay_p95_ms': round(percentile(replayed, 0.95), 2),
+            'p50_change': round((replay_p50 - recorded_p50) / recorded_p50, 3) if recorded_p50 else None,
+            'status_mismatches': sum(1 for item in items if item['status'] != item['recorded_status'])
+        })
+    return sorted(summary, key=lambda entry: entry['p50_change'] if entry['p50_change'] is not None else 0, reverse=True)
+
+
+@click.command('replay-traffic')
+@click.argument('capture', type=click.Path(exists=True, dir_okay=False))
+@click.option('--speed', type=float, default=0, show_default=True,
+              help='Ritmo: 1 = como gravado, 10 = dez vezes mais rápido, 0 = sem esperas.')
+@click.option('--llm-latency', type=click.Choice(['recorded', 'none']), default='recorded', show_default=True,
+              help='Latência do LLM simulado.')
+@click.option('--limit', type=int, default=None, help='Refazer apenas as primeiras N requisições.')
+@click.option('--password', default='senha123', show_default=True, help='Senha dos usuários locais nos logins.')
+@click.option('--min-requests', type=int, default=5, show_default=True,
+              help='Amostras mínimas para um endpoint entrar em --fail-over.')
+@click.option('--fail-over', type=float, default=None,
+              help='Falhar se a mediana de algum endpoint piorar mais que esta fração (ex.: 0.2).')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Gravar o relatório em JSON.')
+@with_appcontext
+def replay_traffic_command(capture, speed, llm_latency, limit, password, min_requests, fail_over, output):
+    """Refazer uma captura de tráfego no banco local e comparar a latência por endpoint"""
+    records = load_capture(capture, limit)
+    if not records:
+        raise click.ClickException('Captura vazia')
+    click.echo(f'Refazendo {len(records)} requisições...')
+    results = replay_capture(records, speed=speed, llm_latency=llm_latency == 'recorded', password=password)
+    summary = summarize(results)
+
+    click.echo(f"{'endpoint':<48} {'n':>6} {'gravado p50':>12} {'replay p50':>11} {'variação':>9} {'status≠':>8}")
+    for entry in summary:
+        change = f"{entry['p50_change']:+.0%}" if entry['p50_change'] is not None else '-'
+        click.echo(f"{entry['endpoint']:<48} {entry['requests']:>6} {entry['recorded_p50_ms']:>12} "
+                   f"{entry['replay_p50_ms']:>11} {change:>9} {entry['status_mismatches']:>8}")
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'capture': capture, 'requests': len(results), 'endpoints': summary}, f, indent=2)
+
+    if fail_over is not None:
+        regressions = [
+            entry for entry in summary
+            if entry['requests'] >= min_requests and entry['p50_change'] is not None and entry['p50_change'] > fail_over
+        ]
+        if regressions:
+            raise click.ClickException(
+                'Regressões de latência: ' + ', '.join(f"{entry['endpoint']} ({entry['p50_change']:+.0%})" for entry in regressions)
+            )
@@ -0,0 +1,130 @@
+"""Importação em massa de usuários a partir de CSV."""
+import csv
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from functools import partial
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from database import db, User
+from services.passwords import current_method, hash_passwords
+
+DEFAULT_BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 100
+REQUIRED_COLUMNS = ('username', 'email', 'password')
+TRUE_VALUES = ('1', 'true', 'sim', 'yes', 's', 'y')
+
+
+def _parse_row(row, usernames, emails):
+    """Validar uma linha do CSV contra o índice de usuários já existentes"""
+    username = (row.get('username') or '').strip()
+    email = (row.get('email') or '').strip()
+    password = row.get('password') or ''
+
+    if not username or not email or not password:
+        raise ValueError('username, email e password são obrigatórios')
+    if username in usernames:
+        raise ValueError(f'Username already exists: {username}')
+    if email in emails:
+        raise ValueError(f'Email already exists: {email}')
+
+    user_type = (row.get('user_type') or 'client').strip()
+    if user_type not in ('client', 'admin'):
+        raise ValueError(f'user_type inválido: {user_type}')
+
+    is_active = row.get('is_active')
+    return {
+        'username': username,
+        'email': email,
+        'password': password,
+        'user_type': user_type,
+        'message_balance': int(row.get('message_balance') or 0),
+        'is_active': True if is_active in (None, '') else is_active.strip().lower() in TRUE_VALUES
+    }
+
+
+def _insert_batch(batch, hash_many):
+    """Gerar os hashes do lote e inserir tudo com um executemany"""
+    passwords = [row.pop('password') for row in batch]
+    now = datetime.utcnow()
+    for row, password_hash in zip(batch, hash_many(passwords)):
+        row['password_hash'] = password_hash
+        row['created_at'] = now
+    db.session.execute(insert(User), batch)
+    db.session.commit()
+
+
+@contextmanager
+def _process_hasher(workers):
+    """Hashes em um pool de processos ('spawn' evita herdar conexões e o estado da aplicação)"""
+    hasher = partial(generate_password_hash, method=current_method())
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield lambda passwords: pool.map(hasher, passwords, chunksize=max(1, len(passwords) // (workers * 4)))
+
+
+def import_users(lines, batch_size=DEFAULT_BATCH_SIZE, workers=None, processes=True):
+    """Importar usuários de um iterável de linhas CSV (com cabeçalho).
+
+    Usernames e emails existentes são carregados uma única vez em conjuntos.
+    Com ``processes`` (linha de comando) as senhas de cada lote são
+    processadas por um pool de processos; sem ele (requisições HTTP) usam o
+    pool limitado de threads de services.passwords, sem criar processos
+    dentro do worker.
+    """
+    reader = csv.DictReader(lines)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(missing)}")
+
+    usernames = set()
+    emails = set()
+    for username, email in db.session.query(User.username, User.email):
+        usernames.add(username)
+        emails.add(email)
+
+    summary = {'created': 0, 'skipped': 0, 'errors': []}
+    batch = []
+
+    hasher = _process_hasher(workers or os.cpu_count() or 1) if processes else nullcontext(hash_passwords)
+    with hasher as hash_many:
+        for line_number, row in enumerate(reader, start=2):
+            try:
+                parsed = _parse_row(row, usernames, emails)
+            except ValueError as e:
+                summary['skipped'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'line': line_number, 'error': str(e)})
+                continue
+
+            usernames.add(parsed['username'])
+            emails.add(parsed['email'])
+            batch.append(parsed)
+            if len(batch) >= batch_size:
+                _insert_batch(batch, hash_many)
+                summary['created'] += len(batch)
+                batch = []
+
+        if batch:
+            _insert_batch(batch, hash_many)
+            summary['created'] += len(batch)
+
+    return summary
+
+
+@click.command('import-users')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Usuários inseridos por lote.')
+@click.option('--workers', type=int, default=None, help='Processos para gerar hashes (padrão: núcleos da CPU).')
+@with_appcontext
+def import_users_command(csv_file, batch_size, workers):
+    """Importar usuários de um arquivo CSV (username,email,password[,user_type,message_balance,is_active])"""
+    summary = import_users(csv_file, batch_size=batch_size, workers=workers)
+    click.echo(f"{summary['created']} usuários criados, {summary['skipped']} linhas ignoradas")
+    for error in summary['errors']:
+        click.echo(f"  linha {error['line']}: {error['error']}")
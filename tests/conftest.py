@@ -0,0 +1,76 @@
+"""Fixtures compartilhadas: aplicação com banco, armazenamento e shards temporários.
+
+As variáveis de ambiente precisam estar definidas antes de importar
+``src.main``, que monta a aplicação na importação.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix='sensus-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_tmp, 'app.db')}",
+    'KV_STORE_BACKEND': 'memory',
+    'KV_STORE_SWEEP_INTERVAL': '0',
+    'CHAT_ARCHIVE_DIR': os.path.join(_tmp, 'archive'),
+    'CHAT_SHARD_DIR': os.path.join(_tmp, 'shards'),
+    'CHAT_SHARDS': '0',
+    'PASSWORD_HASH_METHOD': 'pbkdf2',
+    'PASSWORD_HASH_COST': '1000',
+    'MAIL_SENDER_ENABLED': '0',
+    'SCHEDULER_ENABLED': '0',
+    'TRAFFIC_CAPTURE_RATE': '0',
+})
+
+from src.main import app as flask_app, init_database  # noqa: E402
+from database import db, User  # noqa: E402
+from services import archive, chat_shards, identity, response_cache  # noqa: E402
+from services.kv_store import init_kv_store  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """Aplicação com banco recriado, armazenamento e caches vazios a cada teste"""
+    with flask_app.app_context():
+        db.drop_all()
+        db.session.remove()
+    init_database()
+    init_kv_store(flask_app)
+    identity._cache.clear()
+    response_cache._cache.clear()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+    for engine in chat_shards._engines.values():
+        engine.dispose()
+    chat_shards._engines.clear()
+    archive._index_cache.clear()
+    for key in ('CHAT_SHARD_DIR', 'CHAT_ARCHIVE_DIR'):
+        shutil.rmtree(flask_app.config[key], ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def create_user(username, password='secret123', user_type='client', message_balance=10):
+    with flask_app.app_context():
+        user = User(username=username, email=f'{username}@example.com',
+                    user_type=user_type, message_balance=message_balance)
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def login(client, username, password='secret123'):
+    response = client.post('/login', json={'username': username, 'password': password})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['user']
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db, ChatMessage
+from services import archive
+from services.archive import archive_old_messages, archived_count, read_archived
+
+from conftest import create_user, login
+
+
+@pytest.fixture
+def archived(app):
+    """Mensagens de três usuários intercaladas ao longo de dois meses, arquivadas em blocos pequenos"""
+    with app.app_context():
+        users = [create_user(name) for name in ('alice', 'bob', 'carol')]
+        start = datetime(2024, 1, 20)
+        for i in range(60):
+            db.session.add(ChatMessage(user_id=users[i % 3], question=f'q{i}', answer='r',
+                                       created_at=start + timedelta(hours=12 * i)))
+        db.session.commit()
+        archive_old_messages(older_than_days=0, block_size=4)
+        yield users
+
+
+def _expected(users, user_id=None):
+    questions = [f'q{i}' for i in range(60) if user_id in (None, users[i % 3])]
+    return questions[::-1]
+
+
+def test_everything_was_archived(archived):
+    assert db.session.query(ChatMessage).count() == 0
+    assert archived_count() == 60
+
+
+@pytest.mark.parametrize('offset,limit', [(0, 10), (7, 5), (18, 30), (55, 10), (60, 5)])
+def test_all_users_history_is_merged_in_order(archived, offset, limit):
+    assert [m['question'] for m in read_archived(None, offset, limit)] == _expected(archived)[offset:offset + limit]
+
+
+@pytest.mark.parametrize('offset,limit', [(0, 3), (5, 6), (19, 5)])
+def test_single_user_history(archived, offset, limit):
+    user_id = archived[1]
+    assert [m['question'] for m in read_archived(user_id, offset, limit)] == \
+        _expected(archived, user_id)[offset:offset + limit]
+
+
+def test_first_page_opens_only_the_needed_blocks(archived, monkeypatch):
+    opened = []
+    read_block = archive._read_block
+
+    def counting(archive_dir, month, entry):
+        opened.append(entry)
+        return read_block(archive_dir, month, entry)
+
+    monkeypatch.setattr(archive, '_read_block', counting)
+    read_archived(None, 0, 3)
+    # 15 blocos (60 mensagens / 4), mas só os mais recentes de cada usuário são abertos
+    assert len(opened) <= 4
+
+
+def test_admin_views_count_archived_messages(archived, client):
+    db.session.add(ChatMessage(user_id=archived[0], question='recente', answer='r'))
+    db.session.commit()
+    login(client, 'admin', 'admin123')
+
+    listed = {user['id']: user['message_count'] for user in client.get('/admin/users').get_json()['users']}
+    exported = {user['id']: user['message_count'] for user in client.get('/admin/export/users').get_json()['users']}
+    dashboard = client.get('/admin/dashboard').get_json()
+    assert listed == exported == {archived[0]: 21, archived[1]: 20, archived[2]: 20}
+    assert dashboard['total_messages'] == 61
+    assert dashboard['top_users'][0]['message_count'] == 21
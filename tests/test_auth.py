@@ -0,0 +1,41 @@
+from database import db
+from routes.auth import RESET_TOKEN_PREFIX, RESET_TOKEN_TTL
+from services.kv_store import get_store
+
+from conftest import create_user, login
+
+
+def _issue_token(app, user_id, token='token-de-teste'):
+    with app.app_context():
+        get_store().set(RESET_TOKEN_PREFIX + token, {'user_id': user_id}, ttl=RESET_TOKEN_TTL)
+    return token
+
+
+def test_reset_token_is_single_use(app, client):
+    user_id = create_user('maria')
+    token = _issue_token(app, user_id)
+
+    response = client.post('/auth/reset-password', json={'token': token, 'new_password': 'nova-senha'})
+    assert response.status_code == 200
+    assert login(client, 'maria', 'nova-senha')['id'] == user_id
+
+    again = client.post('/auth/reset-password', json={'token': token, 'new_password': 'outra-senha'})
+    assert again.status_code == 400
+
+
+def test_reset_token_survives_failed_commit(app, client, monkeypatch):
+    user_id = create_user('maria')
+    token = _issue_token(app, user_id)
+
+    def failing_commit():
+        raise RuntimeError('database is locked')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'commit', failing_commit)
+        response = client.post('/auth/reset-password', json={'token': token, 'new_password': 'nova-senha'})
+    assert response.status_code == 500
+
+    with app.app_context():
+        assert get_store().get(RESET_TOKEN_PREFIX + token) == {'user_id': user_id}
+    response = client.post('/auth/reset-password', json={'token': token, 'new_password': 'nova-senha'})
+    assert response.status_code == 200
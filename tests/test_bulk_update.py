@@ -0,0 +1,41 @@
+import pytest
+
+from database import db, User
+
+from conftest import create_user, login
+
+
+@pytest.fixture
+def admin_client(client):
+    login(client, 'admin', 'admin123')
+    return client
+
+
+@pytest.mark.parametrize('filters', [
+    {'is_active': 'false'},
+    {'is_active': 0},
+    {'search': 123},
+    {'search': ['ali']},
+    {'user_type': ['client']},
+])
+def test_malformed_filter_values_are_rejected(app, admin_client, filters):
+    create_user('alice', message_balance=0)
+    response = admin_client.post('/admin/users/bulk', json={'filter': filters, 'add_balance': 5})
+    assert response.status_code == 400
+    with app.app_context():
+        assert User.query.filter_by(username='alice').one().message_balance == 0
+
+
+def test_is_active_filter_selects_only_matching_users(app, admin_client):
+    active = create_user('alice', message_balance=0)
+    inactive = create_user('bob', message_balance=0)
+    with app.app_context():
+        db.session.get(User, inactive).is_active = False
+        db.session.commit()
+
+    response = admin_client.post('/admin/users/bulk', json={'filter': {'is_active': False}, 'add_balance': 5})
+    assert response.status_code == 200
+    assert [row['id'] for row in response.get_json()['results']] == [inactive]
+    with app.app_context():
+        assert db.session.get(User, active).message_balance == 0
+        assert db.session.get(User, inactive).message_balance == 5
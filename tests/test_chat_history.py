@@ -0,0 +1,32 @@
+from database import db, ChatMessage
+
+from conftest import create_user, login
+
+
+def _seed(app, user_id, length=500):
+    with app.app_context():
+        db.session.add(ChatMessage(user_id=user_id, question='p' * length, answer='r' * length))
+        db.session.commit()
+
+
+def test_history_returns_full_text_by_default(client, app):
+    user_id = create_user('alice')
+    _seed(app, user_id)
+    login(client, 'alice')
+
+    message = client.get('/chat/history?per_page=10').get_json()['messages'][0]
+    assert message['question'] == 'p' * 500
+    assert message['answer'] == 'r' * 500
+    assert 'truncated' not in message
+
+
+def test_history_summary_on_request(client, app):
+    user_id = create_user('alice')
+    _seed(app, user_id)
+    login(client, 'alice')
+
+    message = client.get('/chat/history?per_page=10&fields=summary').get_json()['messages'][0]
+    preview_length = app.config['HISTORY_PREVIEW_LENGTH']
+    assert message['question'] == 'p' * preview_length
+    assert message['question_length'] == 500
+    assert message['truncated'] is True
@@ -0,0 +1,141 @@
+import pytest
+from sqlalchemy import event
+
+from database import db, ChatMessage, ChatShardAssignment
+from services import chat_shards
+from services.chat_shards import (
+    MAX_SHARDS, MOVE_LOCK_PREFIX, SHARD_ID_BASE, count_messages, get_message, move_tenant,
+    page_messages, save_message, shard_for_user, shard_source
+)
+from services.kv_store import get_store
+
+from conftest import create_user
+
+
+@pytest.fixture
+def shards(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHAT_SHARDS', 2)
+    monkeypatch.setitem(app.config, 'CHAT_SHARD_MOVE_WAIT', 0.2)
+    with app.app_context():
+        yield app
+
+
+def _save(user_id, question):
+    message = save_message(user_id, question, f'resposta {question}')
+    db.session.commit()
+    return message
+
+
+def _ids_in(source, user_id):
+    table = source.table
+    with source.engine.connect() as conn:
+        return set(conn.execute(db.select(table.c.id).where(table.c.user_id == user_id)).scalars())
+
+
+def test_new_user_goes_to_default_shard_and_is_pinned(shards, monkeypatch):
+    user_id = create_user('alice')
+    message = _save(user_id, 'q1')
+
+    shard = user_id % 2
+    assert message.id >= SHARD_ID_BASE
+    assert (message.id - SHARD_ID_BASE) % MAX_SHARDS == shard
+    assert db.session.get(ChatShardAssignment, user_id).shard == shard
+
+    # Mais shards não mudam o lugar de quem já tem histórico
+    monkeypatch.setitem(shards.config, 'CHAT_SHARDS', 5)
+    assert shard_for_user(user_id) == shard
+
+
+def test_reads_merge_shards_and_main_table(shards):
+    alice, bob = create_user('alice'), create_user('bob')
+    db.session.add(ChatMessage(user_id=alice, question='antiga', answer='r'))
+    db.session.commit()
+    for i in range(3):
+        _save(alice, f'a{i}')
+        _save(bob, f'b{i}')
+
+    assert count_messages(alice) == 4
+    assert count_messages() == 7
+    questions = [item['question'] for item in page_messages(0, 10)]
+    assert questions[:2] == ['b2', 'a2']
+    assert questions[-1] == 'antiga'
+    assert [item['question'] for item in page_messages(1, 2, user_id=alice)] == ['a1', 'a0']
+
+
+def test_move_tenant_keeps_ids_and_removes_origin(shards):
+    user_id = create_user('alice')
+    db.session.add(ChatMessage(user_id=user_id, question='antiga', answer='r'))
+    db.session.commit()
+    ids = {_save(user_id, f'q{i}').id for i in range(3)}
+    origin = shard_for_user(user_id)
+    target = 1 - origin
+
+    assert move_tenant(user_id, target) == 4
+    db.session.expire_all()
+    assert shard_for_user(user_id) == target
+    assert ids < _ids_in(shard_source(target), user_id)
+    assert _ids_in(shard_source(origin), user_id) == set()
+    assert db.session.query(ChatMessage).filter_by(user_id=user_id).count() == 0
+    assert count_messages(user_id) == 4
+    assert get_message(min(ids), user_id)['question'] == 'q0'
+
+    # Mensagens novas seguem para o shard novo
+    assert (_save(user_id, 'depois').id - SHARD_ID_BASE) % MAX_SHARDS == target
+
+
+def test_writes_wait_for_move_in_progress(shards):
+    user_id = create_user('alice')
+    get_store().set(MOVE_LOCK_PREFIX + str(user_id), 1, ttl=60)
+    with pytest.raises(RuntimeError):
+        save_message(user_id, 'q', 'r')
+    get_store().delete(MOVE_LOCK_PREFIX + str(user_id))
+    assert _save(user_id, 'q').id >= SHARD_ID_BASE
+
+
+def test_concurrent_move_is_refused(shards):
+    user_id = create_user('alice')
+    _save(user_id, 'q')
+    get_store().set(MOVE_LOCK_PREFIX + str(user_id), 1, ttl=60)
+    with pytest.raises(RuntimeError):
+        move_tenant(user_id, 1 - shard_for_user(user_id))
+
+
+def test_write_that_picked_the_old_shard_is_not_lost(shards, monkeypatch):
+    user_id = create_user('alice')
+    _save(user_id, 'antes')
+    origin = shard_for_user(user_id)
+    target = 1 - origin
+    assigned_shard = chat_shards._assigned_shard
+    calls = []
+
+    def move_after_first_lookup(uid):
+        shard = assigned_shard(uid)
+        calls.append(shard)
+        if len(calls) == 1:
+            # A gravação já escolheu o shard antigo quando a migração acontece inteira
+            move_tenant(user_id, target)
+        return shard
+
+    monkeypatch.setattr(chat_shards, '_assigned_shard', move_after_first_lookup)
+    message = _save(user_id, 'durante')
+
+    assert (message.id - SHARD_ID_BASE) % MAX_SHARDS == target
+    assert _ids_in(shard_source(origin), user_id) == set()
+    assert [item['question'] for item in page_messages(0, 10, user_id=user_id)] == ['durante', 'antes']
+
+
+def test_assignment_is_written_only_on_first_message(shards):
+    user_id = create_user('alice')
+    inserts = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT') and 'chat_shard_assignment' in statement:
+            inserts.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        for i in range(3):
+            _save(user_id, f'q{i}')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(inserts) == 1
@@ -0,0 +1,25 @@
+from services import llm_gateway
+from services.harness import harness_config
+from services.soak import run_soak
+
+from conftest import create_user
+
+
+def test_harness_config_is_restored(app):
+    before = dict(app.config)
+    stub = lambda messages, **options: 'stub'  # noqa: E731
+    with harness_config(app, stub, {'RESPONSE_CACHE_ENABLED': False}):
+        assert app.config['RATE_LIMIT_ENABLED'] is False
+        assert app.config['RESPONSE_CACHE_ENABLED'] is False
+        assert llm_gateway._stub is stub
+    assert llm_gateway._stub is None
+    assert {key: app.config[key] for key in before} == before
+
+
+def test_soak_without_warmup(app):
+    for name in ('alice', 'bob'):
+        create_user(name)
+    with app.app_context():
+        result = run_soak(requests=20, warmup=0, sample_every=10, users=2, frames=1, password='secret123')
+    assert [sample['requests'] for sample in result['samples']] == [10, 20]
+    assert not [key for key in result['statuses'] if key.endswith('500')]
@@ -0,0 +1,37 @@
+import pytest
+
+from routes import health
+from services import llm_gateway
+from services.llm_gateway import CircuitBreaker
+
+
+@pytest.fixture
+def open_circuit(app, monkeypatch):
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record_failure(10, TimeoutError('sem resposta'))
+    monkeypatch.setattr(llm_gateway, '_breaker', breaker)
+    monkeypatch.setitem(health._readiness, 'expires_at', 0)
+    return breaker
+
+
+def test_ready_with_llm_reported_as_degraded(client, open_circuit):
+    response = client.get('/api/health/ready')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['status'] == 'ready'
+    assert body['degraded'] == ['llm']
+    assert body['checks']['llm']['state'] == 'open'
+    assert client.get('/api/health').get_json()['status'] == 'degraded'
+
+
+def test_llm_can_still_be_required(client, app, open_circuit, monkeypatch):
+    monkeypatch.setitem(app.config, 'HEALTH_REQUIRE_LLM', True)
+    assert client.get('/api/health/ready').status_code == 503
+
+
+def test_healthy_when_circuit_closed(client, app, monkeypatch):
+    monkeypatch.setattr(llm_gateway, '_breaker', CircuitBreaker())
+    monkeypatch.setitem(health._readiness, 'expires_at', 0)
+    body = client.get('/api/health/ready').get_json()
+    assert body['checks']['llm']['status'] == 'up'
+    assert 'llm' not in body['degraded']
@@ -0,0 +1,106 @@
+import pytest
+
+from database import db, ChatMessage, Transaction
+from services import llm_gateway, rate_limit
+
+from conftest import create_user, login
+
+
+def _buy(client, key, package_id=1):
+    return client.post('/transactions', json={'package_id': package_id}, headers={'Idempotency-Key': key})
+
+
+def _transaction_count(app):
+    with app.app_context():
+        return db.session.query(Transaction).count()
+
+
+def test_replay_returns_stored_response_without_running_again(client, app):
+    create_user('alice')
+    login(client, 'alice')
+
+    first = _buy(client, 'key-1')
+    assert first.status_code == 201
+    assert 'Idempotent-Replayed' not in first.headers
+
+    second = _buy(client, 'key-1')
+    assert second.status_code == 201
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json() == first.get_json()
+    assert _transaction_count(app) == 1
+
+
+def test_without_key_every_request_runs(client, app):
+    create_user('alice')
+    login(client, 'alice')
+    client.post('/transactions', json={'package_id': 1})
+    client.post('/transactions', json={'package_id': 1})
+    assert _transaction_count(app) == 2
+
+
+def test_same_key_with_other_body_is_rejected(client, app):
+    create_user('alice')
+    login(client, 'alice')
+    assert _buy(client, 'key-1', package_id=1).status_code == 201
+    assert _buy(client, 'key-1', package_id=2).status_code == 422
+    assert _transaction_count(app) == 1
+
+
+def test_keys_are_scoped_per_user(client, app):
+    create_user('alice')
+    create_user('bob')
+    login(client, 'alice')
+    assert _buy(client, 'shared').status_code == 201
+
+    other = app.test_client()
+    login(other, 'bob')
+    response = _buy(other, 'shared')
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+    assert _transaction_count(app) == 2
+
+
+def test_error_responses_are_replayed_too(client, app):
+    create_user('alice')
+    login(client, 'alice')
+    assert _buy(client, 'missing', package_id=999).status_code == 404
+    response = _buy(client, 'missing', package_id=999)
+    assert response.status_code == 404
+    assert response.headers['Idempotent-Replayed'] == 'true'
+
+
+def test_oversized_key_is_rejected(client):
+    create_user('alice')
+    login(client, 'alice')
+    assert _buy(client, 'k' * 256).status_code == 400
+
+
+@pytest.fixture
+def stub_llm():
+    llm_gateway.set_completion_stub(lambda messages, **options: 'resposta')
+    yield
+    llm_gateway.set_completion_stub(None)
+
+
+def test_rate_limited_response_releases_the_key(client, app, stub_llm, monkeypatch):
+    create_user('alice')
+    login(client, 'alice')
+    waits = iter([5, 0])
+    monkeypatch.setattr(rate_limit, '_take_token', lambda *args: next(waits))
+
+    headers = {'Idempotency-Key': 'chat-1'}
+    assert client.post('/chat', json={'question': 'Oi?'}, headers=headers).status_code == 429
+    response = client.post('/chat', json={'question': 'Oi?'}, headers=headers)
+    assert response.status_code == 200
+    assert 'Idempotent-Replayed' not in response.headers
+    with app.app_context():
+        assert db.session.query(ChatMessage).count() == 1
+
+
+def test_server_error_releases_the_key(client, app):
+    create_user('alice')
+    login(client, 'alice')
+    # Corpo inválido: o handler de /chat responde 500
+    headers = {'Idempotency-Key': 'broken', 'Content-Type': 'application/json'}
+    assert client.post('/chat', data='[]', headers=headers).status_code == 500
+    assert 'Idempotent-Replayed' not in client.post('/chat', data='[]', headers=headers).headers
@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine, text
+
+from database import db, User
+from services import identity
+from services.identity import get_identity
+
+from conftest import create_user, login
+
+
+def test_identity_is_cached_between_requests(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'USER_CACHE_TTL', 300)
+    user_id = create_user('boss', user_type='admin')
+    login(client, 'boss')
+    assert client.get('/users').status_code == 200
+    assert user_id in identity._cache
+
+
+def test_update_from_another_process_is_seen_on_next_request(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'USER_CACHE_TTL', 300)
+    user_id = create_user('boss', user_type='admin')
+    login(client, 'boss')
+    assert client.get('/users').status_code == 200
+
+    # Outro worker: UPDATE direto no banco, com a versão incrementada como o ORM faz
+    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE user SET user_type = 'client', version = version + 1 WHERE id = :id"),
+                     {'id': user_id})
+    engine.dispose()
+    assert client.get('/users').status_code == 403
+
+
+def test_commit_invalidates_and_rollback_keeps_entry(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'USER_CACHE_TTL', 300)
+    user_id = create_user('boss', user_type='admin')
+    login(client, 'boss')
+    client.get('/users')
+
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        user.is_active = False
+        db.session.flush()
+        # Antes do commit o retrato antigo continua no cache
+        assert user_id in identity._cache
+        db.session.rollback()
+    assert user_id in identity._cache
+
+    with app.app_context():
+        db.session.get(User, user_id).user_type = 'client'
+        db.session.commit()
+    assert user_id not in identity._cache
+    assert client.get('/users').status_code == 403
+
+
+def test_deleted_user_has_no_identity(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'USER_CACHE_TTL', 300)
+    user_id = create_user('alice')
+    with app.app_context():
+        assert get_identity(user_id)['user']['username'] == 'alice'
+        db.session.execute(text('DELETE FROM user WHERE id = :id'), {'id': user_id})
+        db.session.commit()
+        assert get_identity(user_id) is None
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from services.kv_store import MemoryStore, SQLiteStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStore()
+    return SQLiteStore(str(tmp_path / 'kv.db'))
+
+
+def test_set_get_delete(store):
+    store.set('a', {'x': 1})
+    assert store.get('a') == {'x': 1}
+    store.delete('a')
+    assert store.get('a') is None
+
+
+def test_expired_keys_are_never_returned(store):
+    store.set('a', 1, ttl=0.05)
+    store.set('b', 2)
+    assert store.get('a') == 1
+    time.sleep(0.1)
+    assert store.get('a') is None
+    assert store.pop('a') is None
+    assert store.get('b') == 2
+
+
+def test_add_only_when_missing_or_expired(store):
+    assert store.add('a', 1, ttl=0.05)
+    assert not store.add('a', 2)
+    assert store.get('a') == 1
+    time.sleep(0.1)
+    assert store.add('a', 3)
+    assert store.get('a') == 3
+
+
+def test_pop_reads_and_removes(store):
+    store.set('token', 'abc')
+    assert store.pop('token') == 'abc'
+    assert store.pop('token') is None
+
+
+def test_update_removes_key_when_fn_returns_none(store):
+    assert store.update('n', lambda value: (value or 0) + 1) == 1
+    assert store.update('n', lambda value: None) is None
+    assert store.get('n') is None
+
+
+def test_update_sees_expired_value_as_missing(store):
+    store.set('n', 10, ttl=0.05)
+    time.sleep(0.1)
+    assert store.update('n', lambda value: (value or 0) + 1) == 1
+
+
+def test_sweep_removes_only_expired(store):
+    store.set('old', 1, ttl=0.05)
+    store.set('new', 2, ttl=60)
+    time.sleep(0.1)
+    assert store.sweep() == 1
+    assert store.get('new') == 2
+
+
+def test_sweep_keeps_key_rewritten_with_longer_ttl():
+    store = MemoryStore()
+    store.set('a', 1, ttl=0.05)
+    store.set('a', 2, ttl=60)
+    time.sleep(0.1)
+    assert store.sweep() == 0
+    assert store.get('a') == 2
+
+
+def test_concurrent_updates_are_atomic(store):
+    def increment():
+        for _ in range(50):
+            store.update('counter', lambda value: (value or 0) + 1)
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get('counter') == 200
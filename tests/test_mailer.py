@@ -0,0 +1,86 @@
+import smtplib
+
+from sqlalchemy import event
+
+from database import db, OutboundEmail
+from services.mailer import enqueue_email, process_queue
+
+
+class FakeTransport:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    def send(self, sender, recipient, message):
+        if self.error is not None:
+            raise self.error
+        self.sent.append(recipient)
+
+    def close(self):
+        pass
+
+
+def _enqueue(count):
+    for i in range(count):
+        enqueue_email(f'user{i}@example.com', 'Assunto', '<p>corpo</p>')
+
+
+def test_sends_pending_messages(app):
+    with app.app_context():
+        _enqueue(3)
+        transport = FakeTransport()
+        assert process_queue(transport, batch_size=2)['sent'] == 3
+        assert len(transport.sent) == 3
+        assert {email.status for email in OutboundEmail.query} == {'sent'}
+
+
+def test_connection_error_counts_only_the_attempted_message(app):
+    with app.app_context():
+        _enqueue(3)
+        summary = process_queue(FakeTransport(ConnectionRefusedError('recusada')), batch_size=10)
+        assert summary == {'sent': 0, 'retried': 3, 'dead': 0}
+        emails = OutboundEmail.query.order_by(OutboundEmail.id).all()
+        assert [email.attempts for email in emails] == [1, 0, 0]
+        assert {email.status for email in emails} == {'pending'}
+
+
+def test_unattempted_messages_never_die(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAIL_MAX_ATTEMPTS', 1)
+    with app.app_context():
+        _enqueue(2)
+        summary = process_queue(FakeTransport(ConnectionRefusedError('recusada')), batch_size=10)
+        assert summary['dead'] == 1
+        assert db.session.get(OutboundEmail, 2).status == 'pending'
+
+
+def test_rejected_credentials_kill_the_message_and_requeue_the_batch(app):
+    with app.app_context():
+        _enqueue(3)
+        error = smtplib.SMTPAuthenticationError(535, b'5.7.8 Authentication credentials invalid')
+        summary = process_queue(FakeTransport(error), batch_size=10)
+        assert summary == {'sent': 0, 'retried': 2, 'dead': 1}
+        emails = OutboundEmail.query.order_by(OutboundEmail.id).all()
+        assert [(email.status, email.attempts) for email in emails] == [('dead', 1), ('pending', 0), ('pending', 0)]
+
+
+def test_temporary_auth_failure_is_retried(app):
+    with app.app_context():
+        _enqueue(1)
+        error = smtplib.SMTPAuthenticationError(454, b'4.7.0 Temporary authentication failure')
+        assert process_queue(FakeTransport(error))['retried'] == 1
+        assert db.session.get(OutboundEmail, 1).status == 'pending'
+
+
+def test_empty_queue_does_not_write(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            process_queue(FakeTransport())
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    assert statements == ['SELECT']
@@ -0,0 +1,27 @@
+from database import db, ChatMessage
+from services.maintenance import checkpoint_wal, incremental_vacuum
+
+from conftest import create_user
+
+
+def test_main_database_uses_wal_and_incremental_vacuum(app):
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+            assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+            assert conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2  # INCREMENTAL
+
+
+def test_jobs_act_on_the_main_database(app):
+    user_id = create_user('alice')
+    with app.app_context():
+        db.session.add_all([ChatMessage(user_id=user_id, question='p' * 2000, answer='r' * 2000) for _ in range(200)])
+        db.session.commit()
+        ChatMessage.query.delete()
+        db.session.commit()
+
+        checkpoint = checkpoint_wal()
+        assert isinstance(checkpoint['database'], list)
+        vacuum = incremental_vacuum()
+        assert vacuum['auto_vacuum'] == 'incremental'
+        assert vacuum['pages_released'] > 0
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import passwords
+from services.passwords import (
+    MIN_COST, configure_password_hashing, current_method, max_scrypt_cost, password_needs_rehash, scrypt_memory
+)
+
+
+@pytest.fixture(autouse=True)
+def restore_settings(monkeypatch):
+    monkeypatch.setattr(passwords, '_settings', dict(passwords._settings))
+
+
+def _configure(**config):
+    configure_password_hashing(SimpleNamespace(config=config))
+
+
+def test_scrypt_cost_fits_the_memory_budget():
+    assert scrypt_memory(2 ** 15) == 32 * 2 ** 20
+    assert max_scrypt_cost(128 * 2 ** 20, workers=2) == 2 ** 16
+    assert max_scrypt_cost(128 * 2 ** 20, workers=4) == 2 ** 15
+
+
+def test_budget_below_the_minimum_cost_is_rejected():
+    with pytest.raises(ValueError, match='PASSWORD_HASH_MAX_MEMORY_MB'):
+        _configure(PASSWORD_HASH_METHOD='scrypt', PASSWORD_HASH_WORKERS=4, PASSWORD_HASH_MAX_MEMORY_MB=64)
+
+
+def test_explicit_cost_above_the_budget_is_rejected():
+    with pytest.raises(ValueError, match='PASSWORD_HASH_COST'):
+        _configure(PASSWORD_HASH_METHOD='scrypt', PASSWORD_HASH_COST=2 ** 17,
+                   PASSWORD_HASH_WORKERS=2, PASSWORD_HASH_MAX_MEMORY_MB=128)
+
+
+def test_calibration_runs_on_first_use_and_respects_the_budget(monkeypatch):
+    timed = []
+
+    def fake_time(method, cost):
+        timed.append(cost)
+        return 1.0  # rápido o bastante para qualquer custo
+
+    monkeypatch.setattr(passwords, '_time_hash', fake_time)
+    _configure(PASSWORD_HASH_METHOD='scrypt', PASSWORD_HASH_TARGET_MS=250,
+               PASSWORD_HASH_WORKERS=2, PASSWORD_HASH_MAX_MEMORY_MB=128)
+    assert timed == []
+
+    assert current_method() == 'scrypt:65536:8:1'
+    current_method()
+    assert timed == [MIN_COST['scrypt']]
+
+
+def test_hashes_above_the_budget_are_regenerated():
+    _configure(PASSWORD_HASH_METHOD='scrypt', PASSWORD_HASH_COST=2 ** 15,
+               PASSWORD_HASH_WORKERS=2, PASSWORD_HASH_MAX_MEMORY_MB=64)
+    assert password_needs_rehash('scrypt:131072:8:1$salt$hash')
+    assert not password_needs_rehash('scrypt:32768:8:1$salt$hash')
@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from services import profiling
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(profiling, '_slow_query_ms', 10 ** 6)
+    engine = create_engine('sqlite://')
+    event.listen(engine, 'before_cursor_execute', profiling._before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', profiling._after_cursor_execute)
+    event.listen(engine, 'handle_error', profiling._handle_error)
+    yield engine
+    engine.dispose()
+
+
+def test_successful_query_leaves_no_start_time(engine):
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        assert conn.info['query_started'] == []
+
+
+def test_failed_query_leaves_no_start_time(engine):
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM missing_table'))
+        assert conn.info['query_started'] == []
+        conn.execute(text('SELECT 1'))
+        assert conn.info['query_started'] == []
+
+
+def test_slow_query_is_logged(engine, monkeypatch, capsys):
+    monkeypatch.setattr(profiling, '_slow_query_ms', 0)
+    with engine.connect() as conn:
+        conn.execute(text('SELECT :value'), {'value': 1})
+    out = capsys.readouterr().out
+    assert '[slow-query]' in out
+    assert 'params (int)' in out
@@ -0,0 +1,186 @@
+"""Orçamento de consultas de todas as rotas dos blueprints (ver services.query_budget).
+
+Cada rota é chamada uma vez, em um banco novo com os dados de ``seeded``,
+do jeito descrito em ``REQUESTS``, e precisa responder 2xx dentro de
+``DEFAULT_BUDGET`` (ou da entrada de ``BUDGETS``). Uma rota nova sem entrada
+em ``REQUESTS`` falha. Há clientes, transações e mensagens em quantidade
+suficiente para um N+1 passar do orçamento.
+"""
+import time
+
+import pytest
+
+from database import db, ChatMessage, MessagePackage, Transaction, User
+from routes.auth import RESET_TOKEN_PREFIX
+from services.harness import harness_config, open_isolated
+from services.kv_store import get_store
+from services.profiling import save_profile
+from services.query_budget import Budget, QueryRecorder
+from services.question_mining import save_report
+
+from conftest import create_user, flask_app
+
+DEFAULT_BUDGET = Budget(queries=10, rows=500)
+# Exceções ao orçamento padrão (endpoint -> Budget)
+BUDGETS = {
+    'admin.export_users': Budget(queries=10, rows=None),  # exporta todos os clientes
+    'transactions.get_user_transactions': Budget(queries=10, rows=None),  # sem paginação
+    'user.get_users': Budget(queries=10, rows=None),  # lista todos os usuários
+    'user.import_users_csv': Budget(queries=10, rows=None),  # lê os usernames e emails existentes
+    'setup.check_setup': Budget(queries=10, rows=None),  # lista todos os usuários
+}
+CLIENTS = 15
+QUERY_ARGS = {'page': 1, 'per_page': 50}
+# Além do que services.harness desliga: o cache de respostas esconderia as consultas
+BUDGET_CONFIG = {'RESPONSE_CACHE_ENABLED': False}
+
+# Como cada rota é chamada: 'as' (anonymous, client ou admin), argumentos da rota além dos
+# de ``seeded`` e o corpo; valores entre chaves vêm de ``seeded``
+REQUESTS = {
+    'admin.add_user_balance': {'as': 'admin', 'json': {'messages': 1}},
+    'admin.bulk_update_users': {'as': 'admin', 'json': {
+        'filter': {'user_type': 'client'}, 'add_balance': 1, 'package_id': '{package_id}'
+    }},
+    'admin.download_profile': {'as': 'admin'},
+    'admin.export_users': {'as': 'admin'},
+    'admin.get_all_users': {'as': 'admin'},
+    'admin.get_dashboard_stats': {'as': 'admin'},
+    'admin.get_frequent_questions': {'as': 'admin'},
+    'admin.get_maintenance_status': {'as': 'admin'},
+    'admin.get_profiles': {'as': 'admin'},
+    'admin.get_recent_messages': {'as': 'admin'},
+    'admin.get_user_history': {'as': 'admin'},
+    'admin.stream_events': {'as': 'admin', 'headers': {'Last-Event-ID': '0'}},
+    'admin.toggle_user_status': {'as': 'admin'},
+    'auth.change_password': {'as': 'client', 'json': {'current_password': 'secret123', 'new_password': 'nova-senha'}},
+    'auth.forgot_password': {'as': 'anonymous', 'json': {'email': '{email}'}},
+    'auth.google_auth': {'as': 'anonymous', 'json': {
+        'google_token': 'token-google', 'email': 'google@example.com', 'name': 'Google', 'google_id': '1'
+    }},
+    'auth.reset_password': {'as': 'anonymous', 'json': {'token': '{reset_token}', 'new_password': 'nova-senha'}},
+    'auth.validate_reset_token': {'as': 'anonymous', 'json': {'token': '{reset_token}'}},
+    'chatbot.chat': {'as': 'client', 'json': {'question': 'Qual o prazo de entrega do pedido?'}},
+    'chatbot.get_all_chat_history': {'as': 'admin'},
+    'chatbot.get_chat_history': {'as': 'client'},
+    'chatbot.get_chat_message': {'as': 'client'},
+    'chatbot.get_chat_stats': {'as': 'client'},
+    'health.cors_test': {'as': 'anonymous'},
+    'health.health_check': {'as': 'anonymous'},
+    'health.liveness': {'as': 'anonymous'},
+    'health.ping': {'as': 'anonymous'},
+    'health.readiness': {'as': 'anonymous'},
+    'packages.create_package': {'as': 'admin', 'json': {'name': 'Pacote Teste', 'message_count': 5, 'price': 9.9}},
+    'packages.delete_package': {'as': 'admin'},
+    'packages.get_all_packages': {'as': 'admin'},
+    'packages.get_package': {'as': 'anonymous'},
+    'packages.get_packages': {'as': 'anonymous'},
+    'packages.update_package': {'as': 'admin', 'json': {'price': 12.5}},
+    'setup.check_setup': {'as': 'anonymous'},
+    'setup.create_admin': {'as': 'anonymous'},
+    'setup.reset_admin': {'as': 'anonymous'},
+    'transactions.admin_complete_transaction': {'as': 'admin'},
+    'transactions.cancel_transaction': {'as': 'client'},
+    'transactions.complete_transaction': {'as': 'client'},
+    'transactions.create_transaction': {'as': 'client', 'json': {'package_id': '{package_id}'}},
+    'transactions.get_all_transactions': {'as': 'admin'},
+    'transactions.get_user_transactions': {'as': 'client'},
+    'user.add_messages_to_user': {'as': 'admin', 'json': {'messages': 1}},
+    'user.create_user': {'as': 'admin', 'json': {'username': 'novo', 'email': 'novo@example.com', 'password': 'secret123'}},
+    'user.delete_user': {'as': 'admin', 'args': {'user_id': '{spare_id}'}},
+    'user.get_profile': {'as': 'client'},
+    'user.get_user': {'as': 'admin'},
+    'user.get_users': {'as': 'admin'},
+    'user.import_users_csv': {'as': 'admin', 'content_type': 'text/csv',
+                              'data': 'username,email,password\nimportado,importado@example.com,secret123\n'},
+    'user.login': {'as': 'anonymous', 'json': {'username': '{username}', 'password': 'secret123'}},
+    'user.logout': {'as': 'client'},
+    'user.register': {'as': 'anonymous', 'json': {'username': 'novo', 'email': 'novo@example.com', 'password': 'secret123'}},
+    'user.update_user': {'as': 'admin', 'json': {'message_balance': 20}},
+}
+
+ENDPOINTS = sorted({rule.endpoint for rule in flask_app.url_map.iter_rules() if '.' in rule.endpoint})
+
+
+@pytest.fixture
+def seeded(app, tmp_path, monkeypatch):
+    """Clientes com transação e mensagem, uma compra pendente, token de recuperação, relatório e perfil"""
+    monkeypatch.setitem(app.config, 'ANALYTICS_DIR', str(tmp_path / 'analytics'))
+    monkeypatch.setitem(app.config, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+    # O feed ao vivo entrega o repasse e encerra em vez de esperar novos eventos
+    monkeypatch.setitem(app.config, 'LIVE_FEED_MAX_DURATION', 0)
+
+    client_ids = [create_user(f'cliente{i}') for i in range(CLIENTS)]
+    spare_id = create_user('descartavel')
+    profile_id = '0' * 32
+    with app.app_context():
+        package = MessagePackage.query.filter_by(is_active=True).order_by(MessagePackage.id).first()
+        for user_id in client_ids:
+            db.session.add(Transaction(user_id=user_id, package_id=package.id, amount=package.price, status='completed'))
+            db.session.add(ChatMessage(user_id=user_id, question='Qual o prazo de entrega?', answer='Cinco dias úteis.'))
+        pending = Transaction(user_id=client_ids[0], package_id=package.id, amount=package.price, status='pending')
+        db.session.add(pending)
+        db.session.commit()
+
+        get_store().set(RESET_TOKEN_PREFIX + 'token-de-teste', {'user_id': client_ids[0]}, ttl=3600)
+        save_report({'generated_at': '2026-01-01T00:00:00', 'messages': CLIENTS, 'clusters': [
+            {'count': CLIENTS, 'examples': ['Qual o prazo de entrega?']}
+        ]})
+        save_profile(profile_id, 'main;handler 1\n', {'id': profile_id, 'created_at': time.time()})
+        return {
+            'admin_id': User.query.filter_by(username='admin').one().id,
+            'user_id': client_ids[0],
+            'spare_id': spare_id,
+            'username': 'cliente0',
+            'email': 'cliente0@example.com',
+            'package_id': package.id,
+            'transaction_id': pending.id,
+            'message_id': ChatMessage.query.filter_by(user_id=client_ids[0]).one().id,
+            'profile_id': profile_id,
+            'reset_token': 'token-de-teste',
+        }
+
+
+def _fill(value, seeded):
+    if isinstance(value, dict):
+        return {key: _fill(item, seeded) for key, item in value.items()}
+    if isinstance(value, str) and value.startswith('{') and value.endswith('}'):
+        return seeded[value[1:-1]]
+    return value
+
+
+def _client_as(app, role, seeded):
+    client = app.test_client()
+    if role != 'anonymous':
+        with client.session_transaction() as session:
+            session['user_id'] = seeded[f'{role}_id' if role == 'admin' else 'user_id']
+    return client
+
+
+def test_requests_match_routes():
+    assert set(REQUESTS) - set(ENDPOINTS) == set(), 'entradas de REQUESTS sem rota'
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_route_within_budget(app, seeded, endpoint):
+    assert endpoint in REQUESTS, f'{endpoint} sem requisição em REQUESTS'
+    spec = REQUESTS[endpoint]
+    rule = next(app.url_map.iter_rules(endpoint))
+    method = 'GET' if 'GET' in rule.methods else sorted(rule.methods - {'HEAD', 'OPTIONS'})[0]
+    values = {name: seeded[name] for name in rule.arguments}
+    values.update(_fill(spec.get('args', {}), seeded))
+    if method == 'GET':
+        values.update(QUERY_ARGS)
+    url = app.url_map.bind('localhost').build(endpoint, values, method=method)
+    options = {key: _fill(spec[key], seeded) for key in ('json', 'data', 'content_type', 'headers') if key in spec}
+    client = _client_as(app, spec['as'], seeded)
+
+    budget = BUDGETS.get(endpoint, DEFAULT_BUDGET)
+    with harness_config(app, lambda messages, **options: 'Resposta simulada.', BUDGET_CONFIG):
+        with QueryRecorder() as recorder:
+            response = open_isolated(app, client, url, method=method, **options)
+            body = response.get_data(as_text=True)
+    print(f"{method} {url} como {spec['as']}: {recorder.queries} consultas, {recorder.rows} linhas\n{recorder.report()}")
+
+    assert 200 <= response.status_code < 300, f'{method} {url} -> {response.status_code}: {body[:300]}'
+    problems = recorder.violations(budget)
+    assert not problems, f"{endpoint}: {', '.join(problems)}\n{recorder.report()}"
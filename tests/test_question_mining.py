@@ -0,0 +1,37 @@
+import pytest
+
+from database import db, ChatMessage
+from services.question_mining import mine_frequent_questions, save_report
+
+from conftest import create_user, login
+
+
+def _seed(app):
+    user_id = create_user('alice')
+    questions = ['Como comprar um pacote de mensagens?'] * 6 + ['Como recuperar minha senha?'] * 4
+    with app.app_context():
+        for question in questions:
+            db.session.add(ChatMessage(user_id=user_id, question=question, answer='r'))
+        db.session.commit()
+
+
+def test_report_is_served_after_mining(client, app, tmp_path, monkeypatch):
+    pytest.importorskip('numpy')
+    monkeypatch.setitem(app.config, 'ANALYTICS_DIR', str(tmp_path))
+    _seed(app)
+    with app.app_context():
+        report = mine_frequent_questions(clusters=2, batch_size=4, dimensions=256, echo=lambda message: None)
+        save_report(report)
+    assert report['messages'] == 10
+    assert sum(cluster['count'] for cluster in report['clusters']) == 10
+
+    login(client, 'admin', 'admin123')
+    response = client.get('/admin/analytics/frequent-questions?limit=1')
+    assert response.status_code == 200
+    assert len(response.get_json()['clusters']) == 1
+
+
+def test_missing_report_is_404(client, app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ANALYTICS_DIR', str(tmp_path))
+    login(client, 'admin', 'admin123')
+    assert client.get('/admin/analytics/frequent-questions').status_code == 404
@@ -0,0 +1,57 @@
+import pytest
+
+from services import rate_limit
+from services.rate_limit import _take_token
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: now[0])
+    with app.app_context():
+        yield now
+
+
+def test_burst_then_retry_after(clock):
+    for _ in range(3):
+        assert _take_token('bucket', rate=6, per=60, burst=3) == 0
+    # 6 por minuto: uma ficha a cada 10 segundos
+    assert _take_token('bucket', rate=6, per=60, burst=3) == pytest.approx(10)
+
+
+def test_tokens_refill_over_time(clock):
+    for _ in range(3):
+        _take_token('bucket', rate=6, per=60, burst=3)
+    clock[0] += 5
+    assert _take_token('bucket', rate=6, per=60, burst=3) == pytest.approx(5)
+    clock[0] += 5
+    assert _take_token('bucket', rate=6, per=60, burst=3) == 0
+
+
+def test_refill_is_capped_at_burst(clock):
+    _take_token('bucket', rate=6, per=60, burst=2)
+    clock[0] += 3600
+    assert _take_token('bucket', rate=6, per=60, burst=2) == 0
+    assert _take_token('bucket', rate=6, per=60, burst=2) == 0
+    assert _take_token('bucket', rate=6, per=60, burst=2) > 0
+
+
+def test_buckets_are_independent(clock):
+    assert _take_token('a', rate=1, per=60, burst=1) == 0
+    assert _take_token('a', rate=1, per=60, burst=1) > 0
+    assert _take_token('b', rate=1, per=60, burst=1) == 0
+
+
+def test_route_returns_429_with_retry_after(client):
+    # /login: burst de 5 por IP
+    for _ in range(5):
+        assert client.post('/login', json={'username': 'x', 'password': 'y'}).status_code == 401
+    response = client.post('/login', json={'username': 'x', 'password': 'y'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_disabled_limit_lets_everything_through(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', False)
+    for _ in range(10):
+        assert client.post('/login', json={'username': 'x', 'password': 'y'}).status_code == 401
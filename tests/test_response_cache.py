@@ -0,0 +1,87 @@
+from database import db, User, MessagePackage
+from services.response_cache import invalidate_namespace
+
+from conftest import create_user, login
+
+
+def test_etag_and_conditional_get(client):
+    first = client.get('/packages')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'public, max-age=60, must-revalidate'
+    etag = first.headers['ETag']
+    assert 'Content-Encoding' not in first.headers
+    assert not etag.startswith('W/')
+
+    second = client.get('/packages', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+
+
+def test_compressed_response_keeps_strong_etag(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 0)
+    plain_etag = client.get('/packages').headers['ETag']
+
+    first = client.get('/packages', headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['Content-Encoding'] == 'gzip'
+    etag = first.headers['ETag']
+    assert etag == plain_etag[:-1] + '-gzip"'
+
+    second = client.get('/packages', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+
+
+def test_generation_bump_refreshes_cached_body(client, app):
+    first = client.get('/packages')
+    with app.app_context():
+        # Alteração feita por fora das rotas, sem passar pelo commit da sessão
+        db.session.execute(db.text("UPDATE message_package SET name = 'Renomeado' WHERE id = 1"))
+        db.session.commit()
+    invalidate_namespace('packages')
+
+    second = client.get('/packages', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert 'Renomeado' in {package['name'] for package in second.get_json()}
+
+
+def test_commit_invalidates_namespace(client):
+    create_user('boss', user_type='admin')
+    login(client, 'boss')
+    etag = client.get('/packages').headers['ETag']
+
+    assert client.put('/packages/1', json={'name': 'Novo nome'}).status_code == 200
+    response = client.get('/packages', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Novo nome' in {package['name'] for package in response.get_json()}
+
+
+def test_rollback_keeps_cached_response(client, app):
+    etag = client.get('/packages').headers['ETag']
+    with app.app_context():
+        package = db.session.get(MessagePackage, 1)
+        package.name = 'Descartado'
+        db.session.flush()
+        db.session.rollback()
+    assert client.get('/packages', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_per_user_responses_are_private_and_invalidated_per_user(client, app):
+    user_id = create_user('alice')
+    create_user('bob')
+    login(client, 'alice')
+    first = client.get('/profile')
+    assert first.headers['Cache-Control'].startswith('private')
+    assert 'Cookie' in first.headers['Vary']
+
+    with app.app_context():
+        db.session.get(User, user_id).message_balance = 99
+        db.session.commit()
+    second = client.get('/profile', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.get_json()['message_balance'] == 99
+
+    other = app.test_client()
+    login(other, 'bob')
+    assert other.get('/profile').get_json()['username'] == 'bob'
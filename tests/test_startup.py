@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+import click
+from click.testing import CliRunner
+
+from services.startup import LazyCommand, PROJECT_ROOT
+
+CLI_ONLY_MODULES = ('services.profiling', 'services.question_mining', 'services.traffic_replay',
+                    'services.soak', 'services.benchmark', 'services.synthetic_data', 'services.query_budget')
+
+
+def test_cli_only_modules_are_not_imported_at_startup():
+    code = 'import sys, src.main; print("carregados:", [m for m in %r if m in sys.modules])' % (CLI_ONLY_MODULES,)
+    env = dict(os.environ, MAIL_SENDER_ENABLED='0', SCHEDULER_ENABLED='0')
+    result = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert 'carregados: []' in result.stdout.splitlines()
+
+
+@click.command('greet')
+@click.option('--name', default='mundo', help='Quem cumprimentar.')
+def greet_command(name):
+    """Cumprimentar alguém"""
+    click.echo(f'olá, {name}')
+
+
+def test_lazy_command_delegates_to_the_real_command():
+    command = LazyCommand('greet', f'{__name__}:greet_command')
+    assert command._command is None
+
+    runner = CliRunner()
+    assert runner.invoke(command, ['--name', 'ana']).output == 'olá, ana\n'
+    help_output = runner.invoke(command, ['--help']).output
+    assert 'Cumprimentar alguém' in help_output and '--name' in help_output
+    assert command.get_short_help_str() == 'Cumprimentar alguém'
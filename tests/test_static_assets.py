@@ -0,0 +1,37 @@
+import pytest
+
+from services.static_assets import HASHED_NAME, IMMUTABLE_CACHE, INDEX_CACHE, DEFAULT_CACHE, build_manifest
+
+
+@pytest.mark.parametrize('path', [
+    'assets/index-DXp3pH_h.js',
+    'assets/index-rSePIsla.css',
+    'assets/sensus-logo-BxmOMpT4.png',
+    'assets/vendor-Ab-d_9Xy.js',
+])
+def test_vite_hashed_assets(path):
+    assert HASHED_NAME.match(path)
+
+
+@pytest.mark.parametrize('path', [
+    'apple-touch-icon.png',
+    'assets/apple-touch-icon.png',
+    'favicon-32x32.png',
+    'assets/index-DXp3pH_hx.js',
+    'assets/index.js',
+    'images/logo-BxmOMpT4.png',
+])
+def test_other_files_are_not_immutable(path):
+    assert not HASHED_NAME.match(path)
+
+
+def test_manifest_cache_headers(tmp_path):
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'index.html').write_text('<html></html>')
+    (tmp_path / 'apple-touch-icon.png').write_bytes(b'png')
+    (tmp_path / 'assets' / 'index-DXp3pH_h.js').write_text('console.log(1)')
+
+    manifest = build_manifest(str(tmp_path))
+    assert manifest['index.html'].cache_control == INDEX_CACHE
+    assert manifest['apple-touch-icon.png'].cache_control == DEFAULT_CACHE
+    assert manifest['assets/index-DXp3pH_h.js'].cache_control == IMMUTABLE_CACHE